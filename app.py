@@ -1,17 +1,24 @@
 # app.py
 
 import os
+import gc
 import json
 import pickle
 import time
 import sys
-from flask import Flask, render_template, request, url_for, redirect
+import threading
+import itertools
+from collections import namedtuple
+from flask import Flask, Response, g, render_template, request, url_for, redirect, jsonify
 
 # --- Assuming your A1 files are accessible ---
 try:
-    from preprocessor import Preprocessor
+    from preprocessor import Preprocessor, ensure_nltk_resources
     from indexer import Indexer
     from search import SearchEngine
+    from mmap_index import is_mmap_index_file, load_mmap_index
+    from query_cache import QueryResultCache
+    from metrics import MetricsRegistry, SearchMetrics
 except ImportError as e:
     print(f"Error importing assignment 1 modules: {e}")
     print("Make sure preprocessor.py, indexer.py, and search.py are in the same directory or accessible via PYTHONPATH.")
@@ -19,30 +26,90 @@ except ImportError as e:
 
 # --- Configuration ---
 INDEX_DIR = 'image_index_data' # Directory where index files are stored
-INDEX_COMPONENTS_FILE = os.path.join(INDEX_DIR, 'index_components.pkl')
+INDEX_FILE = os.path.join(INDEX_DIR, 'index.bin') # Memory-mapped binary index
+INDEX_COMPONENTS_FILE = os.path.join(INDEX_DIR, 'index_components.pkl') # Legacy pickle index
 DOC_ID_MAP_FILE = os.path.join(INDEX_DIR, 'doc_id_map.json')
+# Keep per-posting VSM weights in memory (faster VSM queries). Set to False to
+# derive them from term frequencies at query time and roughly halve the index.
+PRECOMPUTE_VSM_WEIGHTS = True
+# Move a pickled index into flat arrays after loading, so gunicorn workers
+# forked from a --preload master keep sharing its memory (the binary index is
+# memory-mapped and always shared). Makes document lookups binary searches.
+FREEZE_PICKLED_INDEX = True
+QUERY_CACHE_SIZE = 1024 # Maximum number of cached result lists
+QUERY_CACHE_TTL_SECONDS = 300 # How long cached results stay valid
+SEARCH_MODELS = ('vsm', 'bm25', 'lm_dirichlet')
+API_DEFAULT_PER_PAGE = 20 # Results per page in the JSON API
+API_MAX_PER_PAGE = 100
+API_MAX_RESULTS = 1000 # Deepest result the JSON API pages into
+API_MAX_BATCH_QUERIES = 100 # Queries accepted in one batch request
+INDEX_RELOAD_INTERVAL_SECONDS = 30 # How often to look for a rebuilt index on disk (0 disables hot reload)
+# Per-stage search timings, request latencies and cache counters served at
+# /metrics (Prometheus text format). Values are per process.
+METRICS_ENABLED = True
 
 # --- Initialize Flask App ---
 app = Flask(__name__) # Standard Flask app initialization
 
 # --- Global Variables to hold loaded index data ---
-search_engine = None
-doc_id_map = None
+# The search engine, ID map and version are swapped together as one object
+# when a new index is loaded. Each request reads current_index once and uses
+# that snapshot throughout, so in-flight requests finish on the old index,
+# which is freed once the last of them is done.
+# generation increases with every load (version identifies the files on
+# disk and can't be ordered); the query cache uses it to tell a newer index
+# from an older one still serving in-flight requests.
+LoadedIndex = namedtuple('LoadedIndex', ['search_engine', 'doc_id_map', 'version', 'generation'])
+index_generations = itertools.count(1)
+current_index = None
+reload_lock = threading.Lock()
+reload_thread_pid = None # Process the reload thread runs in (threads don't survive a fork)
+query_cache = QueryResultCache(max_entries=QUERY_CACHE_SIZE, ttl_seconds=QUERY_CACHE_TTL_SECONDS)
+
+# --- Metrics ---
+metrics_registry = MetricsRegistry()
+search_metrics = SearchMetrics(metrics_registry) if METRICS_ENABLED else None
+request_seconds = metrics_registry.histogram(
+    'http_request_duration_seconds', 'Time to handle an HTTP request', ('endpoint',))
+QUERY_CACHE_COUNTERS = ('hits', 'misses', 'evictions', 'invalidations', 'stale')
+metrics_registry.callback(
+    'query_cache_events_total', 'Query result cache lookups and removals', 'counter', ('event',),
+    lambda: {(event,): value for event, value in query_cache.stats().items() if event in QUERY_CACHE_COUNTERS})
+metrics_registry.callback(
+    'query_cache_entries', 'Result lists in the query cache', 'gauge', (),
+    lambda: {(): query_cache.stats()['size']})
+metrics_registry.callback(
+    'stem_cache_events_total', 'Stem cache lookups of the query preprocessor', 'counter', ('event',),
+    lambda: {} if current_index is None else {
+        (event,): value for event, value in current_index.search_engine.preprocessor.cache_stats().items()
+        if event in ('hits', 'misses')})
 
 # --- Load Index Data ONCE at Startup ---
-def load_index_data(index_file, map_file):
+def load_index_data(index_file, map_file, preprocessor=None):
     """Loads the index data structures and ID map."""
     print(f"Loading index components from {index_file}...")
-    try:
-        with open(index_file, 'rb') as f:
-            loaded_index_data = pickle.load(f)
-        print("Index components loaded.")
-    except FileNotFoundError:
-        print(f"Error: Index components file not found at {index_file}")
-        return None, None
-    except Exception as e:
-        print(f"Error loading index components: {e}")
-        return None, None
+    if preprocessor is None:
+        preprocessor = Preprocessor() # Preprocessor is needed for SearchEngine
+    if is_mmap_index_file(index_file):
+        # Binary index: mapped read-only, nothing to deserialize or rebuild
+        try:
+            mapped_indexer = load_mmap_index(index_file, preprocessor)
+            print("Index file mapped.")
+        except Exception as e:
+            print(f"Error mapping index file: {e}")
+            return None, None
+    else:
+        try:
+            with open(index_file, 'rb') as f:
+                loaded_index_data = pickle.load(f)
+            print("Index components loaded.")
+        except FileNotFoundError:
+            print(f"Error: Index components file not found at {index_file}")
+            return None, None
+        except Exception as e:
+            print(f"Error loading index components: {e}")
+            return None, None
+        mapped_indexer = None
 
     print(f"Loading document ID mapping from {map_file}...")
     try:
@@ -58,39 +125,141 @@ def load_index_data(index_file, map_file):
         print(f"Error loading mapping file: {e}")
         return None, None
 
+    if mapped_indexer is not None:
+        loaded_search_engine = SearchEngine(mapped_indexer, preprocessor, metrics=search_metrics)
+        print("SearchEngine initialized successfully.")
+        return loaded_search_engine, loaded_doc_id_map
+
     # Reconstruct the Indexer object and create SearchEngine
     try:
         print("Reconstructing indexer and initializing SearchEngine...")
-        preprocessor = Preprocessor() # Preprocessor is needed for SearchEngine
-        reconstructed_indexer = Indexer(preprocessor)
+        reconstructed_indexer = Indexer(preprocessor, precompute_vsm_weights=PRECOMPUTE_VSM_WEIGHTS)
 
         # Populate the reconstructed indexer with loaded data
         reconstructed_indexer.inverted_index = loaded_index_data['inverted_index']
         reconstructed_indexer.document_lengths = loaded_index_data['document_lengths']
         reconstructed_indexer.doc_count = loaded_index_data['doc_count']
         reconstructed_indexer.avg_doc_length = loaded_index_data['avg_doc_length']
-        reconstructed_indexer.document_vectors = loaded_index_data['document_vectors']
         reconstructed_indexer.document_norms = loaded_index_data['document_norms']
+        reconstructed_indexer.compute_search_statistics() # Query-time statistics for the models
+        if FREEZE_PICKLED_INDEX:
+            reconstructed_indexer.freeze()
 
         # Create the search engine instance
-        loaded_search_engine = SearchEngine(reconstructed_indexer, preprocessor)
+        loaded_search_engine = SearchEngine(reconstructed_indexer, preprocessor, metrics=search_metrics)
         print("SearchEngine initialized successfully.")
         return loaded_search_engine, loaded_doc_id_map
     except Exception as e:
         print(f"Error reconstructing indexer object or initializing SearchEngine: {e}")
         return None, None
 
+def find_index_file():
+    """Prefer the binary index; fall back to the legacy pickle if it hasn't been built."""
+    return INDEX_FILE if os.path.exists(INDEX_FILE) else INDEX_COMPONENTS_FILE
+
+def get_index_version(index_file, map_file):
+    """Identifies the index on disk; changes whenever the index or ID map is rewritten."""
+    version = []
+    for path in (index_file, map_file):
+        stat = os.stat(path)
+        version.append((os.path.abspath(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+def load_current_index(preprocessor=None):
+    """Loads the index on disk into a LoadedIndex, or returns None if it can't be loaded."""
+    index_file = find_index_file()
+    try:
+        # Read the version first: if the files change while loading, the
+        # next check sees a newer version and loads again
+        version = get_index_version(index_file, DOC_ID_MAP_FILE)
+    except OSError as e:
+        print(f"Error reading index files: {e}")
+        return None
+    loaded_search_engine, loaded_doc_id_map = load_index_data(index_file, DOC_ID_MAP_FILE, preprocessor)
+    if not loaded_search_engine or not loaded_doc_id_map:
+        return None
+    return LoadedIndex(loaded_search_engine, loaded_doc_id_map, version, next(index_generations))
+
+def reload_index_if_changed():
+    """
+    Loads the index on disk if it differs from the one being served and swaps
+    it in. Requests keep being served from the current index while loading,
+    and the current index is kept if the new one fails to load.
+    Returns True if a new index was swapped in.
+    """
+    global current_index
+    with reload_lock:
+        try:
+            disk_version = get_index_version(find_index_file(), DOC_ID_MAP_FILE)
+        except OSError:
+            return False # Files are being replaced; try again later
+        if disk_version == current_index.version:
+            return False
+        print("New index detected on disk, loading it in the background...")
+        # Reuse the preprocessor so its stem cache stays warm
+        new_index = load_current_index(current_index.search_engine.preprocessor)
+        if new_index is None:
+            print("Could not load the new index; still serving the current one.")
+            return False
+        current_index = new_index
+        print("Switched to the new index.")
+        return True
+
+def watch_index_files():
+    """Background loop that hot-reloads the index once its files stop changing."""
+    last_seen = current_index.version
+    while True:
+        time.sleep(INDEX_RELOAD_INTERVAL_SECONDS)
+        try:
+            disk_version = get_index_version(find_index_file(), DOC_ID_MAP_FILE)
+        except OSError:
+            continue
+        # The index and ID map are written one after the other: only reload
+        # once both have been unchanged for a full interval
+        if disk_version == last_seen and disk_version != current_index.version:
+            try:
+                reload_index_if_changed()
+            except Exception as e:
+                print(f"Error reloading index: {e}")
+        last_seen = disk_version
+
+@app.before_request
+def start_index_watcher():
+    """Starts the reload thread in each serving process (threads are not inherited by forked workers)."""
+    global reload_thread_pid
+    if INDEX_RELOAD_INTERVAL_SECONDS <= 0 or reload_thread_pid == os.getpid():
+        return
+    with reload_lock:
+        if reload_thread_pid != os.getpid():
+            reload_thread_pid = os.getpid()
+            threading.Thread(target=watch_index_files, name='index-reloader', daemon=True).start()
+
+@app.before_request
+def start_request_timer():
+    if METRICS_ENABLED:
+        g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    if METRICS_ENABLED and 'request_start' in g:
+        request_seconds.observe((request.endpoint or 'unknown',), time.perf_counter() - g.request_start)
+    return response
+
 # --- Load the data when the Flask app starts ---
 print("="*30)
 print("Attempting to load search index...")
-search_engine, doc_id_map = load_index_data(INDEX_COMPONENTS_FILE, DOC_ID_MAP_FILE)
-if not search_engine or not doc_id_map:
+ensure_nltk_resources() # Once, before any worker is forked or any request is served
+current_index = load_current_index()
+if current_index is None:
     print("FATAL: Could not load index data. Please ensure index files exist in:")
-    print(f"  {INDEX_COMPONENTS_FILE}")
+    print(f"  {INDEX_FILE} (or {INDEX_COMPONENTS_FILE})")
     print(f"  {DOC_ID_MAP_FILE}")
     print("You may need to run the index building script first.")
     sys.exit(1) # Exit if index cannot be loaded
 print("Index loaded successfully.")
+# Everything loaded so far lives as long as the process: keep the garbage
+# collector from scanning it (and dirtying pages shared with forked workers)
+gc.freeze()
 print("="*30)
 
 
@@ -125,19 +294,36 @@ def search():
     if search_performed:
         print(f"Received search request: query='{query}', model='{model}'")
         start_time = time.time()
+        loaded = current_index # One index for the whole request, even if a reload happens
+        search_engine, doc_id_map = loaded.search_engine, loaded.doc_id_map
         try:
-            if model == 'vsm':
-                results = search_engine.search_vsm(query, top_k=top_k)
-            elif model == 'bm25':
-                results = search_engine.search_bm25(query, top_k=top_k)
-            elif model == 'lm_dirichlet':
-                results = search_engine.search_lm_dirichlet(query, top_k=top_k)
+            # Repeated queries are served from the cache (keyed on the normalized terms)
+            query_terms = search_engine.preprocessor.preprocess(query)
+            cache_key = QueryResultCache.make_key(query_terms, model, top_k=top_k)
+            results = query_cache.get(loaded.generation, cache_key)
+            cache_lookup_seconds = time.time() - start_time
+            if results is None:
+                results = []
+                if model == 'vsm':
+                    results = search_engine.search_vsm(query, top_k=top_k)
+                elif model == 'bm25':
+                    results = search_engine.search_bm25(query, top_k=top_k)
+                elif model == 'lm_dirichlet':
+                    results = search_engine.search_lm_dirichlet(query, top_k=top_k)
+                else:
+                    print(f"Warning: Unknown model '{model}' requested.")
+                    # Optionally, add an error message to pass to the template
+                if model in SEARCH_MODELS:
+                    query_cache.put(loaded.generation, cache_key, results)
             else:
-                print(f"Warning: Unknown model '{model}' requested.")
-                # Optionally, add an error message to pass to the template
+                print("Served from query cache.")
 
             end_time = time.time()
             print(f"Search completed in {end_time - start_time:.4f} seconds, found {len(results)} raw results.")
+            if search_metrics is not None and model in SEARCH_MODELS:
+                # Preprocessing and the cache lookup (the search itself times its own stages)
+                search_metrics.stage_seconds.observe((model, 'cache_lookup'), cache_lookup_seconds)
+                format_start = time.perf_counter()
 
             # Format results using the doc_id_map
             for rank, (doc_id, score) in enumerate(results, 1):
@@ -152,6 +338,8 @@ def search():
                     })
                 else:
                     print(f"Warning: Could not find metadata for doc_id {doc_id}")
+            if search_metrics is not None and model in SEARCH_MODELS:
+                search_metrics.stage_seconds.observe((model, 'format'), time.perf_counter() - format_start)
 
         except Exception as e:
             print(f"Error during search execution for query '{query}' model '{model}': {e}")
@@ -168,6 +356,158 @@ def search():
     )
 
 
+@app.route('/cache/stats')
+def cache_stats():
+    """Returns query cache hit/miss counters as JSON, for sizing the cache."""
+    return jsonify(query_cache.stats())
+
+
+@app.route('/metrics')
+def metrics():
+    """Serves search stage timings, request latencies and cache counters for Prometheus."""
+    if not METRICS_ENABLED:
+        return Response("Metrics are disabled\n", status=404, mimetype='text/plain')
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+# --- JSON API ---
+
+class ApiError(ValueError):
+    """A malformed API request; reported to the client as HTTP 400."""
+
+
+@app.errorhandler(ApiError)
+def handle_api_error(e):
+    return jsonify({'error': str(e)}), 400
+
+
+def parse_api_int(params, name, default, from_json):
+    """
+    Reads an integer API parameter. Query string values are strings to
+    convert; JSON values must already be integers (not 1.9, true or "3").
+    """
+    value = params.get(name, default)
+    if from_json:
+        # bool is a subclass of int
+        if type(value) is not int:
+            raise ApiError("'page' and 'per_page' must be integers")
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ApiError("'page' and 'per_page' must be integers")
+
+
+def parse_api_query(params, default_model='bm25', from_json=False):
+    """
+    Validates one API query (dict of parameters) and returns (query, model, page, per_page).
+    from_json is True for the parameters of a JSON body, False for a query string.
+    """
+    query = params.get('query', '')
+    model = params.get('model', default_model)
+    if not isinstance(query, str) or not query.strip():
+        raise ApiError("'query' must be a non-empty string")
+    if not isinstance(model, str) or model not in SEARCH_MODELS:
+        raise ApiError(f"'model' must be one of {', '.join(SEARCH_MODELS)}")
+    page = parse_api_int(params, 'page', 1, from_json)
+    per_page = parse_api_int(params, 'per_page', API_DEFAULT_PER_PAGE, from_json)
+    if page < 1 or not 1 <= per_page <= API_MAX_PER_PAGE:
+        raise ApiError(f"'page' must be >= 1 and 'per_page' between 1 and {API_MAX_PER_PAGE}")
+    if page * per_page > API_MAX_RESULTS:
+        raise ApiError(f"Only the first {API_MAX_RESULTS} results can be paged through")
+    return query, model, page, per_page
+
+
+def format_api_response(query, model, page, per_page, results, doc_id_map):
+    """Builds the compact JSON response for one page of raw (doc_id, score) results."""
+    start = (page - 1) * per_page
+    page_results = []
+    for rank, (doc_id, score) in enumerate(results[start:start + per_page], start + 1):
+        metadata = doc_id_map.get(doc_id, {})
+        page_results.append({
+            'rank': rank,
+            'doc_id': doc_id,
+            'score': score,
+            'image_url': metadata.get('image_url'),
+            'source_page': metadata.get('source_page'),
+        })
+    return {
+        'query': query,
+        'model': model,
+        'page': page,
+        'per_page': per_page,
+        # One extra result is always fetched to tell whether another page exists
+        'has_more': len(results) > start + per_page,
+        'results': page_results,
+    }
+
+
+def run_api_queries(parsed_queries, loaded):
+    """
+    Scores parsed API queries against a LoadedIndex, serving what it can
+    from the query cache. The remaining queries are scored together in one
+    SearchEngine batch, so terms they share are only scored once.
+    """
+    search_engine = loaded.search_engine
+    results = [None] * len(parsed_queries)
+    cache_keys = []
+    misses = []
+    for i, (query, model, page, per_page) in enumerate(parsed_queries):
+        top_k = page * per_page + 1
+        query_terms = search_engine.preprocessor.preprocess(query)
+        cache_key = QueryResultCache.make_key(query_terms, model, top_k=top_k)
+        cache_keys.append(cache_key)
+        results[i] = query_cache.get(loaded.generation, cache_key)
+        if results[i] is None:
+            misses.append((i, (query, model, top_k)))
+
+    if misses:
+        batch_results = search_engine.search_batch([request for _, request in misses])
+        for (i, _), query_results in zip(misses, batch_results):
+            results[i] = query_results
+            query_cache.put(loaded.generation, cache_keys[i], query_results)
+    return results
+
+
+@app.route('/api/search')
+def api_search():
+    """
+    JSON search for a single query.
+    Parameters (GET): query, model (default bm25), page (default 1), per_page.
+    """
+    query, model, page, per_page = parse_api_query(request.args)
+    loaded = current_index
+    results = run_api_queries([(query, model, page, per_page)], loaded)[0]
+    return jsonify(format_api_response(query, model, page, per_page, results, loaded.doc_id_map))
+
+
+@app.route('/api/search/batch', methods=['POST'])
+def api_search_batch():
+    """
+    JSON search for many queries at once.
+    Body: {"model": default model, "queries": [{"query", "model", "page", "per_page"}, ...]}
+    Returns {"responses": [...]} with one response per query, in order.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('queries'), list):
+        raise ApiError("Request body must be a JSON object with a 'queries' list")
+    if len(body['queries']) > API_MAX_BATCH_QUERIES:
+        raise ApiError(f"At most {API_MAX_BATCH_QUERIES} queries per batch")
+    default_model = body.get('model', 'bm25')
+    parsed_queries = []
+    for params in body['queries']:
+        if not isinstance(params, dict):
+            raise ApiError("Each query must be a JSON object")
+        parsed_queries.append(parse_api_query(params, default_model, from_json=True))
+
+    loaded = current_index
+    all_results = run_api_queries(parsed_queries, loaded)
+    return jsonify({'responses': [
+        format_api_response(query, model, page, per_page, results, loaded.doc_id_map)
+        for (query, model, page, per_page), results in zip(parsed_queries, all_results)
+    ]})
+
+
 # --- Run the Flask App ---
 if __name__ == '__main__':
     # debug=True automatically restarts the server when you save changes
@@ -0,0 +1,216 @@
+# asgi.py
+#
+# asyncio serving entry point, alongside wsgi.py. The event loop only does
+# I/O: each request is handled by the Flask app on a bounded thread pool, so
+# a slow search never blocks the loop or other connections.
+#
+#   uvicorn asgi:app --port 5001
+#
+# Backpressure: at most MAX_CONCURRENT_REQUESTS requests run at once, at most
+# MAX_QUEUED_REQUESTS wait for a thread, and anything beyond that is
+# rejected straight away with 503. Every request has a deadline (504 when
+# exceeded). A request still waiting for a thread when it times out or its
+# client disconnects is dropped without being run; one already running
+# keeps its thread until it finishes (Python threads can't be interrupted),
+# and that thread is only then handed to the next request.
+
+import asyncio
+import io
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app
+
+MAX_CONCURRENT_REQUESTS = 4 # Requests handled by worker threads at once
+MAX_QUEUED_REQUESTS = 32 # Requests waiting for a worker thread before new ones get a 503
+REQUEST_TIMEOUT_SECONDS = 10 # Deadline for waiting plus handling a request
+MAX_REQUEST_BODY_BYTES = 1024 * 1024 # Larger bodies get a 413
+
+
+class AsyncSearchApp:
+    def __init__(self, wsgi_app, max_concurrent=MAX_CONCURRENT_REQUESTS, max_queued=MAX_QUEUED_REQUESTS,
+                 timeout_seconds=REQUEST_TIMEOUT_SECONDS):
+        """
+        Wrap a WSGI app as an ASGI app that runs it on a bounded thread pool.
+
+        Args:
+            wsgi_app: The WSGI application (the Flask app)
+            max_concurrent (int): Worker threads, i.e. requests handled at once
+            max_queued (int): Requests allowed to wait for a worker thread
+            timeout_seconds (float): Deadline for each request
+        """
+        self.wsgi_app = wsgi_app
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.timeout_seconds = timeout_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='search')
+        self.slots = None # asyncio.Semaphore, created on the serving loop
+        self.admitted = 0 # Requests waiting for or holding a worker thread
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._handle_http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _handle_http(self, scope, receive, send):
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_concurrent)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout_seconds
+
+        body = await self._read_body(receive)
+        if body is None:
+            await self._send_error(send, 413, "Request body too large")
+            return
+
+        # Reject rather than queue without bound
+        if self.admitted >= self.max_concurrent + self.max_queued:
+            self.rejected += 1
+            await self._send_error(send, 503, "Server busy, try again later", {'retry-after': '1'})
+            return
+
+        # Admitted until its thread finishes, or until it gives up waiting for one
+        self.admitted += 1
+        admission = {'open': True, 'running': False}
+
+        def end_admission(_=None):
+            if admission['open']:
+                admission['open'] = False
+                self.admitted -= 1
+
+        handler = asyncio.ensure_future(self._run_when_slot_free(scope, body, deadline, admission, end_admission))
+        handler.add_done_callback(lambda _: admission['running'] or end_admission())
+        disconnect = asyncio.ensure_future(self._wait_for_disconnect(receive))
+        try:
+            done, _ = await asyncio.wait({handler, disconnect}, timeout=max(deadline - loop.time(), 0),
+                                         return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnect.cancel()
+        if handler not in done:
+            handler.cancel() # Leaves the queue if still waiting for a thread
+            if disconnect not in done:
+                self.timed_out += 1
+                await self._send_error(send, 504, "Request timed out")
+            return
+        try:
+            status, headers, response_body = handler.result()
+        except asyncio.TimeoutError: # Got a thread only after the deadline
+            self.timed_out += 1
+            await self._send_error(send, 504, "Request timed out")
+            return
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': response_body})
+
+    async def _run_when_slot_free(self, scope, body, deadline, admission, end_admission):
+        await self.slots.acquire()
+        loop = asyncio.get_running_loop()
+        if loop.time() >= deadline:
+            self.slots.release()
+            raise asyncio.TimeoutError
+        future = loop.run_in_executor(self.executor, self._call_wsgi, self._make_environ(scope, body))
+        admission['running'] = True
+
+        def thread_done(_):
+            # The slot is freed when the thread is, not when the request gives up
+            self.slots.release()
+            end_admission()
+
+        future.add_done_callback(thread_done)
+        return await asyncio.shield(future)
+
+    async def _read_body(self, receive):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return b''.join(chunks)
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_REQUEST_BODY_BYTES:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    @staticmethod
+    async def _wait_for_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    @staticmethod
+    async def _send_error(send, status, message, extra_headers=None):
+        body = json.dumps({'error': message}).encode('utf-8')
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        headers.extend((name.encode(), value.encode()) for name, value in (extra_headers or {}).items())
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    def _make_environ(scope, body):
+        """Builds the WSGI environ of an ASGI HTTP request."""
+        server_name, server_port = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server_name,
+            'SERVER_PORT': str(server_port),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = 'HTTP_' + name
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    def _call_wsgi(self, environ):
+        """Runs the WSGI app in a worker thread; returns (status, headers, body) for ASGI."""
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            response[:] = [int(status.split(' ', 1)[0]), headers]
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        status, headers = response
+        return status, [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers], body
+
+
+app = AsyncSearchApp(flask_app)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, port=5001)
@@ -0,0 +1,60 @@
+# benchmarks/bench_finalize.py
+#
+# Times Indexer.finalize_index on synthetic corpora of increasing size to
+# check that it scales linearly with the number of postings.
+#
+# Usage: python benchmarks/bench_finalize.py [--sizes 1000 2000 ...] [--vocabulary 20000]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from indexer import Indexer
+
+DEFAULT_SIZES = [1_000, 2_000, 5_000, 10_000, 20_000, 50_000]
+
+
+class WhitespacePreprocessor:
+    """Splits on whitespace only, so the timings cover indexing rather than NLTK."""
+
+    def preprocess(self, text):
+        return text.split()
+
+
+def build_unfinalized_index(num_docs, vocabulary_size, seed=42):
+    """Index num_docs synthetic documents with a Zipfian term distribution."""
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(vocabulary_size)]
+    weights = [1 / (rank + 1) for rank in range(vocabulary_size)]
+    indexer = Indexer(WhitespacePreprocessor())
+    for doc_id in range(num_docs):
+        length = rng.randint(20, 120)
+        indexer.add_document(doc_id, ' '.join(rng.choices(vocabulary, weights, k=length)))
+    return indexer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Indexer.finalize_index scaling.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Corpus sizes (documents)")
+    parser.add_argument('--vocabulary', type=int, default=20_000, help="Synthetic vocabulary size")
+    args = parser.parse_args()
+
+    print(f"{'documents':>10} {'terms':>8} {'postings':>10} {'finalize (s)':>13} {'us/posting':>11}")
+    for num_docs in args.sizes:
+        indexer = build_unfinalized_index(num_docs, args.vocabulary)
+        num_postings = sum(len(postings) for postings in indexer.inverted_index.values())
+
+        start = time.perf_counter()
+        indexer.finalize_index()
+        elapsed = time.perf_counter() - start
+
+        print(f"{num_docs:>10,} {len(indexer.inverted_index):>8,} {num_postings:>10,} "
+              f"{elapsed:>13.3f} {elapsed / num_postings * 1e6:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
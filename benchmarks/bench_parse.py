@@ -0,0 +1,167 @@
+# benchmarks/bench_parse.py
+#
+# Checks and times the two backends of crawler.parse_page: 'soup' (a full
+# BeautifulSoup tree) and 'fast' (page_extractor). Every page is parsed with
+# both and the results must be identical, including the order of the links;
+# the saved pages in --pages-dir must also match the golden file recorded
+# from the soup backend (links are stored sorted there, since the order of
+# a set changes between processes). Then both backends are timed over the
+# saved pages and --articles synthetic pages from fake_wiki.py. Exits with
+# status 1 if any page differs. tests/test_parse_page.py runs the same checks
+# on the saved pages under pytest.
+#
+# Usage:
+#   python benchmarks/bench_parse.py [--articles 2000] [--repeat 3] [--output results.json]
+#   python benchmarks/bench_parse.py --pages-dir saved_pages --write-golden   (record saved_pages/golden.json)
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import crawler
+from fake_wiki import CATEGORIES, FakeWiki
+
+BACKENDS = ('soup', 'fast')
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+GOLDEN_FILE_NAME = 'golden.json'
+
+
+def parse(html_content, page_url, backend):
+    """parse_page with the given backend, without its progress output."""
+    crawler.PARSER_BACKEND = backend
+    with contextlib.redirect_stdout(io.StringIO()):
+        return crawler.parse_page(html_content, page_url)
+
+
+def load_saved_pages(pages_dir):
+    """
+    Returns:
+        list: (name, page URL, HTML) of every .html file in pages_dir, by name
+    """
+    pages = []
+    for path in sorted(glob.glob(os.path.join(pages_dir, '*.html'))):
+        name = os.path.basename(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            pages.append((name, f"{crawler.BASE_URL}/wiki/{name[:-len('.html')]}", f.read()))
+    return pages
+
+
+def synthetic_pages(num_articles, seed=42):
+    wiki = FakeWiki(num_articles, seed)
+    pages = [(f"Category:{name}", f"{crawler.BASE_URL}/wiki/Category:{name}", wiki.category_page(number))
+             for number, name in enumerate(CATEGORIES)]
+    pages.extend((title, f"{crawler.BASE_URL}/wiki/{title}", wiki.article_page(number))
+                 for number, title in enumerate(wiki.titles))
+    return pages
+
+
+def golden_record(images, links):
+    return {'images_found': images, 'links_to_follow': sorted(links)}
+
+
+def check_backends(pages):
+    """
+    Returns:
+        list: Names of the pages on which the backends disagree
+    """
+    return [name for name, page_url, html_content in pages
+            if parse(html_content, page_url, 'fast') != parse(html_content, page_url, 'soup')]
+
+
+def check_golden(pages, golden):
+    """
+    Returns:
+        list: Names of the pages whose fast-backend result differs from the golden file (or is not in it)
+    """
+    return [name for name, page_url, html_content in pages
+            if golden.get(name) != golden_record(*parse(html_content, page_url, 'fast'))]
+
+
+def time_backend(pages, backend, repeat):
+    """
+    Returns:
+        dict: Best-of-repeat time over all pages, per page and as throughput
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for name, page_url, html_content in pages:
+            parse(html_content, page_url, backend)
+        best = min(best, time.perf_counter() - start)
+    total_bytes = sum(len(html_content.encode('utf-8')) for _, _, html_content in pages)
+    return {
+        'seconds': best,
+        'ms_per_page': best * 1000 / len(pages),
+        'pages_per_second': len(pages) / best,
+        'mb_per_second': total_bytes / 1e6 / best,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark the parse_page backends.")
+    parser.add_argument('--pages-dir', default=PAGES_DIR, help="Directory of saved .html pages and their golden file")
+    parser.add_argument('--write-golden', action='store_true',
+                        help="Record the soup backend's results for the saved pages as the golden file")
+    parser.add_argument('--articles', type=int, default=2000, help="Synthetic article pages to add (0 for none)")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed of the synthetic wiki")
+    parser.add_argument('--repeat', type=int, default=3, help="Timing runs per backend (the best is reported)")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    saved_pages = load_saved_pages(args.pages_dir)
+    golden_file = os.path.join(args.pages_dir, GOLDEN_FILE_NAME)
+    if args.write_golden:
+        golden = {name: golden_record(*parse(html_content, page_url, 'soup'))
+                  for name, page_url, html_content in saved_pages}
+        with open(golden_file, 'w', encoding='utf-8') as f:
+            json.dump(golden, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"Golden results for {len(golden)} pages written to {golden_file}")
+        return
+
+    pages = saved_pages + (synthetic_pages(args.articles, args.seed) if args.articles else [])
+    if not pages:
+        print(f"No pages: {args.pages_dir} has no .html files and --articles is 0")
+        sys.exit(1)
+
+    mismatches = check_backends(pages)
+    print(f"Backends agree on {len(pages) - len(mismatches)} of {len(pages)} pages")
+    if os.path.exists(golden_file):
+        with open(golden_file, 'r', encoding='utf-8') as f:
+            golden = json.load(f)
+        golden_mismatches = check_golden(saved_pages, golden)
+        print(f"Golden file: {len(saved_pages) - len(golden_mismatches)} of {len(saved_pages)} saved pages match")
+        mismatches.extend(golden_mismatches)
+    for name in mismatches[:20]:
+        print(f"  Mismatch: {name}")
+
+    results = {
+        'benchmark': 'bench_parse',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {'saved_pages': len(saved_pages), 'articles': args.articles, 'seed': args.seed, 'repeat': args.repeat},
+        'backends': {backend: time_backend(pages, backend, args.repeat) for backend in BACKENDS},
+    }
+    print(f"{'backend':>8} {'ms/page':>9} {'pages/s':>9} {'MB/s':>7}")
+    for backend, stats in results['backends'].items():
+        print(f"{backend:>8} {stats['ms_per_page']:>9.3f} {stats['pages_per_second']:>9.1f} {stats['mb_per_second']:>7.2f}")
+    print(f"Speed-up: {results['backends']['soup']['seconds'] / results['backends']['fast']['seconds']:.2f}x")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+        print(f"Results written to {args.output}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
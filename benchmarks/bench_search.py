@@ -0,0 +1,210 @@
+# benchmarks/bench_search.py
+#
+# End-to-end benchmark of the indexer and the search models: index build,
+# finalize, on-disk size and load time of the binary index, and query
+# latency percentiles per model on the loaded (memory-mapped) index, as
+# served by the app. Runs on a synthetic corpus (see synthetic_corpus.py) or
+# on a real metadata file, and writes the results as JSON so runs can be
+# compared (--compare).
+#
+# Usage:
+#   python benchmarks/bench_search.py [--docs 10000] [--queries 200] [--output results.json]
+#   python benchmarks/bench_search.py --metadata fandom_image_data/fandom_image_metadata.json
+#   python benchmarks/bench_search.py --docs 10000 --compare baseline.json
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from preprocessor import Preprocessor
+from indexer import Indexer
+from search import SearchEngine
+from mmap_index import load_mmap_index, save_mmap_index
+from synthetic_corpus import generate_items, generate_queries
+
+MODELS = ('vsm', 'bm25', 'lm_dirichlet')
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def latency_summary(latencies):
+    """Summary statistics (milliseconds) of a list of latencies in seconds."""
+    values = sorted(latency * 1000 for latency in latencies)
+    summary = {f"p{p}_ms": percentile(values, p) for p in PERCENTILES}
+    summary['mean_ms'] = sum(values) / len(values) if values else 0.0
+    summary['max_ms'] = values[-1] if values else 0.0
+    summary['queries_per_second'] = len(values) / (sum(values) / 1000) if values and sum(values) else 0.0
+    return summary
+
+
+def queries_from_items(items, num_queries, seed=42):
+    """Queries of 1 to 4 consecutive words taken from random documents of a real corpus."""
+    rng = random.Random(seed)
+    contexts = [item['context'].split() for item in items if item.get('context')]
+    queries = []
+    while contexts and len(queries) < num_queries:
+        words = rng.choice(contexts)
+        length = rng.randint(1, 4)
+        start = rng.randint(0, max(0, len(words) - length))
+        queries.append(' '.join(words[start:start + length]))
+    return queries
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(items, queries, top_k):
+    """
+    Build, finalize, save and load an index over items, then time queries.
+
+    Returns:
+        dict: The 'index' and 'queries' sections of the results
+    """
+    indexer = Indexer(Preprocessor())
+    start = time.perf_counter()
+    for doc_id, item in enumerate(items):
+        # Same filter as the build script
+        if item.get('context') and item.get('image_url'):
+            indexer.add_document(doc_id, item['context'])
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexer.finalize_index()
+    finalize_seconds = time.perf_counter() - start
+
+    index_stats = {
+        'documents': indexer.doc_count,
+        'terms': len(indexer.inverted_index),
+        'postings': indexer.inverted_index.num_postings(),
+        'build_seconds': build_seconds,
+        'finalize_seconds': finalize_seconds,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_file = os.path.join(tmp_dir, 'index.bin')
+        start = time.perf_counter()
+        save_mmap_index(indexer, index_file)
+        index_stats['save_seconds'] = time.perf_counter() - start
+        index_stats['index_bytes'] = os.path.getsize(index_file)
+        del indexer
+
+        # A fresh preprocessor, as in a newly started server
+        preprocessor = Preprocessor()
+        start = time.perf_counter()
+        mapped_indexer = load_mmap_index(index_file, preprocessor)
+        index_stats['load_seconds'] = time.perf_counter() - start
+
+        search_engine = SearchEngine(mapped_indexer, preprocessor)
+        methods = {
+            'vsm': search_engine.search_vsm,
+            'bm25': search_engine.search_bm25,
+            'lm_dirichlet': search_engine.search_lm_dirichlet,
+        }
+        query_stats = {}
+        for model in MODELS:
+            method = methods[model]
+            for query in queries[:10]: # Warm up
+                method(query, top_k=top_k)
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                method(query, top_k=top_k)
+                latencies.append(time.perf_counter() - start)
+            query_stats[model] = latency_summary(latencies)
+        del search_engine, mapped_indexer, methods
+
+    return {'index': index_stats, 'queries': query_stats}
+
+
+def print_results(results):
+    index_stats = results['index']
+    print(f"Documents: {index_stats['documents']:,}  terms: {index_stats['terms']:,}  "
+          f"postings: {index_stats['postings']:,}  index size: {index_stats['index_bytes'] / 1e6:.1f} MB")
+    print(f"Build {index_stats['build_seconds']:.2f}s  finalize {index_stats['finalize_seconds']:.2f}s  "
+          f"save {index_stats['save_seconds']:.3f}s  load {index_stats['load_seconds']:.4f}s")
+    print(f"{'model':>13} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'qps':>9}")
+    for model, stats in results['queries'].items():
+        print(f"{model:>13} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} {stats['p99_ms']:>9.3f} "
+              f"{stats['mean_ms']:>9.3f} {stats['queries_per_second']:>9.1f}")
+
+
+def print_comparison(results, baseline):
+    """Prints current / baseline ratios of the timings (below 1.0 is faster)."""
+    print(f"\nCompared with baseline ({baseline.get('git_commit')}, {baseline.get('timestamp')}):")
+    if baseline.get('params') != results['params']:
+        print("  Warning: the runs used different parameters")
+    for key in ('build_seconds', 'finalize_seconds', 'save_seconds', 'load_seconds', 'index_bytes'):
+        old, new = baseline['index'].get(key), results['index'][key]
+        if old:
+            print(f"  {key:>18}: {new / old:6.2f}x")
+    for model, stats in results['queries'].items():
+        old_stats = baseline['queries'].get(model, {})
+        ratios = [f"p{p} {stats[f'p{p}_ms'] / old_stats[f'p{p}_ms']:.2f}x"
+                  for p in PERCENTILES if old_stats.get(f'p{p}_ms')]
+        print(f"  {model:>18}: {'  '.join(ratios)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark index building and search latency.")
+    parser.add_argument('--metadata', help="Metadata JSON to index instead of a synthetic corpus")
+    parser.add_argument('--docs', type=int, default=10_000, help="Synthetic corpus size (documents)")
+    parser.add_argument('--vocabulary', type=int, default=50_000, help="Synthetic vocabulary size")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed for the corpus and queries")
+    parser.add_argument('--queries', type=int, default=200, help="Queries timed per model")
+    parser.add_argument('--top-k', type=int, default=50, help="Results per query (the /search route uses 50)")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--compare', help="Results JSON of an earlier run to compare against")
+    args = parser.parse_args()
+
+    if args.metadata:
+        with open(args.metadata, 'r', encoding='utf-8') as f:
+            items = json.load(f)
+        corpus = {'metadata': args.metadata, 'seed': args.seed}
+        queries = queries_from_items(items, args.queries, args.seed)
+    else:
+        items = generate_items(args.docs, args.vocabulary, args.seed)
+        corpus = {'docs': args.docs, 'vocabulary': args.vocabulary, 'seed': args.seed}
+        queries = generate_queries(args.queries, args.vocabulary, args.seed)
+
+    results = {
+        'benchmark': 'bench_search',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': dict(corpus, queries=args.queries, top_k=args.top_k),
+    }
+    results.update(run_benchmark(items, queries, args.top_k))
+
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# benchmarks/bench_top_k.py
+#
+# Compares the old full sort of every document score against the bounded
+# top-k selection used by SearchEngine, on synthetic score dictionaries.
+#
+# Usage: python benchmarks/bench_top_k.py [--top-k 50] [--repeats 5]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from search import select_top_k
+
+SIZES = [10_000, 100_000, 1_000_000]
+
+
+def full_sort(scores, top_k):
+    """The ranking step every model used before select_top_k."""
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+
+
+def make_scores(num_docs, seed=42):
+    """Synthetic BM25-like scores, rounded so that ties actually occur."""
+    rng = random.Random(seed)
+    return {doc_id: round(rng.expovariate(0.5), 3) for doc_id in range(num_docs)}
+
+
+def best_time(func, scores, top_k, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(scores, top_k)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark top-k selection against a full sort.")
+    parser.add_argument('--top-k', type=int, default=50, help="Results per query (the /search route uses 50)")
+    parser.add_argument('--repeats', type=int, default=5, help="Timing repetitions; the best run is reported")
+    args = parser.parse_args()
+
+    print(f"top_k={args.top_k}, best of {args.repeats} runs")
+    print(f"{'documents':>12} {'full sort (s)':>15} {'top-k (s)':>12} {'speedup':>9}")
+    for num_docs in SIZES:
+        scores = make_scores(num_docs)
+
+        # Both must agree on the scores returned; top-k additionally fixes tie order
+        expected = [score for _, score in full_sort(scores, args.top_k)]
+        actual = [score for _, score in select_top_k(scores, args.top_k)]
+        assert expected == actual, "top-k selection disagrees with full sort"
+
+        sort_time = best_time(full_sort, scores, args.top_k, args.repeats)
+        top_k_time = best_time(select_top_k, scores, args.top_k, args.repeats)
+        print(f"{num_docs:>12,} {sort_time:>15.4f} {top_k_time:>12.4f} {sort_time / top_k_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
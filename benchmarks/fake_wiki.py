@@ -0,0 +1,243 @@
+# benchmarks/fake_wiki.py
+#
+# A local stand-in for the fandom wiki, for exercising crawler.py without
+# touching the real site: serves category pages and article pages with the
+# same structure parse_page() reads (firstHeading, portable-infobox with a
+# figure, mw-parser-output paragraphs, wiki/category/file/anchor links), plus
+# a robots.txt. Pages are generated deterministically from the article
+# number, so sites of any size cost no memory. An artificial per-response
+# latency makes network-bound crawls reproducible.
+#
+# Articles carry ETag and Last-Modified headers and answer conditional
+# requests with 304. --revision N serves the site as it is after N rounds of
+# edits, each of which changes about --change-rate of the articles, for
+# exercising crawler.py --recrawl.
+#
+# Usage:
+#   python benchmarks/fake_wiki.py [--port 8000] [--articles 2000] [--latency-ms 50] [--crawl-delay 0]
+#   python crawler.py --base-url http://127.0.0.1:8000 --workers 8 --rate 50 --save-dir /tmp/crawl
+#   python benchmarks/fake_wiki.py --revision 1    (then: crawler.py ... --recrawl)
+
+import argparse
+import email.utils
+import html
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from synthetic_corpus import ZipfSampler, make_vocabulary
+
+CATEGORIES = ('Characters', 'Episodes', 'Locations')
+IMAGE_HOST = 'https://static.wikia.nocookie.net/rickandmorty/images'
+
+
+class FakeWiki:
+    def __init__(self, num_articles=2000, seed=42, vocabulary_size=5000, image_rate=0.8,
+                 revision=0, change_rate=0.05):
+        """
+        Args:
+            num_articles (int): Number of article pages
+            seed (int): Random seed; the same arguments always give the same site
+            vocabulary_size (int): Distinct words in titles and text
+            image_rate (float): Fraction of articles with an infobox image
+            revision (int): Rounds of edits applied to the site
+            change_rate (float): Fraction of articles edited in each round
+        """
+        self.num_articles = num_articles
+        self.seed = seed
+        self.image_rate = image_rate
+        self.revision = revision
+        self.change_rate = change_rate
+        words = make_vocabulary(vocabulary_size, seed)
+        self.sampler = ZipfSampler(words)
+        rng = random.Random(seed)
+        self.titles = []
+        seen = set()
+        while len(self.titles) < num_articles:
+            title = '_'.join(word.capitalize() for word in rng.sample(words[:2000], rng.randint(1, 3)))
+            if title not in seen:
+                seen.add(title)
+                self.titles.append(title)
+        self.article_numbers = {title: i for i, title in enumerate(self.titles)}
+
+    def article_version(self, number):
+        """Number of edit rounds (up to self.revision) that changed an article."""
+        return sum(random.Random(f"{self.seed}:{number}:{round_number}").random() < self.change_rate
+                   for round_number in range(1, self.revision + 1))
+
+    def page(self, path):
+        """
+        Returns:
+            tuple: (HTML, version) of the page at path, or None if there is no such page
+        """
+        if not path.startswith('/wiki/'):
+            return None
+        name = urllib.parse.unquote(path[len('/wiki/'):])
+        if name.startswith('Category:') and name[len('Category:'):] in CATEGORIES:
+            return self.category_page(CATEGORIES.index(name[len('Category:'):])), 0
+        if name in self.article_numbers:
+            number = self.article_numbers[name]
+            version = self.article_version(number)
+            return self.article_page(number, version), version
+        return None
+
+    def category_page(self, category_number):
+        # Each category lists every third article
+        links = ''.join(f'<li><a href="/wiki/{title}" title="{title}">{title.replace("_", " ")}</a></li>\n'
+                        for title in self.titles[category_number::len(CATEGORIES)])
+        name = CATEGORIES[category_number]
+        return self._layout(f"Category:{name}", f"""
+<div class="mw-parser-output"><p>All {name.lower()} of the show.</p></div>
+<div class="category-page__members"><ul>
+{links}</ul></div>""")
+
+    def article_page(self, number, version=0):
+        rng = random.Random(self.seed * 1_000_003 + number + version * 7_919_000_003)
+        title = self.titles[number]
+        text = lambda low, high: ' '.join(self.sampler.sample(rng, rng.randint(low, high)))
+
+        infobox = ''
+        if rng.random() < self.image_rate:
+            image_name = f"{title}.png"
+            src = f"{IMAGE_HOST}/{number % 16:x}/{number % 256:02x}/{image_name}/revision/latest/scale-to-width-down/268?cb={rng.randint(10**13, 10**14)}"
+            caption = f"<figcaption>{html.escape(text(2, 6))}</figcaption>" if rng.random() < 0.5 else ''
+            infobox = f"""<aside class="portable-infobox pi-background">
+<h2 class="pi-title">{title.replace('_', ' ')}</h2>
+<figure class="pi-item pi-image"><a href="{IMAGE_HOST}/{image_name}" class="image"><img src="{src}" alt="{html.escape(text(1, 3))}" width="268" height="268"></a>{caption}</figure>
+<div class="pi-item"><h3>Species</h3><div><a href="/wiki/{self.titles[rng.randrange(self.num_articles)]}">{text(1, 1)}</a></div></div>
+</aside>"""
+
+        paragraphs = []
+        for _ in range(rng.randint(2, 8)):
+            parts = []
+            for _ in range(rng.randint(2, 6)):
+                parts.append(html.escape(text(5, 25)))
+                other = self.titles[rng.randrange(self.num_articles)]
+                parts.append(f'<a href="/wiki/{other}" title="{other}">{other.replace("_", " ")}</a>')
+            if rng.random() < 0.2:
+                parts.append(f'<sup class="reference"><a href="#cite_note-{rng.randint(1, 9)}">[1]</a></sup>')
+            paragraphs.append(f"<p>{' '.join(parts)}\n</p>")
+        if rng.random() < 0.3:
+            # A layout paragraph parse_page skips
+            paragraphs.insert(rng.randint(0, len(paragraphs)), '<p><table class="wikitable"><tr><td>Stats</td></tr></table></p>')
+        category = CATEGORIES[number % len(CATEGORIES)]
+        return self._layout(title.replace('_', ' '), f"""
+<div class="mw-parser-output">
+{infobox}
+{''.join(paragraphs)}
+<h2>Trivia</h2><ul><li>{html.escape(text(5, 15))} <a href="/wiki/File:{title}.png">file</a></li></ul>
+</div>
+<div class="page-footer"><a href="/wiki/Category:{category}">{category}</a></div>""")
+
+    @staticmethod
+    def _layout(heading, content):
+        return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(heading)} | Fake Wiki</title></head>
+<body>
+<nav><a href="/wiki/Special:Search">Search</a> <a href="/wiki/Special:Random">Random page</a></nav>
+<h1 id="firstHeading" class="page-header__title">{html.escape(heading)}</h1>
+<div id="mw-content-text">{content}
+</div>
+</body></html>
+"""
+
+
+def make_handler(wiki, latency_seconds=0.0, crawl_delay=None, disallow=('/wiki/Special:',), validators=True):
+    robots = ['User-agent: *'] + [f'Disallow: {path}' for path in disallow]
+    if crawl_delay:
+        robots.append(f'Crawl-delay: {crawl_delay:g}')
+    robots_txt = '\n'.join(robots) + '\n'
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1' # Keep-alive, so connection pooling is visible
+        request_count = 0
+        count_lock = threading.Lock()
+
+        def do_GET(self):
+            with Handler.count_lock:
+                Handler.request_count += 1
+            if latency_seconds:
+                time.sleep(latency_seconds)
+            path = urllib.parse.urlsplit(self.path).path
+            if path == '/robots.txt':
+                self._send(200, 'text/plain', robots_txt)
+                return
+            page = wiki.page(path)
+            if page is None:
+                self._send(404, 'text/html; charset=utf-8', '<html><body><h1>Not found</h1></body></html>')
+                return
+            text, version = page
+            headers = {}
+            if validators:
+                etag = f'"{path.rsplit("/", 1)[-1]}-{version}"'
+                # Each edit round is a day after the previous one
+                last_modified = email.utils.formatdate(1_700_000_000 + version * 86_400, usegmt=True)
+                headers = {'ETag': etag, 'Last-Modified': last_modified}
+                if self.headers.get('If-None-Match') == etag or (
+                        'If-None-Match' not in self.headers and self.headers.get('If-Modified-Since') == last_modified):
+                    self._send(304, None, '', headers)
+                    return
+            self._send(200, 'text/html; charset=utf-8', text, headers)
+
+        def _send(self, status, content_type, text, headers=None):
+            body = text.encode('utf-8')
+            self.send_response(status)
+            if content_type:
+                self.send_header('Content-Type', content_type)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if status != 304:
+                self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(wiki, port=0, latency_seconds=0.0, crawl_delay=None, validators=True, disallow=('/wiki/Special:',)):
+    """
+    Serve wiki on 127.0.0.1 from a background thread. robots.txt disallows
+    the paths starting with any of disallow.
+
+    Returns:
+        ThreadingHTTPServer: The running server (server_address has the port;
+        RequestHandlerClass.request_count counts requests; call shutdown() to stop)
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port),
+                                 make_handler(wiki, latency_seconds, crawl_delay, disallow, validators))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-wiki', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic fandom-like wiki for crawler tests.")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--articles', type=int, default=2000, help="Number of article pages")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency-ms', type=float, default=50, help="Delay before every response")
+    parser.add_argument('--crawl-delay', type=int, default=0, help="Crawl-delay (whole seconds) advertised in robots.txt")
+    parser.add_argument('--revision', type=int, default=0, help="Rounds of edits applied to the articles")
+    parser.add_argument('--change-rate', type=float, default=0.05, help="Fraction of articles edited per round")
+    parser.add_argument('--no-validators', action='store_true',
+                        help="Send no ETag/Last-Modified (clients must compare content)")
+    args = parser.parse_args()
+
+    wiki = FakeWiki(args.articles, args.seed, revision=args.revision, change_rate=args.change_rate)
+    server = start_server(wiki, args.port, args.latency_ms / 1000, args.crawl_delay, validators=not args.no_validators)
+    host, port = server.server_address
+    print(f"Serving {args.articles:,} articles at http://{host}:{port}/wiki/Category:Characters (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"Served {server.RequestHandlerClass.request_count:,} requests")
+
+
+if __name__ == "__main__":
+    main()
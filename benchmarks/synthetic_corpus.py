@@ -0,0 +1,134 @@
+# benchmarks/synthetic_corpus.py
+#
+# Generates synthetic image metadata shaped like
+# fandom_image_data/fandom_image_metadata.json (image_url, source_page,
+# alt_text, context), with a Zipfian vocabulary of pronounceable pseudo-words
+# mixed with English stopwords, so the real Preprocessor has realistic work.
+# Items are generated lazily and written as a streamed JSON array, so corpora
+# of millions of documents never have to fit in memory.
+#
+# Usage: python benchmarks/synthetic_corpus.py OUTPUT.json [--docs 100000] [--vocabulary 50000] [--seed 42]
+
+import argparse
+import bisect
+import itertools
+import json
+import random
+
+CONSONANTS = 'bcdfghjklmnprstvwz'
+VOWELS = 'aeiou'
+STOPWORDS = ['the', 'a', 'of', 'and', 'to', 'in', 'is', 'was', 'his', 'her', 'with', 'for', 'as', 'on', 'by', 'at']
+STOPWORD_RATE = 0.3 # Fraction of context tokens that are stopwords, roughly as in the wiki text
+
+
+def make_vocabulary(vocabulary_size, seed=42):
+    """
+    Make vocabulary_size distinct pseudo-words (consonant-vowel syllables).
+
+    Returns:
+        list: The words, most frequent first
+    """
+    rng = random.Random(seed)
+    words = []
+    seen = set()
+    while len(words) < vocabulary_size:
+        syllables = rng.randint(2, 4)
+        word = ''.join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(syllables))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+class ZipfSampler:
+    """Draws words with probability proportional to 1 / rank**exponent."""
+
+    def __init__(self, words, exponent=1.0):
+        self.words = words
+        self.cum_weights = list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(len(words))))
+
+    def sample(self, rng, k):
+        total = self.cum_weights[-1]
+        cum_weights = self.cum_weights
+        words = self.words
+        return [words[bisect.bisect(cum_weights, rng.random() * total)] for _ in range(k)]
+
+
+def generate_items(num_docs, vocabulary_size=50_000, seed=42, exponent=1.0):
+    """
+    Lazily generate num_docs metadata items.
+
+    Args:
+        num_docs (int): Number of items
+        vocabulary_size (int): Number of distinct content words
+        seed (int): Random seed; the same arguments always give the same corpus
+        exponent (float): Zipf exponent of the word distribution
+
+    Yields:
+        dict: image_url, source_page, alt_text and context of one image
+    """
+    rng = random.Random(seed)
+    sampler = ZipfSampler(make_vocabulary(vocabulary_size, seed), exponent)
+    for doc_id in range(num_docs):
+        title_words = sampler.sample(rng, rng.randint(1, 3))
+        title = '_'.join(word.capitalize() for word in title_words)
+        alt_text = ''.join(word.capitalize() for word in sampler.sample(rng, rng.randint(1, 2)))
+        # Context starts with the page title and alt text, then body text
+        # (lengths roughly match the sample metadata)
+        body = []
+        for word in sampler.sample(rng, rng.randint(20, 110)):
+            body.append(rng.choice(STOPWORDS) if rng.random() < STOPWORD_RATE else word)
+        yield {
+            'image_url': f"https://static.example.org/images/{doc_id:x}/{alt_text}.png",
+            'source_page': f"https://example.fandom.com/wiki/{title}",
+            'alt_text': alt_text,
+            'context': ' '.join(title_words + [alt_text] + body),
+        }
+
+
+def generate_queries(num_queries, vocabulary_size=50_000, seed=42, exponent=1.0):
+    """
+    Generate queries of 1 to 4 words drawn from the corpus distribution.
+
+    Returns:
+        list: The query strings
+    """
+    rng = random.Random(seed + 1)
+    sampler = ZipfSampler(make_vocabulary(vocabulary_size, seed), exponent)
+    return [' '.join(sampler.sample(rng, rng.randint(1, 4))) for _ in range(num_queries)]
+
+
+def write_corpus(path, items):
+    """
+    Stream items to path as a JSON array.
+
+    Returns:
+        int: Number of items written
+    """
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[\n')
+        for item in items:
+            if count:
+                f.write(',\n')
+            json.dump(item, f)
+            count += 1
+        f.write('\n]\n')
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic image metadata corpus.")
+    parser.add_argument('output', help="Path of the JSON file to write")
+    parser.add_argument('--docs', type=int, default=100_000, help="Number of documents")
+    parser.add_argument('--vocabulary', type=int, default=50_000, help="Number of distinct content words")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed")
+    parser.add_argument('--zipf-exponent', type=float, default=1.0, help="Zipf exponent of the word distribution")
+    args = parser.parse_args()
+
+    count = write_corpus(args.output, generate_items(args.docs, args.vocabulary, args.seed, args.zipf_exponent))
+    print(f"Wrote {count:,} documents to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
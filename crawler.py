@@ -1,10 +1,19 @@
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import time
 import os
 import urllib.parse
+import urllib.robotparser
 import json
 import re # Using regex for slightly cleaner URL joining
+import argparse
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from page_extractor import PageParts, extract_page_parts
 
 # --- Configuration ---
 START_URLS = [
@@ -17,46 +26,228 @@ HEADERS = {'User-Agent': 'MyUniAssignmentCrawler/1.0 (Learning project; contact:
 SAVE_DIR = 'fandom_image_data' # Directory to save metadata
 TARGET_IMAGE_COUNT = 1500
 DELAY_SECONDS = 2
+REQUESTS_PER_SECOND_PER_HOST = 1 / DELAY_SECONDS # Sustained request rate to any one host
+BURST_PER_HOST = 1 # Requests a host may get back to back after being idle
+MAX_WORKERS = 8 # Pages fetched at once in concurrent mode (--workers)
+RESPECT_ROBOTS_TXT = True # Skip URLs disallowed by the host's robots.txt and honour its Crawl-delay
+METADATA_FILE_NAME = 'fandom_image_metadata.jsonl' # One JSON object per line, appended as images are found
+CHECKPOINT_FILE_NAME = 'crawl_checkpoint.json' # Queue and visited URLs, for --resume
+CHECKPOINT_INTERVAL_SECONDS = 60
+VALIDATORS_FILE_NAME = 'page_validators.json' # ETag, Last-Modified and content hash of every fetched page
+UPDATES_FILE_NAME = 'fandom_image_updates.jsonl' # Records of the pages that changed, written by --recrawl
+RECRAWL_MAX_NEW_PAGES = 100 # Pages not seen before that --recrawl fetches, at most
+PARSER_BACKEND = 'fast' # 'fast': page_extractor reads only what parse_page needs; 'soup': a full BeautifulSoup tree
 
 # --- Global Variables ---
 visited_urls = set()
-image_data_list = []
-urls_to_crawl = list(START_URLS) # Use a list as a queue (FIFO for BFS)
+urls_to_crawl = deque(START_URLS) # FIFO queue for BFS
+queued_urls = set(START_URLS) # Every URL ever put in the queue, so each is queued once
+collected_image_urls = set() # image_url of every image written to the metadata file
+images_collected = 0
+metadata_file = None # Binary append handle of the JSONL metadata file
+page_validators = {} # URL -> [ETag, Last-Modified, SHA-256 of the body, image_url written for the page or None] (see fetch_page_if_changed)
+last_checkpoint_time = 0.0
+visited_lock = threading.Lock() # fetch_page is called from several threads in concurrent mode; also guards page_validators
+
+# --- Politeness ---
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second on average and bursts of up to
+    `capacity` requests. Thread-safe: callers wait their turn in acquire().
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token, sleeping until one is available.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserve the token now (possibly going negative) so concurrent
+            # callers queue up behind each other instead of all waking at once
+            self.tokens -= 1
+            wait_seconds = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+        return wait_seconds
+
+
+class HostRateLimiter:
+    """One token bucket per host, so hosts are throttled independently."""
+
+    def __init__(self, rate=REQUESTS_PER_SECOND_PER_HOST, burst=BURST_PER_HOST):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def set_rate(self, host, rate):
+        """Use a different rate for one host (e.g. a slower robots.txt Crawl-delay)."""
+        with self.lock:
+            self.buckets[host] = TokenBucket(rate, self.burst)
+
+    def wait(self, url):
+        """Block until a request to url's host is allowed; returns the seconds waited."""
+        host = urllib.parse.urlsplit(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(self.rate, self.burst)
+        return bucket.acquire()
+
+
+class RobotsPolicy:
+    """Caches each host's robots.txt (fetched once, on first use)."""
+
+    def __init__(self, user_agent=HEADERS['User-Agent']):
+        self.user_agent = user_agent
+        self.parsers = {}
+        self.lock = threading.Lock()
+
+    def allowed(self, url):
+        """
+        Check url against its host's robots.txt.
+
+        Returns:
+            bool: True if the crawler may fetch url
+        """
+        parts = urllib.parse.urlsplit(url)
+        host = parts.netloc
+        with self.lock: # Held while fetching, so each robots.txt is fetched once
+            parser = self.parsers.get(host)
+            if parser is None:
+                parser = self.parsers[host] = self._fetch(f"{parts.scheme}://{host}/robots.txt")
+                crawl_delay = parser.crawl_delay(self.user_agent)
+                if crawl_delay and 1 / crawl_delay < rate_limiter.rate:
+                    print(f"  robots.txt of {host} asks for {crawl_delay}s between requests")
+                    rate_limiter.set_rate(host, 1 / crawl_delay)
+        return parser.can_fetch(self.user_agent, url)
+
+    @staticmethod
+    def _fetch(robots_url):
+        parser = urllib.robotparser.RobotFileParser(robots_url)
+        rate_limiter.wait(robots_url)
+        try:
+            response = session.get(robots_url, timeout=20)
+        except requests.exceptions.RequestException as e:
+            print(f"  Could not fetch {robots_url} ({e}); assuming everything is allowed")
+            parser.parse([])
+            return parser
+        if response.status_code in (401, 403):
+            parser.disallow_all = True
+        elif response.status_code >= 400:
+            parser.allow_all = True
+        else:
+            parser.parse(response.text.splitlines())
+        return parser
+
+
+def make_session(pool_size=MAX_WORKERS):
+    """A requests session reusing up to pool_size kept-alive connections per host."""
+    new_session = requests.Session()
+    new_session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    new_session.mount('http://', adapter)
+    new_session.mount('https://', adapter)
+    return new_session
+
+session = make_session()
+rate_limiter = HostRateLimiter()
+robots_policy = RobotsPolicy()
 
 # --- Helper Functions ---
 
 def fetch_page(url):
     """Fetches HTML content of a URL respecting politeness rules."""
-    if url in visited_urls:
-        # print(f"Skipping already visited: {url}")
-        return None
+    html, _ = fetch_page_if_changed(url, conditional=False)
+    return html
+
+def fetch_page_if_changed(url, conditional=True):
+    """
+    Fetches a URL like fetch_page, remembering its ETag, Last-Modified and
+    content hash in page_validators. When conditional and the page was
+    fetched before, the request carries If-None-Match/If-Modified-Since, and
+    a page the server reports as not modified (304), or whose body hashes
+    the same as last time, is not returned, so it needn't be parsed.
+
+    Returns:
+        tuple: (html, status). status is 'new', 'changed', 'unchanged',
+        'gone' (404 or 410), 'skipped' (visited, disallowed or not HTML) or
+        'failed'; html is None unless the status is 'new' or 'changed'
+    """
+    with visited_lock:
+        if url in visited_urls:
+            # print(f"Skipping already visited: {url}")
+            return None, 'skipped'
+        visited_urls.add(url)
     print(f"Fetching: {url}")
-    visited_urls.add(url)
 
     try:
-        # Wait before making the request
-        print(f"  Waiting {DELAY_SECONDS} seconds...")
-        time.sleep(DELAY_SECONDS)
-
-        response = requests.get(url, headers=HEADERS, timeout=20) # Increased timeout
+        if RESPECT_ROBOTS_TXT and not robots_policy.allowed(url):
+            print(f"  Skipping (disallowed by robots.txt): {url}")
+            return None, 'skipped'
+
+        with visited_lock:
+            previous = page_validators.get(url)
+        known = previous if conditional else None
+        headers = {}
+        if known:
+            etag, last_modified = known[0], known[1]
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        # Wait for this host's rate limit before making the request
+        waited = rate_limiter.wait(url)
+        if waited:
+            print(f"  Waited {waited:.2f} seconds...")
+
+        response = session.get(url, headers=headers, timeout=20) # Increased timeout
+        if response.status_code == 304:
+            print("  Not modified.")
+            return None, 'unchanged'
+        if response.status_code in (404, 410):
+            print(f"  Page is gone ({response.status_code}): {url}")
+            return None, 'gone'
         response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
 
         # Basic check for unusual content types (we want HTML)
         if 'text/html' not in response.headers.get('Content-Type', ''):
              print(f"  Skipping non-HTML content: {response.headers.get('Content-Type')}")
-             return None
-
-        return response.text
+             return None, 'skipped'
+
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        emitted = previous[3] if previous else None
+        with visited_lock:
+            page_validators[url] = [response.headers.get('ETag'), response.headers.get('Last-Modified'), content_hash, emitted]
+        if known and known[2] == content_hash:
+            # The server doesn't support conditional requests (or ignored them)
+            print("  Unchanged (same content hash).")
+            return None, 'unchanged'
+        return response.text, 'changed' if known else 'new'
 
     except requests.exceptions.Timeout:
         print(f"  Error: Timeout fetching {url}")
-        return None
+        return None, 'failed'
     except requests.exceptions.RequestException as e:
         print(f"  Error fetching {url}: {e}")
-        return None
+        return None, 'failed'
     except Exception as e:
         print(f"  An unexpected error occurred during fetch: {e}")
-        return None
+        return None, 'failed'
 
 def clean_image_url(img_src):
     """Attempts to clean Fandom image URLs to get a base version."""
@@ -69,50 +260,33 @@ def clean_image_url(img_src):
     img_src = re.sub(r'/scale-to-width-down/\d+.*', '', img_src)
     return img_src
 
-def parse_page(html_content, page_url):
+def extract_page_parts_soup(html_content):
     """
-    Parses HTML to find image data (if it's an article page)
-    and links to follow (articles or other categories).
-    Extracts context from title, alt text, caption, and FIRST FIVE valid paragraphs.
+    Reads the parts of a page that parse_page uses from a full BeautifulSoup
+    tree. The reference for page_extractor.extract_page_parts, which reads the
+    same parts without building the tree.
     """
-    images_found = []
-    links_to_follow = set() # Use a set to automatically handle duplicates within page
     soup = BeautifulSoup(html_content, 'html.parser')
 
-    # --- 1. Find Image and Context (Primarily for Article Pages) ---
-    # Target the main infobox image first, as it's usually the most relevant
-    infobox = soup.find('aside', class_='portable-infobox')
-    article_image_url = None
-    alt_text = ""
-    context_parts = [] # Initialize list to store parts of the context
-
-    # Add Page Title to context
     page_title_tag = soup.find('h1', id='firstHeading')
-    page_title = page_title_tag.get_text(strip=True) if page_title_tag else "Untitled Page"
-    context_parts.append(page_title)
+    page_title = page_title_tag.get_text(strip=True) if page_title_tag else None
 
-    # Extract Image URL, Alt Text, and Caption from Infobox
+    # Target the main infobox image first, as it's usually the most relevant
+    infobox = soup.find('aside', class_='portable-infobox')
+    img_tag = None
+    caption = None
     if infobox:
         figure_tag = infobox.find('figure')
-        img_tag = None
         if figure_tag:
             img_tag = figure_tag.find('img')
             caption_tag = figure_tag.find('figcaption')
             if caption_tag:
-                context_parts.append(caption_tag.get_text(strip=True)) # Add caption text
+                caption = caption_tag.get_text(strip=True)
         else:
              img_tag = infobox.find('img')
 
-        if img_tag:
-            img_src = img_tag.get('src') or img_tag.get('data-src')
-            cleaned_url = clean_image_url(img_src)
-            if cleaned_url and 'static.wikia.nocookie.net' in cleaned_url:
-                 article_image_url = urllib.parse.urljoin(BASE_URL, cleaned_url)
-                 alt_text = img_tag.get('alt', '')
-                 if alt_text:
-                     context_parts.append(alt_text) # Add alt text
-
-    # Get text from the first FIVE valid paragraphs in the main content area
+    # Text of the first FIVE valid paragraphs in the main content area
+    paragraph_texts = []
     content_body = soup.find('div', class_='mw-parser-output')
     if content_body:
         # Find all direct child paragraph tags, limit to first 5
@@ -120,10 +294,61 @@ def parse_page(html_content, page_url):
         for p_tag in paragraphs:
             # Filter out paragraphs that are likely just containers for other things
             if not p_tag.find(['table', 'div', 'aside', 'navbox'], recursive=False):
-                p_text = p_tag.get_text(strip=True)
-                # Add the paragraph text if it's not empty
-                if p_text:
-                    context_parts.append(p_text) # Append the full paragraph text
+                paragraph_texts.append(p_tag.get_text(strip=True))
+
+    # Look in main content area and potentially category listings
+    content_area = soup.find('div', id='mw-content-text') # Broader content area
+    if not content_area:
+         content_area = soup.body
+    hrefs = [link_tag['href'] for link_tag in content_area.find_all('a', href=True)] if content_area else []
+
+    return PageParts(page_title, img_tag.attrs if img_tag else None, caption, paragraph_texts, hrefs)
+
+def parse_page(html_content, page_url):
+    """
+    Parses HTML to find image data (if it's an article page)
+    and links to follow (articles or other categories).
+    Extracts context from title, alt text, caption, and FIRST FIVE valid paragraphs.
+    """
+    parts = None
+    if PARSER_BACKEND == 'fast' and isinstance(html_content, str):
+        try:
+            parts = extract_page_parts(html_content)
+        except Exception as e:
+            # The tree builder gives the same result (or raises the same error)
+            print(f"  Fast parser failed ({e!r}); building the tree instead.")
+    if parts is None:
+        parts = extract_page_parts_soup(html_content)
+
+    images_found = []
+    links_to_follow = set() # Use a set to automatically handle duplicates within page
+
+    # --- 1. Find Image and Context (Primarily for Article Pages) ---
+    article_image_url = None
+    alt_text = ""
+    context_parts = [] # Initialize list to store parts of the context
+
+    # Add Page Title to context
+    page_title = parts.title if parts.title is not None else "Untitled Page"
+    context_parts.append(page_title)
+
+    # Extract Image URL, Alt Text, and Caption from Infobox
+    if parts.caption is not None:
+        context_parts.append(parts.caption) # Add caption text
+    img_attrs = parts.image
+    if img_attrs is not None:
+        img_src = img_attrs.get('src') or img_attrs.get('data-src')
+        cleaned_url = clean_image_url(img_src)
+        if cleaned_url and 'static.wikia.nocookie.net' in cleaned_url:
+             article_image_url = urllib.parse.urljoin(BASE_URL, cleaned_url)
+             alt_text = img_attrs.get('alt', '')
+             if alt_text:
+                 context_parts.append(alt_text) # Add alt text
+
+    # Add the first five valid paragraphs, skipping empty ones
+    for p_text in parts.paragraphs:
+        if p_text:
+            context_parts.append(p_text) # Append the full paragraph text
 
     # If we found a primary image for the article, store it with the combined context
     if article_image_url:
@@ -139,40 +364,343 @@ def parse_page(html_content, page_url):
 
 
     # --- 2. Find Links to Follow (Articles and Categories) ---
-    # Look in main content area and potentially category listings
-    content_area = soup.find('div', id='mw-content-text') # Broader content area
-    if not content_area:
-         content_area = soup.body
-
-    if content_area:
-        for link_tag in content_area.find_all('a', href=True):
-            href = link_tag['href']
-            # Filter for relevant wiki links
-            if href.startswith('/wiki/') and ':' not in href and '#' not in href:
-                # ':' check avoids Special:, Category:, File:, Template: etc.
-                # '#' check avoids in-page links
-                full_link_url = urllib.parse.urljoin(BASE_URL, href)
-                links_to_follow.add(full_link_url)
-            elif href.startswith('/wiki/Category:'): # Also follow category links
-                full_link_url = urllib.parse.urljoin(BASE_URL, href)
-                links_to_follow.add(full_link_url)
+    for href in parts.hrefs:
+        # Filter for relevant wiki links
+        if href.startswith('/wiki/') and ':' not in href and '#' not in href:
+            # ':' check avoids Special:, Category:, File:, Template: etc.
+            # '#' check avoids in-page links
+            full_link_url = urllib.parse.urljoin(BASE_URL, href)
+            links_to_follow.add(full_link_url)
+        elif href.startswith('/wiki/Category:'): # Also follow category links
+            full_link_url = urllib.parse.urljoin(BASE_URL, href)
+            links_to_follow.add(full_link_url)
 
     return images_found, list(links_to_follow) # Return links as a list
 
-# --- Main Crawling Loop ---
-def main():
-    global urls_to_crawl, visited_urls, image_data_list # Allow modification
+def collect_images(images):
+    """Append new (not yet collected) images to the metadata file, up to TARGET_IMAGE_COUNT."""
+    global images_collected
+    for img_data in images:
+        if images_collected >= TARGET_IMAGE_COUNT:
+            break # Stop adding images if limit reached
+        if img_data['image_url'] not in collected_image_urls:
+            collected_image_urls.add(img_data['image_url'])
+            metadata_file.write(json.dumps(img_data, ensure_ascii=False).encode('utf-8') + b'\n')
+            set_emitted(img_data['source_page'], img_data['image_url'])
+            images_collected += 1
+            print(f"  Collected {images_collected}/{TARGET_IMAGE_COUNT} images.")
+
+def enqueue_links(links):
+    """Add links that have never been queued to the back of the crawl queue."""
+    for link in links:
+        if link not in queued_urls:
+            queued_urls.add(link)
+            urls_to_crawl.append(link)
+
+def fetch_and_parse(url):
+    """
+    fetch_page and parse_page for one URL (run on a worker thread).
 
-    # Create save directory if it doesn't exist
-    if not os.path.exists(SAVE_DIR):
-        os.makedirs(SAVE_DIR)
-        print(f"Created directory: {SAVE_DIR}")
+    Returns:
+        tuple: (images_found, links_to_follow), both empty if the page was not fetched or failed to parse
+    """
+    html = fetch_page(url)
+    if not html:
+        return [], []
+    try:
+        return parse_page(html, url)
+    except Exception as e:
+        print(f"  Error parsing {url}: {e}")
+        return [], []
+
+# --- Output and Checkpoints ---
+# Images are appended to the JSONL metadata file as they are found, so
+# memory doesn't grow with the crawl and a crash loses nothing already
+# written. Every CHECKPOINT_INTERVAL_SECONDS the queue, the visited URLs and
+# the metadata file's length are saved together; --resume truncates the
+# metadata file back to that length and carries on from that state, so a
+# resumed crawl continues exactly as if it had never stopped.
+
+def open_output(resume=False):
+    """
+    Open the metadata file for appending. With resume, restore the crawl
+    state from the last checkpoint; otherwise start a new crawl (replacing
+    any earlier output).
 
-    print(f"Starting crawl. Target: {TARGET_IMAGE_COUNT} images.")
-    print(f"Initial queue size: {len(urls_to_crawl)}")
+    Returns:
+        bool: True if a checkpoint was restored
+    """
+    global metadata_file, urls_to_crawl, queued_urls, images_collected, last_checkpoint_time
+    metadata_path = os.path.join(SAVE_DIR, METADATA_FILE_NAME)
+    checkpoint_path = os.path.join(SAVE_DIR, CHECKPOINT_FILE_NAME)
+    last_checkpoint_time = time.monotonic()
+    if not resume or not os.path.exists(checkpoint_path):
+        if resume:
+            print(f"No checkpoint found at {checkpoint_path}; starting a new crawl.")
+        metadata_file = open(metadata_path, 'wb')
+        with visited_lock:
+            page_validators.clear() # They describe the output being replaced
+        save_checkpoint()
+        return False
+
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    urls_to_crawl = deque(checkpoint['urls_to_crawl'])
+    visited_urls.update(checkpoint['visited_urls'])
+    queued_urls = visited_urls | set(urls_to_crawl)
+    # Drop images written after the checkpoint: their pages are still queued
+    with open(metadata_path, 'ab') as f:
+        f.truncate(checkpoint['metadata_bytes'])
+    emitted_images = read_emitted_images(metadata_path)
+    collected_image_urls.update(emitted_images.values())
+    images_collected = len(collected_image_urls)
+    # Pages parsed after the checkpoint lost their lines with the truncation
+    with visited_lock:
+        for url, entry in page_validators.items():
+            entry[3] = emitted_images.get(url)
+    metadata_file = open(metadata_path, 'ab')
+    print(f"Resumed from checkpoint: {images_collected} images collected, "
+          f"{len(visited_urls)} URLs visited, {len(urls_to_crawl)} queued.")
+    return True
+
+def save_checkpoint(in_flight=()):
+    """
+    Atomically save the crawl state, after making sure every image written
+    so far is on disk.
+
+    Args:
+        in_flight: URLs being fetched (concurrent mode); saved as queued, not visited
+    """
+    global last_checkpoint_time
+    metadata_file.flush()
+    os.fsync(metadata_file.fileno())
+    in_flight = list(in_flight)
+    checkpoint = {
+        'urls_to_crawl': in_flight + list(urls_to_crawl),
+        'visited_urls': list(visited_urls.difference(in_flight)),
+        'images_collected': images_collected,
+        'metadata_bytes': metadata_file.tell(),
+    }
+    checkpoint_path = os.path.join(SAVE_DIR, CHECKPOINT_FILE_NAME)
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, checkpoint_path)
+    save_validators()
+    last_checkpoint_time = time.monotonic()
+
+def load_validators():
+    """Load the page validators saved by earlier crawls in SAVE_DIR (if any)."""
+    validators_path = os.path.join(SAVE_DIR, VALIDATORS_FILE_NAME)
+    if os.path.exists(validators_path):
+        with open(validators_path, 'r', encoding='utf-8') as f:
+            validators = json.load(f)
+        if any(len(entry) < 4 or isinstance(entry[3], bool) for entry in validators.values()):
+            # Saved without the written image_url: take it from the metadata file
+            metadata_path = os.path.join(SAVE_DIR, METADATA_FILE_NAME)
+            emitted_images = read_emitted_images(metadata_path) if os.path.exists(metadata_path) else {}
+            for url, entry in validators.items():
+                entry[3:] = [emitted_images.get(url)]
+        with visited_lock:
+            page_validators.update(validators)
+
+def save_validators():
+    # Workers add and replace entries while a checkpoint is written: serialize a copy
+    with visited_lock:
+        validators = {url: list(entry) for url, entry in page_validators.items()}
+    validators_path = os.path.join(SAVE_DIR, VALIDATORS_FILE_NAME)
+    with open(validators_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(validators, f)
+    os.replace(validators_path + '.tmp', validators_path)
+
+def read_emitted_images(metadata_path):
+    """
+    Returns:
+        dict: source_page -> image_url of every record in a metadata file
+    """
+    emitted_images = {}
+    with open(metadata_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                emitted_images[record['source_page']] = record['image_url']
+    return emitted_images
+
+def set_emitted(url, image_url):
+    """
+    Record the image of url that is in the output, or None (so --recrawl
+    knows what a delete marker can refer to and which images are taken).
+    """
+    with visited_lock:
+        entry = page_validators.get(url)
+        if entry:
+            entry[3] = image_url
 
-    while urls_to_crawl and len(image_data_list) < TARGET_IMAGE_COUNT:
-        current_url = urls_to_crawl.pop(0) # Get the next URL from the front (BFS)
+def emitted_image(url):
+    """
+    Returns:
+        str: image_url of url's image in the output, or None
+    """
+    with visited_lock:
+        entry = page_validators.get(url)
+        return entry[3] if entry else None
+
+def maybe_save_checkpoint(in_flight=()):
+    if time.monotonic() - last_checkpoint_time >= CHECKPOINT_INTERVAL_SECONDS:
+        save_checkpoint(in_flight)
+
+# --- Concurrent Crawling Loop ---
+def crawl_concurrent(max_workers=MAX_WORKERS):
+    """
+    Crawl like crawl_sequential() but with max_workers pages in flight at
+    once, over a pooled session. Politeness is per host (rate_limiter and
+    robots.txt), so extra workers only speed up a single host if its rate
+    allows it; they always overlap network latency and parsing. Pages finish
+    out of order, so the crawl is breadth-first only approximately.
+
+    Collected images go to the metadata file, as in crawl_sequential().
+    """
+    global session
+    session = make_session(max_workers) # One kept-alive connection per worker
+    pending = {} # Future -> URL
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='crawler') as executor:
+        while (urls_to_crawl or pending) and images_collected < TARGET_IMAGE_COUNT:
+            # Keep a couple of URLs queued per worker
+            while urls_to_crawl and len(pending) < 2 * max_workers:
+                url = urls_to_crawl.popleft()
+                if url not in visited_urls:
+                    pending[executor.submit(fetch_and_parse, url)] = url
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+                images, new_links = future.result()
+                collect_images(images)
+                enqueue_links(new_links)
+            print(f"  Queue size: {len(urls_to_crawl)}, In flight: {len(pending)}, Visited: {len(visited_urls)}")
+            maybe_save_checkpoint(pending.values())
+
+        # Target reached: drop what hasn't started (back to the queue), let running fetches finish
+        not_started = [url for future, url in pending.items() if future.cancel()]
+    urls_to_crawl.extendleft(reversed(not_started))
+    # Keep the links of pages that finished meanwhile, for a resumed crawl
+    for future in pending:
+        if not future.cancelled():
+            enqueue_links(future.result()[1])
+
+# --- Conditional Re-crawl ---
+def refetch_and_parse(url):
+    """
+    fetch_page_if_changed and, for a new or changed page, parse_page (run on a worker thread).
+
+    Returns:
+        tuple: (url, status, images_found, links_to_follow)
+    """
+    html, status = fetch_page_if_changed(url)
+    if html is None:
+        return url, status, [], []
+    try:
+        images, links = parse_page(html, url)
+    except Exception as e:
+        print(f"  Error parsing {url}: {e}")
+        with visited_lock:
+            page_validators[url][:3] = [None, None, None] # Parse it again next time
+        return url, 'failed', [], []
+    return url, status, images, links
+
+def recrawl(max_workers=MAX_WORKERS, max_new_pages=RECRAWL_MAX_NEW_PAGES):
+    """
+    Refresh an earlier crawl: revisit every page in page_validators with
+    conditional requests and parse only the pages that changed. Links from
+    those to pages not seen before are followed too, but at most
+    max_new_pages of them are fetched, and their images are written only
+    while the output holds fewer than TARGET_IMAGE_COUNT images.
+
+    Each written image goes to the updates file in SAVE_DIR, unless another
+    page's record in the output already has that image_url (as in
+    collect_images). A page whose image is in the output (the metadata file
+    or an earlier update) and that is gone or has no image any more gets a
+    {"source_page": ..., "deleted": true} record instead, so the index can
+    drop what it had from that page (see apply_metadata_updates in
+    image_search_app.py).
+
+    Args:
+        max_workers (int): Pages fetched at once
+        max_new_pages (int): Pages not in page_validators to fetch, at most
+
+    Returns:
+        dict: Number of pages with each status of fetch_page_if_changed
+    """
+    global session
+    session = make_session(max_workers)
+    frontier = deque(page_validators) # Known pages: always revisited
+    new_pages = deque(url for url in urls_to_crawl if url not in page_validators)
+    known_urls = set(frontier) | set(new_pages)
+    new_pages_started = 0
+    image_pages = {entry[3]: url for url, entry in page_validators.items() if entry[3]} # image_url -> page in the output
+    images_in_output = len(image_pages)
+    counts = dict.fromkeys(('new', 'changed', 'unchanged', 'gone', 'skipped', 'failed'), 0)
+    updates_path = os.path.join(SAVE_DIR, UPDATES_FILE_NAME)
+
+    def write_record(record):
+        updates_file.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='crawler') as executor, \
+            open(updates_path, 'wb') as updates_file:
+        pending = set()
+        while True:
+            while frontier and len(pending) < 2 * max_workers:
+                pending.add(executor.submit(refetch_and_parse, frontier.popleft()))
+            while (not frontier and new_pages and len(pending) < 2 * max_workers
+                   and new_pages_started < max_new_pages and images_in_output < TARGET_IMAGE_COUNT):
+                pending.add(executor.submit(refetch_and_parse, new_pages.popleft()))
+                new_pages_started += 1
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, status, images, new_links = future.result()
+                counts[status] += 1
+                emitted = emitted_image(url)
+                if not emitted and images_in_output >= TARGET_IMAGE_COUNT:
+                    images = [] # The output is full: keep the page's validators, not its images
+                # Skip images another page in the output already has
+                images = [record for record in images if image_pages.get(record['image_url'], url) == url]
+                if status in ('new', 'changed') and images:
+                    for record in images:
+                        write_record(record)
+                    if emitted:
+                        del image_pages[emitted]
+                    image_pages[images[-1]['image_url']] = url
+                    set_emitted(url, images[-1]['image_url'])
+                    images_in_output = len(image_pages)
+                elif status in ('changed', 'gone') and emitted:
+                    write_record({'source_page': url, 'deleted': True})
+                    del image_pages[emitted]
+                    set_emitted(url, None)
+                    images_in_output = len(image_pages)
+                if status == 'gone':
+                    with visited_lock:
+                        page_validators.pop(url, None)
+                for link in new_links:
+                    if link not in known_urls:
+                        known_urls.add(link)
+                        new_pages.append(link)
+            print(f"  Queue size: {len(frontier)}, New pages: {new_pages_started}/{max_new_pages}, In flight: {len(pending)}, "
+                  f"Changed: {counts['changed'] + counts['new'] + counts['gone']}, Unchanged: {counts['unchanged']}")
+    save_validators()
+    return counts
+
+# --- Sequential Crawling Loop ---
+def crawl_sequential():
+    """One page at a time, breadth-first; collected images go to the metadata file."""
+    while urls_to_crawl and images_collected < TARGET_IMAGE_COUNT:
+        current_url = urls_to_crawl.popleft() # Get the next URL from the front (BFS)
 
         if current_url in visited_urls:
             continue # Skip if already processed
@@ -184,20 +712,10 @@ def main():
                 images, new_links = parse_page(html, current_url)
 
                 # Add found images if we haven't hit the limit and they are not duplicates
-                for img_data in images:
-                    if len(image_data_list) >= TARGET_IMAGE_COUNT:
-                        break # Stop adding images if limit reached
-
-                    # Check for duplicate image URLs before adding
-                    is_duplicate = any(existing['image_url'] == img_data['image_url'] for existing in image_data_list)
-                    if not is_duplicate:
-                        image_data_list.append(img_data)
-                        print(f"  Collected {len(image_data_list)}/{TARGET_IMAGE_COUNT} images.")
+                collect_images(images)
 
-                # Add new, unvisited links to the crawl queue
-                for link in new_links:
-                    if link not in visited_urls and link not in urls_to_crawl:
-                        urls_to_crawl.append(link)
+                # Add new, never queued links to the crawl queue
+                enqueue_links(new_links)
 
             except Exception as e:
                 print(f"  Error parsing {current_url}: {e}")
@@ -206,24 +724,86 @@ def main():
                 # traceback.print_exc()
 
         print(f"  Queue size: {len(urls_to_crawl)}, Visited: {len(visited_urls)}")
+        maybe_save_checkpoint()
 
+# --- Main ---
+def main():
+    global urls_to_crawl, queued_urls, visited_urls # Allow modification
+
+    global BASE_URL, SAVE_DIR, TARGET_IMAGE_COUNT, CHECKPOINT_INTERVAL_SECONDS, PARSER_BACKEND
+
+    parser = argparse.ArgumentParser(description="Crawl fandom wiki pages for images and their context.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Pages fetched at once (1: the sequential breadth-first crawl)")
+    parser.add_argument('--rate', type=float, default=REQUESTS_PER_SECOND_PER_HOST,
+                        help="Maximum requests per second to any one host")
+    parser.add_argument('--burst', type=int, default=BURST_PER_HOST,
+                        help="Requests a host may get back to back after being idle")
+    parser.add_argument('--target', type=int, default=TARGET_IMAGE_COUNT, help="Images to collect")
+    parser.add_argument('--base-url', help="Crawl another copy of the wiki (e.g. a local test server) instead of BASE_URL")
+    parser.add_argument('--save-dir', default=SAVE_DIR, help="Directory to save the metadata in")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue the crawl saved in --save-dir from its last checkpoint")
+    parser.add_argument('--recrawl', action='store_true',
+                        help="Refresh the crawl saved in --save-dir with conditional requests, writing only changed pages")
+    parser.add_argument('--max-new-pages', type=int, default=RECRAWL_MAX_NEW_PAGES,
+                        help="With --recrawl: pages not seen before to fetch, at most")
+    parser.add_argument('--checkpoint-interval', type=float, default=CHECKPOINT_INTERVAL_SECONDS,
+                        help="Seconds between checkpoints")
+    parser.add_argument('--parser', choices=('fast', 'soup'), default=PARSER_BACKEND,
+                        help="How pages are parsed (both give the same results; see benchmarks/bench_parse.py)")
+    args = parser.parse_args()
+
+    rate_limiter.rate = args.rate
+    rate_limiter.burst = args.burst
+    TARGET_IMAGE_COUNT = args.target
+    SAVE_DIR = args.save_dir
+    CHECKPOINT_INTERVAL_SECONDS = args.checkpoint_interval
+    PARSER_BACKEND = args.parser
+    if args.base_url:
+        BASE_URL = args.base_url.rstrip('/')
+        urls_to_crawl = deque(BASE_URL + urllib.parse.urlsplit(url).path for url in START_URLS)
+        queued_urls = set(urls_to_crawl)
 
-    print(f"\nFinished crawling.")
-    print(f"Collected data for {len(image_data_list)} images.")
+    # Create save directory if it doesn't exist
+    if not os.path.exists(SAVE_DIR):
+        os.makedirs(SAVE_DIR)
+        print(f"Created directory: {SAVE_DIR}")
 
-    # --- Save the collected data ---
-    if image_data_list:
-        data_file_path = os.path.join(SAVE_DIR, 'fandom_image_metadata.json')
-        try:
-            with open(data_file_path, 'w', encoding='utf-8') as f:
-                json.dump(image_data_list, f, indent=4, ensure_ascii=False)
-            print(f"Image metadata saved to {data_file_path}")
-        except IOError as e:
-            print(f"Error saving data to {data_file_path}: {e}")
-        except Exception as e:
-             print(f"An unexpected error occurred during saving: {e}")
-    else:
-        print("No image data collected.")
+    load_validators()
+    if args.recrawl:
+        if not page_validators:
+            print(f"No earlier crawl found in {SAVE_DIR}; run a full crawl first.")
+            return
+        print(f"Re-crawling {len(page_validators)} known pages with conditional requests.")
+        start_time = time.time()
+        counts = recrawl(args.workers, args.max_new_pages)
+        print(f"\nFinished re-crawling in {time.time() - start_time:.1f} seconds.")
+        print(", ".join(f"{status}: {count}" for status, count in counts.items()))
+        print(f"Updates saved to {os.path.join(SAVE_DIR, UPDATES_FILE_NAME)}")
+        return
+
+    open_output(resume=args.resume)
+    print(f"Starting crawl. Target: {TARGET_IMAGE_COUNT} images.")
+    print(f"Initial queue size: {len(urls_to_crawl)}")
+
+    start_time = time.time()
+    try:
+        if args.workers > 1:
+            print(f"Crawling with {args.workers} workers, at most {args.rate:g} requests/second per host.")
+            crawl_concurrent(args.workers)
+        else:
+            crawl_sequential()
+    except KeyboardInterrupt:
+        # The last checkpoint is consistent; the page being processed now may not be
+        print("\nInterrupted. Run again with --resume to continue from the last checkpoint.")
+        metadata_file.close()
+        return
+    save_checkpoint()
+    metadata_file.close()
+    print(f"\nFinished crawling in {time.time() - start_time:.1f} seconds.")
+    print(f"Collected data for {images_collected} images.")
+    print(f"Image metadata saved to {os.path.join(SAVE_DIR, METADATA_FILE_NAME)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,10 @@
+# gunicorn.conf.py
+#
+# Load the app (and the index) once in the master process, then fork the
+# workers: they share the index pages instead of each loading a copy.
+# Each worker starts its own index reload thread on its first request.
+
+import os
+
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
@@ -5,6 +5,10 @@ import json
 import pickle  # Used for saving/loading complex Python objects like the index
 import time
 import sys
+import argparse
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 # --- Assuming your A1 files are accessible ---
 # Adjust path if they are in a subdirectory like 'src'
@@ -13,6 +17,7 @@ try:
     from preprocessor import Preprocessor
     from indexer import Indexer
     from search import SearchEngine
+    from mmap_index import is_mmap_index_file, load_mmap_index, save_mmap_index
 except ImportError as e:
     print(f"Error importing assignment 1 modules: {e}")
     print("Make sure preprocessor.py, indexer.py, and search.py are in the same directory or accessible via PYTHONPATH.")
@@ -20,31 +25,108 @@ except ImportError as e:
 
 # --- Configuration ---
 METADATA_FILE = 'fandom_image_data/fandom_image_metadata.json'
+METADATA_JSONL_FILE = 'fandom_image_data/fandom_image_metadata.jsonl' # Written by the crawler; preferred when present
+INDEX_SHARD_SIZE = 1000 # Metadata items per shard in a parallel build
 INDEX_DIR = 'image_index_data' # Directory to store saved index files
-INDEX_COMPONENTS_FILE = os.path.join(INDEX_DIR, 'index_components.pkl')
+INDEX_FILE = os.path.join(INDEX_DIR, 'index.bin') # Memory-mapped binary index
+INDEX_COMPONENTS_FILE = os.path.join(INDEX_DIR, 'index_components.pkl') # Legacy pickle index
 DOC_ID_MAP_FILE = os.path.join(INDEX_DIR, 'doc_id_map.json')
+# Keep per-posting VSM weights in memory (faster VSM queries). Set to False to
+# derive them from term frequencies at query time and roughly halve the index.
+PRECOMPUTE_VSM_WEIGHTS = True
 
 # Create index directory if it doesn't exist
 os.makedirs(INDEX_DIR, exist_ok=True)
 
 # --- Index Building Function ---
-def build_index_from_json(json_file_path):
-    """Loads image metadata, builds the index using A1 code, and returns indexer + mapping."""
+def index_metadata_item(indexer, doc_id_to_metadata, doc_id, item):
+    """Adds one metadata entry to the indexer and the ID mapping. Returns False if skipped."""
+    content = item.get('context', '') # Get the text surrogate
+    image_url = item.get('image_url')
+    source_page = item.get('source_page')
+
+    if not content or not image_url:
+        print(f"Warning: Skipping item {doc_id} due to missing context or image_url.")
+        return False
+
+    # Store mapping from internal ID back to important details
+    doc_id_to_metadata[doc_id] = {
+        'image_url': image_url,
+        'source_page': source_page,
+        'alt_text': item.get('alt_text', '') # Store alt text too if needed
+    }
+
+    # Add document to the indexer (using the A1 method)
+    indexer.add_document(doc_id, content)
+    return True
+
+# --- Parallel Indexing (one Preprocessor per worker process) ---
+_worker_preprocessor = None
+
+def _init_index_worker():
+    global _worker_preprocessor
+    _worker_preprocessor = Preprocessor()
+
+def _index_shard(shard):
+    """Indexes a shard of (doc_id, item) pairs in a worker and returns its partial index."""
+    partial_indexer = Indexer(_worker_preprocessor)
+    doc_id_to_metadata = {}
+    for doc_id, item in shard:
+        index_metadata_item(partial_indexer, doc_id_to_metadata, doc_id, item)
+    return dict(partial_indexer.inverted_index), partial_indexer.document_lengths, doc_id_to_metadata
+
+def find_metadata_file():
+    """Prefer the crawler's JSONL output; fall back to the JSON array file."""
+    return METADATA_JSONL_FILE if os.path.exists(METADATA_JSONL_FILE) else METADATA_FILE
+
+def iter_metadata(json_file_path):
+    """
+    Yields metadata items one at a time. A .jsonl file (one JSON object per
+    line) is streamed, so it never has to fit in memory; other files are
+    read whole as a JSON array.
+    """
+    with open(json_file_path, 'r', encoding='utf-8') as f:
+        if not json_file_path.endswith('.jsonl'):
+            yield from json.load(f)
+            return
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # e.g. a line cut short by an interrupted crawl
+                print(f"Warning: Skipping malformed line {line_number} of {json_file_path}.")
+
+def iter_shards(items, shard_size):
+    """Groups (doc_id, item) pairs of an item iterator into lists of shard_size."""
+    shard = []
+    for pair in enumerate(items):
+        shard.append(pair)
+        if len(shard) == shard_size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+def build_index_from_json(json_file_path, workers=1):
+    """
+    Loads image metadata, builds the index using A1 code, and returns indexer + mapping.
+    With workers > 1 the metadata is split into contiguous shards that are
+    preprocessed in a process pool; the partial indexes are merged in order,
+    so the result is identical to a single-process build.
+    Items are read one at a time (see iter_metadata), so with a JSONL file
+    only the shards being processed are held in memory.
+    """
     print(f"Loading image metadata from {json_file_path}...")
-    try:
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            image_data = json.load(f)
-        print(f"Loaded {len(image_data)} image metadata entries.")
-    except FileNotFoundError:
+    if not os.path.exists(json_file_path):
         print(f"Error: Metadata file not found at {json_file_path}")
         return None, None
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON from {json_file_path}")
-        return None, None
+    image_data = iter_metadata(json_file_path)
 
     # Initialize components from Assignment 1
     preprocessor = Preprocessor()
-    indexer = Indexer(preprocessor) # Pass the preprocessor to the indexer
+    indexer = Indexer(preprocessor, precompute_vsm_weights=PRECOMPUTE_VSM_WEIGHTS) # Pass the preprocessor to the indexer
 
     # Create mapping from our simple sequential doc_id back to image details
     doc_id_to_metadata = {}
@@ -52,29 +134,37 @@ def build_index_from_json(json_file_path):
     print("Starting indexing process...")
     start_time = time.time()
 
-    # Loop through metadata and index
-    for i, item in enumerate(image_data):
-        doc_id = i # Use simple integer ID (0, 1, 2...)
-        content = item.get('context', '') # Get the text surrogate
-        image_url = item.get('image_url')
-        source_page = item.get('source_page')
-
-        if not content or not image_url:
-            print(f"Warning: Skipping item {i} due to missing context or image_url.")
-            continue
-
-        # Store mapping from internal ID back to important details
-        doc_id_to_metadata[doc_id] = {
-            'image_url': image_url,
-            'source_page': source_page,
-            'alt_text': item.get('alt_text', '') # Store alt text too if needed
-        }
-
-        # Add document to the indexer (using the A1 method)
-        indexer.add_document(doc_id, content)
+    try:
+        if workers > 1:
+            print(f"  Indexing shards of {INDEX_SHARD_SIZE} items with {workers} worker processes...")
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_index_worker) as executor:
+                # A few shards per worker keeps the pool busy without reading
+                # the whole file ahead; results are merged in shard order, so
+                # doc_ids stay in order
+                in_flight = deque()
+                shards = iter_shards(image_data, INDEX_SHARD_SIZE)
+                shard_number = 0
+                while True:
+                    for shard in itertools.islice(shards, workers * 2 - len(in_flight)):
+                        in_flight.append(executor.submit(_index_shard, shard))
+                    if not in_flight:
+                        break
+                    partial_index, partial_lengths, partial_metadata = in_flight.popleft().result()
+                    indexer.merge_partial_index(partial_index, partial_lengths)
+                    doc_id_to_metadata.update(partial_metadata)
+                    shard_number += 1
+                    print(f"  Merged shard {shard_number}...")
+        else:
+            # Loop through metadata and index
+            for i, item in enumerate(image_data):
+                doc_id = i # Use simple integer ID (0, 1, 2...)
+                index_metadata_item(indexer, doc_id_to_metadata, doc_id, item)
 
-        if (i + 1) % 100 == 0:
-            print(f"  Processed {i+1}/{len(image_data)} documents...")
+                if (i + 1) % 100 == 0:
+                    print(f"  Processed {i+1} documents...")
+    except json.JSONDecodeError:
+        print(f"Error: Could not decode JSON from {json_file_path}")
+        return None, None
 
     print(f"Initial indexing phase complete. Processed {indexer.doc_count} valid documents.")
 
@@ -89,22 +179,72 @@ def build_index_from_json(json_file_path):
 
     return indexer, doc_id_to_metadata
 
+def apply_metadata_updates(indexer, doc_id_map, updates_file_path):
+    """
+    Applies the records of a re-crawl (crawler.py --recrawl) to a finalized
+    index, matching documents by source page: a changed page's document is
+    reindexed, a new page's is added and a page marked deleted (gone, or no
+    longer showing an image) is removed. The changes are searchable at once;
+    save_index_data compacts them into the saved index.
+
+    Returns:
+        tuple: Numbers of documents (added, updated, deleted)
+    """
+    doc_ids_by_page = {metadata['source_page']: doc_id for doc_id, metadata in doc_id_map.items()}
+    next_doc_id = max(doc_id_map, default=-1) + 1
+    added = updated = deleted = 0
+    for record in iter_metadata(updates_file_path):
+        page = record.get('source_page')
+        doc_id = doc_ids_by_page.get(page)
+        if record.get('deleted'):
+            if doc_id is not None:
+                indexer.delete_document(doc_id)
+                del doc_id_map[doc_id]
+                del doc_ids_by_page[page]
+                deleted += 1
+            continue
+        if doc_id is None:
+            doc_id = next_doc_id
+            if not index_metadata_item(indexer, doc_id_map, doc_id, record):
+                continue
+            next_doc_id += 1
+            doc_ids_by_page[page] = doc_id
+            added += 1
+        elif record.get('context') and record.get('image_url'):
+            indexer.update_document(doc_id, record['context'])
+            doc_id_map[doc_id] = {
+                'image_url': record['image_url'],
+                'source_page': page,
+                'alt_text': record.get('alt_text', '')
+            }
+            updated += 1
+    return added, updated, deleted
+
 # --- Save/Load Functions ---
-def save_index_data(indexer, doc_id_map, index_file, map_file):
-    """Saves the core index data structures and the ID map."""
+def save_index_data(indexer, doc_id_map, index_file, map_file, index_format='mmap'):
+    """
+    Saves the core index data structures and the ID map.
+    index_format is 'mmap' (binary index the app can map without loading)
+    or 'pickle' (legacy format).
+    """
     print(f"Saving index components to {index_file}...")
     try:
-        # Save the necessary data structures from the indexer
-        index_data_to_save = {
-            'inverted_index': indexer.inverted_index,
-            'document_lengths': indexer.document_lengths,
-            'doc_count': indexer.doc_count,
-            'avg_doc_length': indexer.avg_doc_length,
-            'document_vectors': indexer.document_vectors, # For VSM
-            'document_norms': indexer.document_norms      # For VSM
-        }
-        with open(index_file, 'wb') as f:
-            pickle.dump(index_data_to_save, f)
+        indexer.compact() # Fold in documents added or deleted since the index was finalized
+        if index_format == 'mmap':
+            save_mmap_index(indexer, index_file)
+        else:
+            # Save the necessary data structures from the indexer
+            index_data_to_save = {
+                'inverted_index': indexer.inverted_index,
+                'document_lengths': indexer.document_lengths,
+                'doc_count': indexer.doc_count,
+                'avg_doc_length': indexer.avg_doc_length,
+                # Document vectors are not saved: VSM weights are rebuilt
+                # from the postings and the norms when the index is loaded
+                'document_norms': indexer.document_norms      # For VSM
+            }
+            with open(index_file, 'wb') as f:
+                pickle.dump(index_data_to_save, f)
         print("Index components saved successfully.")
     except Exception as e:
         print(f"Error saving index components: {e}")
@@ -112,8 +252,11 @@ def save_index_data(indexer, doc_id_map, index_file, map_file):
 
     print(f"Saving document ID mapping to {map_file}...")
     try:
-        with open(map_file, 'w', encoding='utf-8') as f:
+        # Written next to the destination and renamed into place, so a server
+        # watching for a new index never reads a half-written map
+        with open(map_file + '.tmp', 'w', encoding='utf-8') as f:
             json.dump(doc_id_map, f, indent=4)
+        os.replace(map_file + '.tmp', map_file)
         print("Document ID mapping saved successfully.")
         return True
     except IOError as e:
@@ -127,9 +270,14 @@ def save_index_data(indexer, doc_id_map, index_file, map_file):
 def load_index_data(index_file, map_file):
     """Loads the index data structures and ID map."""
     print(f"Loading index components from {index_file}...")
+    mapped_indexer = None
     try:
-        with open(index_file, 'rb') as f:
-            loaded_index_data = pickle.load(f)
+        if is_mmap_index_file(index_file):
+            # Binary index: mapped read-only, nothing to reconstruct
+            mapped_indexer = load_mmap_index(index_file, Preprocessor())
+        else:
+            with open(index_file, 'rb') as f:
+                loaded_index_data = pickle.load(f)
         print("Index components loaded.")
     except FileNotFoundError:
         print("Error: Index components file not found. Please build the index first.")
@@ -153,18 +301,21 @@ def load_index_data(index_file, map_file):
         print(f"Error loading mapping file: {e}")
         return None, None
 
+    if mapped_indexer is not None:
+        return mapped_indexer, doc_id_map, mapped_indexer.preprocessor
+
     # Reconstruct the Indexer object
     try:
         preprocessor = Preprocessor() # Need a preprocessor for the SearchEngine later
-        reconstructed_indexer = Indexer(preprocessor)
+        reconstructed_indexer = Indexer(preprocessor, precompute_vsm_weights=PRECOMPUTE_VSM_WEIGHTS)
 
         # Populate the reconstructed indexer with loaded data
         reconstructed_indexer.inverted_index = loaded_index_data['inverted_index']
         reconstructed_indexer.document_lengths = loaded_index_data['document_lengths']
         reconstructed_indexer.doc_count = loaded_index_data['doc_count']
         reconstructed_indexer.avg_doc_length = loaded_index_data['avg_doc_length']
-        reconstructed_indexer.document_vectors = loaded_index_data['document_vectors']
         reconstructed_indexer.document_norms = loaded_index_data['document_norms']
+        reconstructed_indexer.compute_search_statistics() # Query-time statistics for the models
 
         print("Indexer object reconstructed successfully.")
         return reconstructed_indexer, doc_id_map, preprocessor # Return preprocessor too
@@ -216,31 +367,54 @@ def perform_search(query_text, search_engine, model_name, doc_id_map, top_k=10):
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or load the image index and search it interactively.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Worker processes to use when building the index (default: 1)")
+    parser.add_argument('--apply-updates', metavar='UPDATES_JSONL',
+                        help="Apply a re-crawl's updates (crawler.py --recrawl) to the saved index and exit")
+    args = parser.parse_args()
+
+    if args.apply_updates:
+        existing_index_file = INDEX_FILE if os.path.exists(INDEX_FILE) else INDEX_COMPONENTS_FILE
+        indexer, doc_id_map = load_index_data(existing_index_file, DOC_ID_MAP_FILE)[:2]
+        if not indexer:
+            sys.exit(1)
+        added, updated, deleted = apply_metadata_updates(indexer, doc_id_map, args.apply_updates)
+        print(f"Applied updates: {added} added, {updated} updated, {deleted} deleted.")
+        # Written to a new file and renamed into place, so a running server reloads it
+        if not save_index_data(indexer, doc_id_map, existing_index_file, DOC_ID_MAP_FILE,
+                               index_format='mmap' if existing_index_file == INDEX_FILE else 'pickle'):
+            sys.exit(1)
+        sys.exit(0)
+
     # --- Step 1: Build or Load Index ---
     indexer = None
     doc_id_map = None
     preprocessor = None
 
-    if os.path.exists(INDEX_COMPONENTS_FILE) and os.path.exists(DOC_ID_MAP_FILE):
+    # Prefer the binary index; fall back to the legacy pickle if it hasn't been built
+    existing_index_file = INDEX_FILE if os.path.exists(INDEX_FILE) else INDEX_COMPONENTS_FILE
+
+    if os.path.exists(existing_index_file) and os.path.exists(DOC_ID_MAP_FILE):
         print("Found existing index files.")
         action = input("Load existing index (L) or Rebuild index (R)? ").strip().upper()
         if action == 'L':
-            indexer, doc_id_map, preprocessor = load_index_data(INDEX_COMPONENTS_FILE, DOC_ID_MAP_FILE)
+            indexer, doc_id_map, preprocessor = load_index_data(existing_index_file, DOC_ID_MAP_FILE)
         elif action == 'R':
-            indexer, doc_id_map = build_index_from_json(METADATA_FILE)
+            indexer, doc_id_map = build_index_from_json(find_metadata_file(), workers=args.workers)
             if indexer and doc_id_map:
-                save_index_data(indexer, doc_id_map, INDEX_COMPONENTS_FILE, DOC_ID_MAP_FILE)
-                # After saving and potentially rebuilding, we still need a preprocessor
-                preprocessor = Preprocessor()
+                save_index_data(indexer, doc_id_map, INDEX_FILE, DOC_ID_MAP_FILE)
+                # Reuse the indexer's preprocessor so queries share its stem cache
+                preprocessor = indexer.preprocessor
         else:
             print("Invalid choice. Exiting.")
             sys.exit(1)
     else:
         print("No existing index found. Building index...")
-        indexer, doc_id_map = build_index_from_json(METADATA_FILE)
+        indexer, doc_id_map = build_index_from_json(find_metadata_file(), workers=args.workers)
         if indexer and doc_id_map:
-            save_index_data(indexer, doc_id_map, INDEX_COMPONENTS_FILE, DOC_ID_MAP_FILE)
-            preprocessor = Preprocessor() # Need preprocessor after building
+            save_index_data(indexer, doc_id_map, INDEX_FILE, DOC_ID_MAP_FILE)
+            preprocessor = indexer.preprocessor # Shares the stem cache warmed while indexing
 
     # Exit if index loading/building failed
     if not indexer or not doc_id_map or not preprocessor:
@@ -1,32 +1,58 @@
 import math
+from array import array
 from collections import defaultdict, Counter
 
+from postings import LivePostings, PostingsList, PostingsStore, TermValues, DOC_ID_TYPECODE, WEIGHT_TYPECODE
+
 class Indexer:
-    def __init__(self, preprocessor):
+    def __init__(self, preprocessor, precompute_vsm_weights=True):
         """
         Initialize the indexer.
         
         Args:
             preprocessor: The preprocessor object to use for text preprocessing
+            precompute_vsm_weights (bool): Keep document vectors and per-posting
+                TF-IDF weights in memory. When False, only document norms and
+                an IDF table are kept, and VSM weights are derived from the
+                term frequencies at query time.
         """
         self.preprocessor = preprocessor
-        self.inverted_index = defaultdict(dict)  # term -> {doc_id -> term_freq}
+        self.precompute_vsm_weights = precompute_vsm_weights
+        # term -> {doc_id -> term_freq}; compacted into a PostingsStore when finalized
+        self.inverted_index = defaultdict(dict)
         self.document_lengths = {}  # doc_id -> document length (number of terms)
         self.avg_doc_length = 0
         self.doc_count = 0
         self.document_vectors = {}  # doc_id -> sparse vector of tf-idf weights
         self.document_norms = {}    # doc_id -> norm of document vector
+        self.term_weights = {}      # term -> {doc_id -> tf-idf weight} (PostingsStore)
+        self.vsm_idfs = {}          # term -> idf used by the VSM weights
+        self.total_terms = 0               # total length of the collection
+        self.collection_frequencies = {}   # term -> occurrences in the collection
+        self.docs_by_length = []           # doc_ids ordered by (length, doc_id)
+        self.bm25_upper_bounds = {}        # term -> maximum BM25 score of the term
+        self.bm25_bound_params = None      # (k1, b) the upper bounds were computed for
+        # Documents added or deleted since finalizing, as a fraction of the
+        # collection, above which the index is compacted
+        self.compaction_threshold = 0.1
         
     def add_document(self, doc_id, text):
         """
-        Process a document and add it to the index.
+        Process a document and add it to the index. On a finalized index the
+        document is searchable as soon as this returns (see add_live_document).
         
         Args:
-            doc_id: The document ID
+            doc_id (int): The document ID
             text: The document text
         """
         tokens = self.preprocessor.preprocess(text)
         
+        if self.is_finalized():
+            self.add_live_document(doc_id, tokens)
+            return
+        
+        self._ensure_mutable()
+        
         # Count term frequencies in this document
         term_freqs = Counter(tokens)
         
@@ -39,6 +65,30 @@ class Indexer:
         
         self.doc_count += 1
     
+    def merge_partial_index(self, inverted_index, document_lengths):
+        """
+        Add documents that were preprocessed and counted by another indexer,
+        e.g. one built over a shard of the collection in a worker process.
+        The doc_ids must not already be in this index.
+        
+        Args:
+            inverted_index (dict): term -> {doc_id -> term_freq} of the documents
+            document_lengths (dict): doc_id -> document length of the documents
+        """
+        self._ensure_mutable()
+        for term, doc_freq_dict in inverted_index.items():
+            self.inverted_index[term].update(doc_freq_dict)
+        self.document_lengths.update(document_lengths)
+        self.doc_count += len(document_lengths)
+    
+    def _ensure_mutable(self):
+        # A finalized index is compact and read-only; expand it to keep adding
+        if isinstance(self.inverted_index, (PostingsStore, LivePostings)):
+            self.inverted_index = defaultdict(dict, self.inverted_index.to_dict())
+        if not isinstance(self.document_lengths, dict):
+            self.document_lengths = dict(self.document_lengths.items())
+            self.document_norms = dict(self.document_norms.items())
+    
     def finalize_index(self):
         """
         Finalize the index by computing average document length
@@ -53,10 +103,192 @@ class Indexer:
         
         # Pre-compute document vectors for Vector Space Model
         self.build_document_vectors()
+        
+        # Statistics used at query time by the ranking models
+        self.compute_search_statistics()
+    
+    def is_finalized(self):
+        """Check whether the index has been finalized (compacted)."""
+        return isinstance(self.inverted_index, (PostingsStore, LivePostings))
+    
+    def _is_touched(self, term):
+        return isinstance(self.inverted_index, LivePostings) and self.inverted_index.is_touched(term)
+    
+    def _begin_live_updates(self):
+        """
+        Prepare a finalized index for add_live_document/delete_document: wrap
+        the postings in a LivePostings overlay and turn the per-document and
+        per-term statistics into dictionaries that can be updated in place.
+        """
+        if isinstance(self.inverted_index, LivePostings):
+            return
+        self.inverted_index = LivePostings(self.inverted_index)
+        self.document_lengths = dict(self.document_lengths.items())
+        self.document_norms = dict(self.document_norms.items())
+        self.vsm_idfs = dict(self.vsm_idfs.items())
+        self.collection_frequencies = dict(self.collection_frequencies.items())
+        self.docs_by_length = list(self.docs_by_length)
+        # The BM25 upper bounds no longer hold once the statistics change;
+        # WAND falls back to exhaustive scoring until the next compaction
+        self.bm25_bound_params = None
+    
+    def _length_position(self, doc_id):
+        # Position of doc_id in docs_by_length, ordered by (length, doc_id)
+        key = (self.document_lengths[doc_id], doc_id)
+        lo, hi = 0, len(self.docs_by_length)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            other = self.docs_by_length[mid]
+            if (self.document_lengths[other], other) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+    
+    def add_live_document(self, doc_id, tokens):
+        """
+        Add a preprocessed document to a finalized index without rebuilding it.
+        
+        Document count, average length, document frequencies and collection
+        frequencies are updated exactly, so BM25 and language model scores
+        match a rebuilt index. VSM weights keep the IDFs of the last
+        compaction (a term seen for the first time gets its current IDF), so
+        VSM scores drift slightly until compact() refreshes them.
+        
+        Args:
+            doc_id (int): The document ID (must not be in the index)
+            tokens (list): The preprocessed terms of the document
+            
+        Raises:
+            ValueError: If the document is already in the index
+        """
+        self._begin_live_updates()
+        if doc_id in self.document_lengths:
+            raise ValueError(f"Document {doc_id} is already indexed; use update_document")
+        
+        term_freqs = Counter(tokens)
+        self.inverted_index.add(doc_id, term_freqs)
+        self.doc_count += 1
+        self.total_terms += len(tokens)
+        self.avg_doc_length = self.total_terms / self.doc_count
+        self.document_lengths[doc_id] = len(tokens)
+        self.docs_by_length.insert(self._length_position(doc_id), doc_id)
+        
+        squared_norm = 0.0
+        vector = {}
+        for term, tf in term_freqs.items():
+            self.collection_frequencies[term] = self.collection_frequencies.get(term, 0) + tf
+            if term not in self.vsm_idfs:
+                self.vsm_idfs[term] = math.log(self.doc_count / len(self.inverted_index[term]))
+            weight = (1 + math.log(tf)) * self.vsm_idfs[term]
+            squared_norm += weight**2
+            vector[term] = weight
+        self.document_norms[doc_id] = math.sqrt(squared_norm)
+        if self.precompute_vsm_weights and self.document_vectors:
+            self.document_vectors[doc_id] = vector
+        
+        self._maybe_compact()
+    
+    def delete_document(self, doc_id):
+        """
+        Delete a document from a finalized index without rebuilding it. The
+        document's postings are tombstoned until the next compaction.
+        
+        Args:
+            doc_id (int): The document ID
+            
+        Returns:
+            bool: True if the document was in the index
+        """
+        if not self.is_finalized():
+            raise ValueError("delete_document requires a finalized index")
+        self._begin_live_updates()
+        if doc_id not in self.document_lengths:
+            return False
+        
+        term_freqs = self.inverted_index.document_terms(doc_id)
+        self.inverted_index.remove(doc_id, term_freqs)
+        doc_length = self.document_lengths[doc_id]
+        del self.docs_by_length[self._length_position(doc_id)]
+        del self.document_lengths[doc_id]
+        self.document_norms.pop(doc_id, None)
+        self.document_vectors.pop(doc_id, None)
+        self.doc_count -= 1
+        self.total_terms -= doc_length
+        self.avg_doc_length = self.total_terms / self.doc_count if self.doc_count else 0
+        for term, tf in term_freqs.items():
+            self.collection_frequencies[term] -= tf
+            if not self.collection_frequencies[term]:
+                del self.collection_frequencies[term]
+        
+        self._maybe_compact()
+        return True
+    
+    def update_document(self, doc_id, text):
+        """
+        Replace the text of a document in a finalized index (or add it if it
+        is not indexed yet).
+        
+        Args:
+            doc_id (int): The document ID
+            text: The new document text
+        """
+        tokens = self.preprocessor.preprocess(text)
+        self.delete_document(doc_id)
+        self.add_live_document(doc_id, tokens)
+    
+    def pending_updates(self):
+        """Number of documents added or deleted since the last compaction."""
+        if isinstance(self.inverted_index, LivePostings):
+            return self.inverted_index.pending_updates()
+        return 0
+    
+    def _maybe_compact(self):
+        if self.pending_updates() > self.compaction_threshold * max(self.doc_count, 1):
+            self.compact()
+    
+    def compact(self):
+        """
+        Fold added and deleted documents into fresh compact postings and
+        recompute every statistic (VSM IDFs and norms, BM25 upper bounds),
+        as finalize_index does. Documents are not preprocessed again.
+        """
+        if not isinstance(self.inverted_index, LivePostings):
+            return
+        self.compact_postings()
+        if self.doc_count == 0:
+            self.avg_doc_length = 0
+            self.document_norms = {}
+            self.compute_search_statistics()
+            return
+        self.finalize_index()
+    
+    def compute_search_statistics(self):
+        """
+        Compute the statistics the search models rely on at query time.
+        Called by finalize_index, and after loading a saved index.
+        """
+        self.compact_postings()
+        self.build_term_weights()
+        self.compute_collection_statistics()
+        self.compute_bm25_upper_bounds()
+    
+    def compact_postings(self):
+        """
+        Convert the dict-of-dicts built by add_document into a compact
+        PostingsStore: doc_ids sorted per term in flat arrays, with parallel
+        term frequencies.
+        """
+        if isinstance(self.inverted_index, LivePostings):
+            self.inverted_index = self.inverted_index.compact()
+        elif not isinstance(self.inverted_index, PostingsStore):
+            self.inverted_index = PostingsStore.from_dict(self.inverted_index)
     
     def build_document_vectors(self):
         """
-        Build TF-IDF document vectors for the Vector Space Model.
+        Build TF-IDF document vectors for the Vector Space Model. The
+        vectors are only kept when precompute_vsm_weights is set; their
+        norms are always kept.
         """
         # For each term, calculate IDF
         idfs = {}
@@ -64,22 +296,136 @@ class Indexer:
             df = len(doc_freq_dict)  # Document frequency
             idfs[term] = math.log(self.doc_count / df)
         
-        # For each document, build its TF-IDF vector
-        for doc_id in self.document_lengths:
-            vector = {}
-            
-            for term, idf in idfs.items():
-                if doc_id in self.inverted_index[term]:
-                    tf = self.inverted_index[term][doc_id]
-                    # Using log normalization for TF
-                    if tf > 0:
-                        normalized_tf = 1 + math.log(tf)
-                        vector[term] = normalized_tf * idf
-            
-            self.document_vectors[doc_id] = vector
+        # Single pass over the postings: each posting adds its TF-IDF weight
+        # to its document's vector and squared norm
+        squared_norms = dict.fromkeys(self.document_lengths, 0.0)
+        vectors = {doc_id: {} for doc_id in self.document_lengths} if self.precompute_vsm_weights else None
+        for term, doc_freq_dict in self.inverted_index.items():
+            idf = idfs[term]
+            for doc_id, tf in doc_freq_dict.items():
+                # Using log normalization for TF
+                if tf > 0:
+                    weight = (1 + math.log(tf)) * idf
+                    squared_norms[doc_id] += weight**2
+                    if vectors is not None:
+                        vectors[doc_id][term] = weight
+        
+        if vectors is not None:
+            self.document_vectors = vectors
+        
+        # Calculate document vector norms
+        self.document_norms = {doc_id: math.sqrt(sq) for doc_id, sq in squared_norms.items()}
+    
+    def build_term_weights(self):
+        """
+        Build the VSM IDF table and, unless weights are derived on demand,
+        per-posting TF-IDF weights so VSM queries only need to walk the
+        postings of the query terms. Uses the same weighting as
+        build_document_vectors, stored in an array parallel to the postings.
+        """
+        self.vsm_idfs = {
+            term: math.log(self.doc_count / len(doc_freq_dict))
+            for term, doc_freq_dict in self.inverted_index.items()
+        }
+        if not self.precompute_vsm_weights:
+            self.term_weights = {}
+            return
+        weights = array(WEIGHT_TYPECODE)
+        for term, doc_freq_dict in self.inverted_index.items():
+            weights.extend(self._vsm_weights(doc_freq_dict.values(), self.vsm_idfs[term]))
+        self.term_weights = self.inverted_index.with_values(weights)
+    
+    @staticmethod
+    def _vsm_weights(term_freqs, idf):
+        # Log-normalized TF times IDF, as in build_document_vectors
+        return ((1 + math.log(tf)) * idf if tf > 0 else 0.0 for tf in term_freqs)
+    
+    def compute_collection_statistics(self):
+        """
+        Compute the collection length, per-term collection frequencies and
+        the length ordering of documents used by language model scoring.
+        """
+        self.total_terms = sum(self.document_lengths.values())
+        self.collection_frequencies = {
+            term: sum(doc_freq_dict.values())
+            for term, doc_freq_dict in self.inverted_index.items()
+        }
+        self.docs_by_length = sorted(
+            self.document_lengths, key=lambda doc_id: (self.document_lengths[doc_id], doc_id)
+        )
+    
+    def compute_bm25_upper_bounds(self, k1=1.2, b=0.75):
+        """
+        Compute, for every term, the highest BM25 score it contributes to any
+        document. WAND uses these bounds to skip documents that cannot enter
+        the top results.
+        
+        Args:
+            k1 (float): Term frequency saturation parameter
+            b (float): Document length normalization parameter
+        """
+        self.bm25_upper_bounds = {}
+        self.bm25_bound_params = (k1, b)
+        if self.doc_count == 0 or self.avg_doc_length == 0:
+            return
+        n = self.doc_count
+        for term, doc_freq_dict in self.inverted_index.items():
+            df = len(doc_freq_dict)
+            idf = math.log((n - df + 0.5) / (df + 0.5) + 1.0)
+            max_score = 0.0
+            for doc_id, tf in doc_freq_dict.items():
+                doc_length = self.document_lengths[doc_id]
+                numerator = tf * (k1 + 1)
+                denominator = tf + k1 * (1 - b + b * doc_length / self.avg_doc_length)
+                score = idf * (numerator / denominator)
+                if score > max_score:
+                    max_score = score
+            self.bm25_upper_bounds[term] = max_score
+    
+    def freeze(self):
+        """
+        Move the per-document and per-term statistics of a finalized index
+        from dictionaries into flat arrays indexed like the postings (the
+        layout of a memory-mapped index). Worker processes forked after
+        freezing share these pages with the parent: reading an array element
+        does not write to the shared memory the way the reference counts of
+        millions of dict entries do. Lookups become binary searches.
+        Adding or deleting a document thaws them again.
+        """
+        self.compact()
+        self.compact_postings()
+        store = self.inverted_index
+        terms = list(store)  # In term number order
+        
+        doc_ids = array(DOC_ID_TYPECODE, sorted(self.document_lengths))
+        self.document_lengths = PostingsList(doc_ids, array('i', (self.document_lengths[doc_id] for doc_id in doc_ids)))
+        self.document_norms = PostingsList(doc_ids, array('d', (self.document_norms.get(doc_id, 0.0) for doc_id in doc_ids)))
+        self.document_vectors = {}
+        self.vsm_idfs = TermValues(store.lexicon, array('d', (self.vsm_idfs[term] for term in terms)))
+        self.collection_frequencies = TermValues(
+            store.lexicon, array('q', (self.collection_frequencies.get(term, 0) for term in terms)))
+        self.bm25_upper_bounds = TermValues(
+            store.lexicon, array('d', (self.bm25_upper_bounds.get(term, 0.0) for term in terms)))
+        self.docs_by_length = array(DOC_ID_TYPECODE, self.docs_by_length)
+    
+    def get_weights_for_term(self, term):
+        """
+        Get the TF-IDF weight of the given term in every document containing it.
+        
+        Args:
+            term: The term to look up
             
-            # Calculate document vector norm
-            self.document_norms[doc_id] = math.sqrt(sum(w**2 for w in vector.values()))
+        Returns:
+            dict: Dictionary mapping doc_id to TF-IDF weight
+        """
+        if term in self.term_weights and not self._is_touched(term):
+            return self.term_weights[term]
+        if term not in self.vsm_idfs:
+            return {}
+        # Weights are not stored: derive them from the term frequencies
+        postings = self.inverted_index[term]
+        weights = array(WEIGHT_TYPECODE, self._vsm_weights(postings.values(), self.vsm_idfs[term]))
+        return PostingsList(postings.doc_ids, weights)
     
     def get_doc_count_for_term(self, term):
         """
@@ -93,6 +439,18 @@ class Indexer:
         """
         return len(self.inverted_index.get(term, {}))
     
+    def get_collection_frequency(self, term):
+        """
+        Get the total number of occurrences of the given term in the collection.
+        
+        Args:
+            term: The term to look up
+            
+        Returns:
+            int: Collection frequency of the term, or 0 if not found
+        """
+        return self.collection_frequencies.get(term, 0)
+    
     def get_term_frequency(self, term, doc_id):
         """
         Get the frequency of a term in a specific document.
@@ -0,0 +1,156 @@
+# metrics.py
+#
+# Minimal in-process metrics (histograms, and counters and gauges read from
+# callbacks) rendered in the Prometheus text exposition format, without a
+# client library. Values are per process: with several gunicorn workers, a
+# scrape sees the worker that answered it.
+
+import bisect
+import threading
+import time
+
+# Seconds; searches range from well under a millisecond to seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+POSTINGS_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        """
+        Args:
+            name (str): Metric name
+            help_text (str): Description shown in the exposition
+            label_names (tuple): Names of the labels; observe() takes their values
+            buckets (tuple): Ascending upper bounds of the buckets
+        """
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        """Record one observation for a tuple of label values."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in sorted(series_items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                bucket_labels = _format_labels(self.label_names, labels, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{label_text} {series[-1]}")
+        return lines
+
+
+class CallbackMetric:
+    """A counter or gauge whose values are read from a function at scrape time."""
+
+    def __init__(self, name, help_text, metric_type, label_names, read_values):
+        """
+        Args:
+            name (str): Metric name
+            help_text (str): Description shown in the exposition
+            metric_type (str): 'counter' or 'gauge'
+            label_names (tuple): Names of the labels
+            read_values: Function returning {label values tuple: value}
+        """
+        self.name = name
+        self.help_text = help_text
+        self.metric_type = metric_type
+        self.label_names = tuple(label_names)
+        self.read_values = read_values
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        for labels, value in sorted(self.read_values().items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, label_names, buckets))
+
+    def callback(self, name, help_text, metric_type, label_names, read_values):
+        return self.register(CallbackMetric(name, help_text, metric_type, label_names, read_values))
+
+    def render(self):
+        """Render every metric in the Prometheus text format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class SearchMetrics:
+    """Per-stage timings and postings counts recorded by SearchEngine."""
+
+    def __init__(self, registry):
+        self.stage_seconds = registry.histogram(
+            'search_stage_seconds', 'Time spent in each stage of a search', ('model', 'stage'))
+        self.postings_touched = registry.histogram(
+            'search_postings_touched', 'Postings read by one search', ('model',), POSTINGS_BUCKETS)
+
+    def trace(self, model):
+        """Start timing one search."""
+        return SearchTrace(self, model)
+
+
+class SearchTrace:
+    """
+    Times consecutive stages of one search: mark(stage) records the time
+    since the previous mark (or since the trace started) under that stage.
+    """
+    __slots__ = ('metrics', 'model', 'last', 'postings')
+
+    def __init__(self, metrics, model):
+        self.metrics = metrics
+        self.model = model
+        self.postings = 0
+        self.last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.metrics.stage_seconds.observe((self.model, stage), now - self.last)
+        self.last = now
+
+    def finish(self):
+        self.metrics.postings_touched.observe((self.model,), self.postings)
@@ -0,0 +1,251 @@
+# mmap_index.py
+#
+# Versioned binary index format that can be memory-mapped. Opening an index
+# maps the file read-only and wraps its sections in array views, so nothing is
+# deserialized and every process opening the same file shares its pages
+# through the OS page cache.
+#
+# Layout (all sections 8-byte aligned, native byte order recorded in header):
+#   header | section table | sections...
+# Terms are stored sorted, so the lexicon is searched in place.
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+
+from indexer import Indexer
+from postings import PostingsList, PostingsStore, TermValues, DOC_ID_TYPECODE, TF_TYPECODE, WEIGHT_TYPECODE
+
+MAGIC = b'IMGSRCH\x00'
+FORMAT_VERSION = 2
+
+# magic, version, byte order, doc_count, num_docs, num_terms, num_postings,
+# total_terms, avg_doc_length, bm25 k1, bm25 b
+HEADER = struct.Struct('<8sIcxxxqqqqqddd')
+
+# (name, typecode) of every section, in file order
+SECTIONS = [
+    ('term_offsets', 'q'),            # num_terms + 1 offsets into term_blob
+    ('term_blob', 'B'),               # sorted UTF-8 terms, concatenated
+    ('postings_offsets', 'q'),        # num_terms + 1 offsets into the postings
+    ('postings_doc_ids', DOC_ID_TYPECODE),
+    ('postings_tfs', TF_TYPECODE),
+    ('postings_weights', WEIGHT_TYPECODE),  # VSM TF-IDF weight per posting (may be empty)
+    ('vsm_idfs', 'd'),                # per term
+    ('collection_frequencies', 'q'),  # per term
+    ('bm25_upper_bounds', 'd'),       # per term
+    ('doc_ids', DOC_ID_TYPECODE),     # sorted doc_ids
+    ('doc_lengths', 'i'),             # parallel to doc_ids
+    ('doc_norms', 'd'),               # parallel to doc_ids
+    ('docs_by_length', DOC_ID_TYPECODE),
+]
+SECTION_TABLE = struct.Struct('<' + 'qq' * len(SECTIONS))
+
+BYTE_ORDER = b'<' if sys.byteorder == 'little' else b'>'
+
+
+class MappedLexicon(Mapping):
+    """
+    Read-only term -> term number mapping over a sorted, concatenated
+    term blob. Lookups binary search the blob in place.
+    """
+
+    def __init__(self, term_offsets, term_blob):
+        self.term_offsets = term_offsets
+        self.term_blob = term_blob
+
+    def _term_bytes(self, i):
+        return bytes(self.term_blob[self.term_offsets[i]:self.term_offsets[i + 1]])
+
+    def term_at(self, i):
+        return self._term_bytes(i).decode('utf-8')
+
+    def _find(self, term):
+        if not isinstance(term, str):
+            return -1
+        key = term.encode('utf-8')
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self._term_bytes(lo) == key:
+            return lo
+        return -1
+
+    def __getitem__(self, term):
+        i = self._find(term)
+        if i < 0:
+            raise KeyError(term)
+        return i
+
+    def __contains__(self, term):
+        return self._find(term) >= 0
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.term_at(i)
+
+    def __len__(self):
+        return len(self.term_offsets) - 1
+
+    def items(self):
+        return ((self.term_at(i), i) for i in range(len(self)))
+
+
+def is_mmap_index_file(path):
+    """Check whether a file starts with the binary index magic bytes."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def _pad(f):
+    """Pad the file to the next 8-byte boundary."""
+    padding = -f.tell() % 8
+    if padding:
+        f.write(b'\x00' * padding)
+
+
+def save_mmap_index(indexer, index_file):
+    """
+    Write a finalized indexer to the binary index format.
+
+    The file is written next to its destination and renamed into place, so
+    processes that already mapped the old file keep a consistent view.
+
+    Args:
+        indexer: The finalized Indexer (doc_ids must be integers)
+        index_file (str): Path of the index file to write
+    """
+    indexer.compact()
+    indexer.compact_postings()
+    store = indexer.inverted_index
+    terms = sorted(store)
+
+    term_blob = bytearray()
+    term_offsets = array('q', [0])
+    postings_offsets = array('q', [0])
+    postings_doc_ids = array(DOC_ID_TYPECODE)
+    postings_tfs = array(TF_TYPECODE)
+    postings_weights = array(WEIGHT_TYPECODE)
+    vsm_idfs = array('d')
+    collection_frequencies = array('q')
+    bm25_upper_bounds = array('d')
+    for term in terms:
+        term_blob.extend(term.encode('utf-8'))
+        term_offsets.append(len(term_blob))
+        postings = store[term]
+        postings_doc_ids.extend(postings.doc_ids)
+        postings_tfs.extend(postings.values())
+        if indexer.precompute_vsm_weights:
+            postings_weights.extend(indexer.get_weights_for_term(term).values())
+        postings_offsets.append(len(postings_doc_ids))
+        vsm_idfs.append(indexer.vsm_idfs[term])
+        collection_frequencies.append(indexer.get_collection_frequency(term))
+        bm25_upper_bounds.append(indexer.bm25_upper_bounds.get(term, 0.0))
+
+    doc_ids = array(DOC_ID_TYPECODE, sorted(indexer.document_lengths))
+    doc_lengths = array('i', (indexer.document_lengths[doc_id] for doc_id in doc_ids))
+    doc_norms = array('d', (indexer.document_norms.get(doc_id, 0.0) for doc_id in doc_ids))
+    docs_by_length = array(DOC_ID_TYPECODE, indexer.docs_by_length)
+
+    sections = {
+        'term_offsets': term_offsets,
+        'term_blob': array('B', term_blob),
+        'postings_offsets': postings_offsets,
+        'postings_doc_ids': postings_doc_ids,
+        'postings_tfs': postings_tfs,
+        'postings_weights': postings_weights,
+        'vsm_idfs': vsm_idfs,
+        'collection_frequencies': collection_frequencies,
+        'bm25_upper_bounds': bm25_upper_bounds,
+        'doc_ids': doc_ids,
+        'doc_lengths': doc_lengths,
+        'doc_norms': doc_norms,
+        'docs_by_length': docs_by_length,
+    }
+    k1, b = indexer.bm25_bound_params or (0.0, 0.0)
+
+    tmp_file = index_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(HEADER.pack(
+            MAGIC, FORMAT_VERSION, BYTE_ORDER,
+            indexer.doc_count, len(doc_ids), len(terms), len(postings_doc_ids),
+            indexer.total_terms, indexer.avg_doc_length, k1, b,
+        ))
+        table_position = f.tell()
+        f.write(b'\x00' * SECTION_TABLE.size)
+        table = []
+        for name, _ in SECTIONS:
+            _pad(f)
+            start = f.tell()
+            sections[name].tofile(f)
+            table.extend((start, f.tell() - start))
+        f.seek(table_position)
+        f.write(SECTION_TABLE.pack(*table))
+    os.replace(tmp_file, index_file)
+
+
+def load_mmap_index(index_file, preprocessor):
+    """
+    Open a binary index file and return an Indexer backed by it.
+
+    Args:
+        index_file (str): Path of the index file
+        preprocessor: The preprocessor to attach to the indexer
+
+    Returns:
+        Indexer: A read-only indexer whose data lives in the mapped file
+
+    Raises:
+        ValueError: If the file is not a compatible binary index
+    """
+    with open(index_file, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    (magic, version, byte_order, doc_count, num_docs, num_terms, num_postings,
+     total_terms, avg_doc_length, k1, b) = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{index_file} is not a binary index file")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format version {version} (expected {FORMAT_VERSION}); "
+                         "rebuild the index")
+    if byte_order != BYTE_ORDER:
+        raise ValueError("Index file was written on a machine with a different byte order")
+
+    table = SECTION_TABLE.unpack_from(mapped, HEADER.size)
+    buffer = memoryview(mapped)
+    views = {}
+    for i, (name, typecode) in enumerate(SECTIONS):
+        start, length = table[2 * i], table[2 * i + 1]
+        views[name] = buffer[start:start + length].cast(typecode)
+
+    lexicon = MappedLexicon(views['term_offsets'], views['term_blob'])
+    store = PostingsStore(lexicon, views['postings_offsets'],
+                          views['postings_doc_ids'], views['postings_tfs'])
+
+    # Weights are only stored when the index was built with precomputed weights
+    has_weights = len(views['postings_weights']) == num_postings
+    indexer = Indexer(preprocessor, precompute_vsm_weights=has_weights)
+    indexer.inverted_index = store
+    if has_weights:
+        indexer.term_weights = store.with_values(views['postings_weights'])
+    indexer.vsm_idfs = TermValues(lexicon, views['vsm_idfs'])
+    indexer.document_lengths = PostingsList(views['doc_ids'], views['doc_lengths'])
+    indexer.document_norms = PostingsList(views['doc_ids'], views['doc_norms'])
+    indexer.doc_count = doc_count
+    indexer.avg_doc_length = avg_doc_length
+    indexer.total_terms = total_terms
+    indexer.collection_frequencies = TermValues(lexicon, views['collection_frequencies'])
+    indexer.docs_by_length = views['docs_by_length']
+    indexer.bm25_upper_bounds = TermValues(lexicon, views['bm25_upper_bounds'])
+    indexer.bm25_bound_params = (k1, b)
+    return indexer
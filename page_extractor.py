@@ -0,0 +1,305 @@
+# page_extractor.py
+#
+# Fast extraction of the parts of a wiki page that crawler.parse_page reads
+# (the title, the infobox image and caption, the first paragraphs of the
+# article body and the links in the content area), without building a
+# BeautifulSoup tree. PageExtractor is a subclass of the standard library's
+# html.parser.HTMLParser, the parser behind BeautifulSoup(html,
+# 'html.parser'), and turns its events into elements the way Beautiful Soup
+# does, so entities, attributes, void elements and stray or missing end tags
+# come out the same; instead of a Tag or NavigableString per node it keeps
+# only the stack of open elements and the text and links parse_page needs.
+# crawler.py builds the tree instead if extraction fails for any reason.
+
+import re
+from collections import namedtuple
+from html.entities import html5
+from html.parser import HTMLParser
+
+MAX_PARAGRAPHS = 5 # parse_page reads the first five paragraphs of the article body
+BLOCK_CHILD_TAGS = frozenset(['table', 'div', 'aside', 'navbox']) # Paragraphs with one of these as a child are layout
+# Elements Beautiful Soup closes as soon as they open (HTMLTreeBuilder.empty_element_tags)
+VOID_ELEMENTS = frozenset(['area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr',
+                           'image', 'img', 'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid',
+                           'param', 'source', 'spacer', 'track', 'wbr'])
+# Elements whose text Beautiful Soup keeps out of get_text() (HTMLTreeBuilder.DEFAULT_STRING_CONTAINERS)
+STRING_CONTAINER_TAGS = frozenset(['rt', 'rp', 'style', 'script', 'template'])
+
+# title: text of the first h1#firstHeading, or None
+# image: attributes of the infobox image, or None (parse_page reads src, data-src and alt)
+# caption: text of the infobox figure's figcaption, or None
+# paragraphs: text of each of the first five p directly under div.mw-parser-output, except layout paragraphs
+# hrefs: href of every a in div#mw-content-text (or else body), in document order
+PageParts = namedtuple('PageParts', ['title', 'image', 'caption', 'paragraphs', 'hrefs'])
+
+_class_names = re.compile(r'\S+').findall # How Beautiful Soup splits the class attribute
+_decimal_reference = re.compile(r'([0-9]+)(.*)', re.DOTALL)
+_hex_reference = re.compile(r'([0-9a-f]+)(.*)', re.DOTALL)
+
+
+def _has_class(attrs, class_name):
+    value = attrs.get('class')
+    return value is not None and class_name in _class_names(value)
+
+
+def _numeric_reference(number):
+    """The character of &#number; as Beautiful Soup resolves it (UnicodeDammit.numeric_character_reference)."""
+    if number == 0 or number > 0x10ffff or 0xd800 <= number <= 0xdfff:
+        return '\ufffd'
+    if 0x80 <= number <= 0x9f:
+        try:
+            return bytes([number]).decode('cp1252') # Windows-1252 bytes written as references
+        except UnicodeDecodeError:
+            pass
+    return chr(number)
+
+
+class _Element:
+    __slots__ = ('name', 'tracked', 'text', 'hrefs', 'block_child')
+
+    def __init__(self, name):
+        self.name = name
+        self.tracked = False
+        self.text = None # Stripped strings, for the elements whose text is wanted
+        self.hrefs = None # Link targets, for the content area candidates
+        self.block_child = False
+
+
+class PageExtractor(HTMLParser):
+    """
+    An HTMLParser that handles its events like Beautiful Soup's html.parser
+    builder: character and entity references become text, duplicate
+    attributes keep the last value, void elements close at once, and
+    elements open and close by the rules of BeautifulSoup.handle_starttag,
+    handle_endtag and endData. Instead of building the tree it records what
+    parse_page would find in it.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False) # As Beautiful Soup parses: references arrive as events
+        self.already_closed_void_elements = [] # Void elements whose end tag, if one follows, is ignored
+        self.stack = [] # Open elements, innermost last
+        self.current_data = []
+        self.open_string_containers = 0 # Text inside script, style, etc. is not part of get_text()
+        self.text_targets = [] # Open elements collecting text
+        self.link_targets = [] # Open elements collecting links
+        self.title = None
+        self.infobox = None
+        self.figure = None
+        self.in_infobox = False
+        self.in_figure = False
+        self.infobox_image = None
+        self.figure_image = None
+        self.caption = None
+        self.content_body = None
+        self.paragraphs = []
+        self.content_text = None
+        self.body = None
+
+    # --- HTMLParser events ---
+
+    def handle_starttag(self, tag, attrs):
+        self._open(tag, dict((key, '' if value is None else value) for key, value in attrs))
+        if tag in VOID_ELEMENTS:
+            self._close(tag)
+            self.already_closed_void_elements.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        # <tag/>: opened and closed, whatever the tag
+        self._open(tag, dict((key, '' if value is None else value) for key, value in attrs))
+        self._close(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.already_closed_void_elements:
+            self.already_closed_void_elements.remove(tag)
+        else:
+            self._close(tag)
+
+    def handle_data(self, data):
+        self.current_data.append(data)
+
+    def handle_charref(self, name):
+        if name[:1] in ('x', 'X'):
+            number, base, reference = name[1:], 16, _hex_reference
+        else:
+            number, base, reference = name, 10, _decimal_reference
+        try:
+            self.current_data.append(_numeric_reference(int(number, base)))
+        except ValueError:
+            # Like Beautiful Soup: the leading digits are the reference, the rest is text
+            match = reference.match(number)
+            if match is None:
+                self.current_data.append(number)
+            else:
+                self.current_data.append(_numeric_reference(int(match.group(1), base)))
+                self.current_data.append(match.group(2))
+
+    def handle_entityref(self, name):
+        character = html5.get(name + ';', html5.get(name))
+        self.current_data.append(character if character is not None else '&' + name)
+
+    def handle_comment(self, data):
+        self._end_data()
+        self.current_data.append(data)
+        self._end_data(is_text=False)
+
+    def handle_decl(self, decl):
+        self.handle_comment(decl) # A doctype: not text either
+
+    def handle_pi(self, data):
+        self.handle_comment(data)
+
+    def unknown_decl(self, data):
+        self._end_data()
+        if data.upper().startswith('CDATA['):
+            self.current_data.append(data[len('CDATA['):])
+            self._end_data(is_text=True) # CData is text, even inside a script or style
+        else:
+            self.current_data.append(data)
+            self._end_data(is_text=False)
+
+    # --- Elements ---
+
+    def _open(self, name, attrs):
+        self._end_data()
+        parent = self.stack[-1] if self.stack else None
+        element = _Element(name)
+
+        if name == 'a':
+            if self.link_targets and 'href' in attrs:
+                href = attrs['href']
+                for target in self.link_targets:
+                    target.hrefs.append(href)
+        elif name == 'p':
+            if parent is not None and parent is self.content_body and len(self.paragraphs) < MAX_PARAGRAPHS:
+                self._collect_text(element)
+                self.paragraphs.append(element)
+        elif name == 'img':
+            if self.in_infobox and self.infobox_image is None:
+                self.infobox_image = attrs
+            if self.in_figure and self.figure_image is None:
+                self.figure_image = attrs
+        elif name == 'div':
+            if self.content_body is None and _has_class(attrs, 'mw-parser-output'):
+                self.content_body = element
+            if self.content_text is None and attrs.get('id') == 'mw-content-text':
+                self.content_text = element
+                self._collect_links(element)
+        elif name == 'h1':
+            if self.title is None and attrs.get('id') == 'firstHeading':
+                self.title = element
+                self._collect_text(element)
+        elif name == 'aside':
+            if self.infobox is None and _has_class(attrs, 'portable-infobox'):
+                self.infobox = element
+                self.in_infobox = element.tracked = True
+        elif name == 'figure':
+            if self.in_infobox and self.figure is None:
+                self.figure = element
+                self.in_figure = element.tracked = True
+        elif name == 'figcaption':
+            if self.in_figure and self.caption is None:
+                self.caption = element
+                self._collect_text(element)
+        elif name == 'body':
+            if self.body is None:
+                self.body = element
+                self._collect_links(element)
+
+        if name in BLOCK_CHILD_TAGS and parent is not None and parent.text is not None:
+            parent.block_child = True # Only read for paragraphs
+        if name in STRING_CONTAINER_TAGS:
+            self.open_string_containers += 1
+        self.stack.append(element)
+
+    def _close(self, name):
+        self._end_data()
+        stack = self.stack
+        # Close the innermost open element of that name and everything inside
+        # it; an end tag with no open element is ignored
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i].name == name:
+                while len(stack) > i:
+                    self._pop()
+                return
+
+    def _end_data(self, is_text=None):
+        """
+        Args:
+            is_text: Whether the pending data is text (for get_text()); None
+                for character data, which is text outside string containers
+        """
+        if not self.current_data:
+            return
+        text = ''.join(self.current_data)
+        self.current_data = []
+        # Comments, doctypes and the like, and the text of string containers,
+        # are not NavigableStrings and get_text() leaves them out
+        if is_text is None:
+            is_text = not self.open_string_containers
+        if self.text_targets and is_text:
+            text = text.strip()
+            if text:
+                for target in self.text_targets:
+                    target.text.append(text)
+
+    def _collect_text(self, element):
+        element.text = []
+        element.tracked = True
+        self.text_targets.append(element)
+
+    def _collect_links(self, element):
+        element.hrefs = []
+        element.tracked = True
+        self.link_targets.append(element)
+
+    def _pop(self):
+        element = self.stack.pop()
+        if element.name in STRING_CONTAINER_TAGS:
+            self.open_string_containers -= 1
+        if element.tracked:
+            if element.text is not None:
+                self.text_targets.remove(element)
+            if element.hrefs is not None:
+                self.link_targets.remove(element)
+            if element is self.infobox:
+                self.in_infobox = False
+            if element is self.figure:
+                self.in_figure = False
+
+    def page_parts(self):
+        """
+        Returns:
+            PageParts: What parse_page reads from the page fed so far
+        """
+        self._end_data()
+        image = caption = None
+        if self.infobox is not None:
+            if self.figure is not None:
+                image = self.figure_image
+                if self.caption is not None:
+                    caption = ''.join(self.caption.text)
+            else:
+                image = self.infobox_image
+        paragraphs = [''.join(p.text) for p in self.paragraphs if not p.block_child]
+        content_area = self.content_text or self.body
+        hrefs = content_area.hrefs if content_area is not None else []
+        title = ''.join(self.title.text) if self.title is not None else None
+        return PageParts(title, image, caption, paragraphs, hrefs)
+
+
+def extract_page_parts(html_content):
+    """
+    Read the parts parse_page needs from a page, as they are in
+    BeautifulSoup(html_content, 'html.parser').
+
+    Args:
+        html_content (str): The page's HTML
+
+    Returns:
+        PageParts: The page's title, infobox image, caption, paragraphs and links
+    """
+    extractor = PageExtractor()
+    extractor.feed(html_content)
+    extractor.close()
+    return extractor.page_parts()
@@ -0,0 +1,396 @@
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping
+
+# Typecodes of the postings arrays (4-byte signed ints, 8-byte floats)
+DOC_ID_TYPECODE = 'i'
+TF_TYPECODE = 'i'
+WEIGHT_TYPECODE = 'd'
+
+
+class PostingsList(Mapping):
+    """
+    Read-only view of one term's postings: doc_id -> value (term frequency
+    or weight). Backed by slices of the store's arrays, so no per-posting
+    Python objects are kept alive.
+    """
+    __slots__ = ('doc_ids', 'data')
+
+    def __init__(self, doc_ids, data):
+        """
+        Args:
+            doc_ids: Sorted sequence of doc_ids (memoryview slice)
+            data: Parallel sequence of values (memoryview slice)
+        """
+        self.doc_ids = doc_ids
+        self.data = data
+
+    def __getitem__(self, doc_id):
+        i = bisect_left(self.doc_ids, doc_id)
+        if i < len(self.doc_ids) and self.doc_ids[i] == doc_id:
+            return self.data[i]
+        raise KeyError(doc_id)
+
+    def __contains__(self, doc_id):
+        i = bisect_left(self.doc_ids, doc_id)
+        return i < len(self.doc_ids) and self.doc_ids[i] == doc_id
+
+    def __iter__(self):
+        return iter(self.doc_ids)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def items(self):
+        return zip(self.doc_ids, self.data)
+
+    def values(self):
+        return self.data
+
+
+class PostingsStore(Mapping):
+    """
+    Compact, read-only inverted index: term -> PostingsList.
+
+    All postings live in two flat arrays (doc_ids sorted within each term,
+    and a parallel array of values). The lexicon maps each term to its
+    position, and offsets[i]:offsets[i + 1] is the slice of term i.
+    """
+
+    def __init__(self, lexicon, offsets, doc_ids, values):
+        """
+        Args:
+            lexicon (dict): term -> term number
+            offsets: Sequence of len(lexicon) + 1 postings offsets
+            doc_ids: Flat sequence of doc_ids
+            values: Flat sequence of values parallel to doc_ids
+        """
+        self.lexicon = lexicon
+        self.offsets = offsets
+        self.doc_id_array = doc_ids
+        self.value_array = values
+        # Memoryviews make slicing a term's postings copy-free
+        self._doc_ids = memoryview(doc_ids)
+        self._values = memoryview(values)
+        self._terms = None # term number -> term, built on first use by document_postings
+
+    @classmethod
+    def from_dict(cls, inverted_index):
+        """
+        Build a store from a term -> {doc_id -> term_freq} dictionary.
+
+        Args:
+            inverted_index (dict): The dictionary to compact
+
+        Returns:
+            PostingsStore: The compact store
+        """
+        lexicon = {}
+        offsets = array('q', [0])
+        doc_ids = array(DOC_ID_TYPECODE)
+        tfs = array(TF_TYPECODE)
+        for term, doc_freq_dict in inverted_index.items():
+            lexicon[term] = len(lexicon)
+            sorted_doc_ids = sorted(doc_freq_dict)
+            doc_ids.extend(sorted_doc_ids)
+            tfs.extend(doc_freq_dict[doc_id] for doc_id in sorted_doc_ids)
+            offsets.append(len(doc_ids))
+        return cls(lexicon, offsets, doc_ids, tfs)
+
+    def with_values(self, values):
+        """
+        Create a store sharing this store's terms and doc_ids, with a
+        different parallel array of values (e.g. TF-IDF weights).
+        """
+        return PostingsStore(self.lexicon, self.offsets, self.doc_id_array, values)
+
+    def to_dict(self):
+        """Expand back into a term -> {doc_id -> value} dictionary."""
+        return {term: dict(postings.items()) for term, postings in self.items()}
+
+    def __getitem__(self, term):
+        i = self.lexicon[term]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return PostingsList(self._doc_ids[start:end], self._values[start:end])
+
+    def __contains__(self, term):
+        return term in self.lexicon
+
+    def __iter__(self):
+        return iter(self.lexicon)
+
+    def __len__(self):
+        return len(self.lexicon)
+
+    def num_postings(self):
+        return len(self.doc_id_array)
+
+    def term_at(self, i):
+        """The term with term number i."""
+        if hasattr(self.lexicon, 'term_at'):
+            return self.lexicon.term_at(i)
+        if self._terms is None:
+            terms = [None] * len(self.lexicon)
+            for term, number in self.lexicon.items():
+                terms[number] = term
+            self._terms = terms
+        return self._terms[i]
+
+    def document_postings(self, doc_id):
+        """
+        Get one document's postings. They are found with a byte search of
+        the flat doc_id array (which runs in C, at memory speed) rather than
+        a lookup in every term's postings.
+
+        Args:
+            doc_id (int): The document ID
+
+        Returns:
+            dict: term -> value of every term with a posting for the document
+        """
+        needle = array(DOC_ID_TYPECODE, [doc_id]).tobytes()
+        item_size = len(needle)
+        raw = self._doc_ids.cast('B')
+        search = re.compile(re.escape(needle)).search
+        postings = {}
+        match = search(raw)
+        while match is not None:
+            position = match.start()
+            if position % item_size:
+                match = search(raw, position + 1) # Straddles two doc_ids; a real match may overlap it
+                continue
+            i = position // item_size
+            postings[self.term_at(bisect_right(self.offsets, i) - 1)] = self.value_array[i]
+            match = search(raw, position + item_size)
+        return postings
+
+    def __getstate__(self):
+        # Memoryviews cannot be pickled; they are recreated on load
+        return {
+            'lexicon': self.lexicon,
+            'offsets': self.offsets,
+            'doc_ids': self.doc_id_array,
+            'values': self.value_array,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state['lexicon'], state['offsets'], state['doc_ids'], state['values'])
+
+
+class TermValues(Mapping):
+    """Read-only term -> value mapping over an array parallel to the lexicon."""
+
+    def __init__(self, lexicon, values):
+        self.lexicon = lexicon
+        self.data = values
+
+    def __getitem__(self, term):
+        return self.data[self.lexicon[term]]
+
+    def __contains__(self, term):
+        return term in self.lexicon
+
+    def __iter__(self):
+        return iter(self.lexicon)
+
+    def __len__(self):
+        return len(self.lexicon)
+
+    def items(self):
+        # Walk the lexicon once instead of looking every term up again
+        data = self.data
+        return ((term, data[i]) for term, i in self.lexicon.items())
+
+
+class LivePostings(Mapping):
+    """
+    Updatable view of a finalized index: a read-only PostingsStore overlaid
+    with the postings of documents added since it was built and tombstones
+    for its deleted documents. Only the terms touched by an update are
+    merged (once, then cached); every other term is served straight from
+    the base store. compact() folds everything into a new PostingsStore.
+    """
+
+    def __init__(self, base):
+        """
+        Args:
+            base (PostingsStore): The finalized postings
+        """
+        self.base = base
+        self.added = {}            # term -> {doc_id -> term_freq} of added documents
+        self.added_docs = {}       # doc_id -> {term -> term_freq} of added documents
+        self.tombstones = set()    # doc_ids deleted from the base store
+        self._merged = {}          # term -> merged PostingsList, for touched terms
+        self._touched = set()      # terms whose postings differ from the base
+
+    def add(self, doc_id, term_freqs):
+        """
+        Add the postings of a document that is not in the index.
+
+        Args:
+            doc_id (int): The document ID
+            term_freqs (dict): term -> term frequency in the document
+        """
+        self.added_docs[doc_id] = dict(term_freqs)
+        for term, freq in term_freqs.items():
+            self.added.setdefault(term, {})[doc_id] = freq
+            self._touch(term)
+
+    def remove(self, doc_id, term_freqs):
+        """
+        Remove the postings of a document in the index.
+
+        Args:
+            doc_id (int): The document ID
+            term_freqs (dict): term -> term frequency in the document, as
+                returned by document_terms
+        """
+        if doc_id in self.added_docs:
+            del self.added_docs[doc_id]
+            for term in term_freqs:
+                term_postings = self.added[term]
+                del term_postings[doc_id]
+                if not term_postings:
+                    del self.added[term]
+        else:
+            self.tombstones.add(doc_id)
+        for term in term_freqs:
+            self._touch(term)
+
+    def document_terms(self, doc_id):
+        """
+        Get the term frequencies of an indexed document (see
+        PostingsStore.document_postings for a document of the base store).
+
+        Args:
+            doc_id (int): The document ID
+
+        Returns:
+            dict: term -> term frequency in the document
+        """
+        if doc_id in self.added_docs:
+            return dict(self.added_docs[doc_id])
+        if doc_id in self.tombstones:
+            return {}
+        return self.base.document_postings(doc_id)
+
+    def pending_updates(self):
+        """Number of added and deleted documents not yet compacted."""
+        return len(self.added_docs) + len(self.tombstones)
+
+    def _touch(self, term):
+        self._merged.pop(term, None)
+        self._touched.add(term)
+
+    def _merge(self, term):
+        merged = self._merged.get(term)
+        if merged is None:
+            pairs = []
+            if term in self.base:
+                pairs.extend((doc_id, tf) for doc_id, tf in self.base[term].items()
+                             if doc_id not in self.tombstones)
+            pairs.extend(self.added.get(term, {}).items())
+            pairs.sort()
+            merged = PostingsList(array(DOC_ID_TYPECODE, (doc_id for doc_id, _ in pairs)),
+                                  array(TF_TYPECODE, (tf for _, tf in pairs)))
+            self._merged[term] = merged
+        return merged
+
+    def is_touched(self, term):
+        """Check whether a term's postings differ from the base store."""
+        return term in self._touched
+
+    def compact(self):
+        """
+        Fold the updates into a new PostingsStore. Terms left without
+        postings are dropped.
+
+        Returns:
+            PostingsStore: The compacted postings
+        """
+        lexicon = {}
+        offsets = array('q', [0])
+        doc_ids = array(DOC_ID_TYPECODE)
+        tfs = array(TF_TYPECODE)
+        for term, postings in self.items():
+            lexicon[term] = len(lexicon)
+            doc_ids.extend(postings.doc_ids)
+            tfs.extend(postings.values())
+            offsets.append(len(doc_ids))
+        return PostingsStore(lexicon, offsets, doc_ids, tfs)
+
+    def to_dict(self):
+        """Expand into a term -> {doc_id -> term_freq} dictionary."""
+        return {term: dict(postings.items()) for term, postings in self.items()}
+
+    def __getitem__(self, term):
+        if term in self._touched:
+            merged = self._merge(term)
+            if not merged:
+                raise KeyError(term)
+            return merged
+        return self.base[term]
+
+    def __contains__(self, term):
+        if term in self._touched:
+            return len(self._merge(term)) > 0
+        return term in self.base
+
+    def __iter__(self):
+        for term in self.base:
+            if term in self:
+                yield term
+        for term in self.added:
+            if term not in self.base:
+                yield term
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class SegmentedPostings(Mapping):
+    """
+    Read-only term -> PostingsList view over the postings of several index
+    segments holding disjoint sets of documents. A term's postings are
+    concatenated across the segments containing it (and re-sorted only when
+    the segments' doc_id ranges interleave).
+    """
+
+    def __init__(self, stores):
+        """
+        Args:
+            stores (list): The segments' postings (PostingsStore), in segment order
+        """
+        self.stores = list(stores)
+
+    def __getitem__(self, term):
+        parts = [store[term] for store in self.stores if term in store]
+        if not parts:
+            raise KeyError(term)
+        if len(parts) == 1:
+            return parts[0]
+        doc_ids = array(DOC_ID_TYPECODE)
+        tfs = array(TF_TYPECODE)
+        for part in parts:
+            doc_ids.extend(part.doc_ids)
+            tfs.extend(part.values())
+        if any(parts[i].doc_ids[-1] > parts[i + 1].doc_ids[0] for i in range(len(parts) - 1)):
+            pairs = sorted(zip(doc_ids, tfs))
+            doc_ids = array(DOC_ID_TYPECODE, (doc_id for doc_id, _ in pairs))
+            tfs = array(TF_TYPECODE, (tf for _, tf in pairs))
+        return PostingsList(doc_ids, tfs)
+
+    def __contains__(self, term):
+        return any(term in store for store in self.stores)
+
+    def __iter__(self):
+        seen = set()
+        for store in self.stores:
+            for term in store:
+                if term not in seen:
+                    seen.add(term)
+                    yield term
+
+    def __len__(self):
+        return sum(1 for _ in self)
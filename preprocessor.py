@@ -1,22 +1,50 @@
 import re
+from functools import lru_cache
 import nltk
 from nltk.corpus import stopwords
 from nltk.stem import PorterStemmer
 
+# Tokens are the runs of characters left after replacing everything except
+# letters, digits and whitespace with spaces, i.e. the alphanumeric runs
+TOKEN_PATTERN = re.compile(r'[a-zA-Z0-9]+')
+
+_nltk_resources_checked = False
+
+def ensure_nltk_resources():
+    """
+    Make sure the NLTK data used by the Preprocessor is installed, downloading
+    it if needed. The check runs once per process (and is inherited by
+    processes forked afterwards), so call it at startup rather than on the
+    request path.
+    """
+    global _nltk_resources_checked
+    if _nltk_resources_checked:
+        return
+    try:
+        nltk.data.find('tokenizers/punkt')
+        nltk.data.find('corpora/stopwords')
+    except LookupError:
+        print("Downloading required NLTK resources...")
+        nltk.download('punkt')
+        nltk.download('stopwords')
+    _nltk_resources_checked = True
+
 class Preprocessor:
-    def __init__(self):
-        """Initialize the preprocessor with stopwords and stemmer."""
-        # Download required NLTK resources
-        try:
-            nltk.data.find('tokenizers/punkt')
-            nltk.data.find('corpora/stopwords')
-        except LookupError:
-            print("Downloading required NLTK resources...")
-            nltk.download('punkt')
-            nltk.download('stopwords')
+    def __init__(self, stem_cache_size=100000):
+        """
+        Initialize the preprocessor with stopwords and stemmer.
+        
+        Args:
+            stem_cache_size (int): Maximum number of stemmed tokens to memoize
+                (least recently used entries are evicted first)
+        """
+        # Download required NLTK resources (checked once per process)
+        ensure_nltk_resources()
         
         self.stop_words = set(stopwords.words('english'))
         self.stemmer = PorterStemmer()
+        # Wiki text repeats the same vocabulary constantly, so memoize stems
+        self.stem = lru_cache(maxsize=stem_cache_size)(self.stemmer.stem)
     
     def preprocess(self, text):
         """
@@ -35,19 +63,27 @@ class Preprocessor:
         if not text:
             return []
             
-        # Convert to lowercase
-        text = text.lower()
-        
-        # Remove special characters and replace with space
-        text = re.sub(r'[^a-zA-Z0-9\s]', ' ', text)
+        # Convert to lowercase and tokenize on alphanumeric runs
+        tokens = TOKEN_PATTERN.findall(text.lower())
         
-        # Tokenize
-        tokens = text.split()
+        # Remove stopwords and apply (cached) stemming
+        stop_words = self.stop_words
+        stem = self.stem
+        return [stem(token) for token in tokens if token not in stop_words]
+    
+    def cache_stats(self):
+        """
+        Get statistics of the stem cache.
         
-        # Remove stopwords and apply stemming
-        processed_tokens = []
-        for token in tokens:
-            if token not in self.stop_words:
-                processed_tokens.append(self.stemmer.stem(token))
-                
-        return processed_tokens 
\ No newline at end of file
+        Returns:
+            dict: hits, misses, current size, maximum size and hit rate
+        """
+        info = self.stem.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'maxsize': info.maxsize,
+            'hit_rate': info.hits / lookups if lookups else 0.0,
+        }
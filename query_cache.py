@@ -0,0 +1,133 @@
+# query_cache.py
+#
+# Bounded LRU cache with TTL for search results. Entries belong to one index
+# version: as soon as a newer version is seen, the cache is emptied. Index
+# versions must increase with every load. Requests still running on an
+# older index neither read nor store entries, so they can't wipe or pollute
+# the entries of the index being served.
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryResultCache:
+    def __init__(self, max_entries=1024, ttl_seconds=300):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries (int): Maximum number of cached result lists; the least
+                recently used entry is evicted first
+            ttl_seconds (float): Seconds an entry stays valid (None: no expiry)
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.index_version = None
+        self._entries = OrderedDict()  # key -> (expiry time, results)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    @staticmethod
+    def make_key(query_terms, model, **params):
+        """
+        Build a cache key from the preprocessed query terms, the model name
+        and the search parameters.
+        """
+        return (tuple(query_terms), model, tuple(sorted(params.items())))
+
+    def _check_version(self, index_version):
+        """
+        Empty the cache if index_version is newer than its entries.
+        Caller holds the lock.
+
+        Returns:
+            bool: False if index_version is older than the cache's (a stale request)
+        """
+        if self.index_version is None or index_version > self.index_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.index_version = index_version
+        elif index_version < self.index_version:
+            self.stale += 1
+            return False
+        return True
+
+    def get(self, index_version, key):
+        """
+        Look up cached results.
+
+        Args:
+            index_version: Version of the index the caller is searching
+            key: Cache key from make_key
+
+        Returns:
+            The cached results, or None on a miss (always, for an older index version)
+        """
+        with self._lock:
+            if not self._check_version(index_version):
+                self.misses += 1
+                return None
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]  # Expired
+            self.misses += 1
+            return None
+
+    def put(self, index_version, key, results):
+        """
+        Store results for a key.
+
+        Args:
+            index_version: Version of the index the results were computed on
+                (results of an older version are not stored)
+            key: Cache key from make_key
+            results: The results to cache (stored as a tuple)
+        """
+        if self.max_entries <= 0:
+            return
+        expiry = time.monotonic() + self.ttl_seconds if self.ttl_seconds is not None else None
+        with self._lock:
+            if not self._check_version(index_version):
+                return
+            self._entries[key] = (expiry, tuple(results))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every cached entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Get cache statistics.
+
+        Returns:
+            dict: hits, misses, hit rate, evictions, invalidations, stale
+            (lookups and stores from requests on an older index) and size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'stale': self.stale,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+            }
@@ -1,31 +1,72 @@
+import heapq
 import math
-from collections import defaultdict
+from bisect import bisect_left
+from collections import defaultdict, Counter
+from itertools import islice
+
+
+def select_top_k(scores, top_k):
+    """
+    Select the top_k results from a score dictionary without sorting all of it.
+    
+    A bounded heap over the score values finds the k-th best score; only the
+    documents scoring at least that much are then sorted. Ties are broken by
+    ascending doc_id so rankings are reproducible.
+    
+    Args:
+        scores (dict): Dictionary mapping doc_id to score
+        top_k (int): Number of top results to return
+        
+    Returns:
+        list: List of (doc_id, score) tuples sorted by decreasing score
+    """
+    if top_k <= 0 or not scores:
+        return []
+    if top_k < len(scores):
+        threshold = heapq.nlargest(top_k, scores.values())[-1]
+        candidates = [(doc_id, score) for doc_id, score in scores.items() if score >= threshold]
+    else:
+        candidates = list(scores.items())
+    candidates.sort(key=lambda x: (-x[1], x[0]))
+    return candidates[:top_k]
 
 class SearchEngine:
-    def __init__(self, indexer, preprocessor):
+    def __init__(self, indexer, preprocessor, metrics=None):
         """
         Initialize the search engine.
         
         Args:
             indexer: The indexer object with document data
             preprocessor: The preprocessor for query processing
+            metrics (SearchMetrics): Records per-stage timings and postings
+                counts of every search (None: no instrumentation)
         """
         self.indexer = indexer
         self.preprocessor = preprocessor
+        self.metrics = metrics
+    
+    def _trace(self, model):
+        # Timing is skipped entirely (one check per stage) without metrics
+        return self.metrics.trace(model) if self.metrics is not None else None
         
-    def search_vsm(self, query, top_k=100):
+    def search_vsm(self, query, top_k=100, term_cache=None):
         """
         Search using Vector Space Model (TF-IDF).
         
         Args:
             query (str): The search query
             top_k (int): Number of top results to return
+            term_cache (dict): Per-term data shared by the queries of a batch
             
         Returns:
             list: List of (doc_id, score) tuples sorted by decreasing score
         """
+        trace = self._trace('vsm')
+        
         # Preprocess the query
         query_terms = self.preprocessor.preprocess(query)
+        if trace is not None:
+            trace.mark('preprocess')
         
         # Build query vector using same weighting as documents
         query_vector = defaultdict(float)
@@ -44,26 +85,41 @@ class SearchEngine:
         # Calculate query vector norm
         query_norm = math.sqrt(sum(w**2 for w in query_vector.values()))
         
-        # Calculate cosine similarity for each document
+        # Calculate the dot product term-at-a-time, only touching documents
+        # that appear in the postings of a query term
+        dot_products = defaultdict(float)
+        for term, weight in query_vector.items():
+            doc_weights = self._cached_term_data(term_cache, ('vsm', term), self.indexer.get_weights_for_term, term)
+            for doc_id, doc_weight in doc_weights.items():
+                dot_products[doc_id] += weight * doc_weight
+            if trace is not None:
+                trace.postings += len(doc_weights)
+        if trace is not None:
+            trace.mark('postings')
+        
+        # Cosine similarity for documents sharing at least one term with the query
         scores = {}
-        for doc_id, doc_vector in self.indexer.document_vectors.items():
-            dot_product = 0.0
-            for term, weight in query_vector.items():
-                if term in doc_vector:
-                    dot_product += weight * doc_vector[term]
-            
-            # Avoid division by zero
-            if query_norm == 0 or self.indexer.document_norms[doc_id] == 0:
-                scores[doc_id] = 0
-            else:
-                # Cosine similarity
-                scores[doc_id] = dot_product / (query_norm * self.indexer.document_norms[doc_id])
+        if query_norm > 0:
+            for doc_id, dot_product in dot_products.items():
+                doc_norm = self.indexer.document_norms[doc_id]
+                if doc_norm > 0 and dot_product > 0:
+                    scores[doc_id] = dot_product / (query_norm * doc_norm)
+        if trace is not None:
+            trace.mark('scoring')
+        
+        # Select the top_k by decreasing score (ties in document order)
+        sorted_scores = select_top_k(scores, top_k)
         
-        # Sort by decreasing score and return top_k
-        sorted_scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-        return sorted_scores[:top_k]
+        # Every other document scores zero; pad with them by ascending doc_id
+        # so the result matches a full scan of the collection
+        for doc_id in self._unmatched_doc_ids(scores, top_k - len(sorted_scores)):
+            sorted_scores.append((doc_id, 0.0))
+        if trace is not None:
+            trace.mark('sort')
+            trace.finish()
+        return sorted_scores
     
-    def search_bm25(self, query, top_k=100, k1=1.2, b=0.75):
+    def search_bm25(self, query, top_k=100, k1=1.2, b=0.75, pruning=False, term_cache=None):
         """
         Search using BM25 ranking algorithm.
         
@@ -72,12 +128,22 @@ class SearchEngine:
             top_k (int): Number of top results to return
             k1 (float): Term frequency saturation parameter
             b (float): Document length normalization parameter
+            pruning (bool): Use WAND dynamic pruning (see search_bm25_wand)
+            term_cache (dict): Per-term data shared by the queries of a batch
             
         Returns:
             list: List of (doc_id, score) tuples sorted by decreasing score
         """
+        if pruning:
+            results, _ = self.search_bm25_wand(query, top_k=top_k, k1=k1, b=b)
+            return results
+        
+        trace = self._trace('bm25')
+        
         # Preprocess the query
         query_terms = self.preprocessor.preprocess(query)
+        if trace is not None:
+            trace.mark('preprocess')
         
         # Calculate scores using BM25 formula
         scores = defaultdict(float)
@@ -85,27 +151,164 @@ class SearchEngine:
         for term in query_terms:
             if term not in self.indexer.inverted_index:
                 continue
-                
-            # Calculate IDF component of BM25
-            n = self.indexer.doc_count
-            df = self.indexer.get_doc_count_for_term(term)
-            idf = math.log((n - df + 0.5) / (df + 0.5) + 1.0)
             
-            # For each document containing this term
-            for doc_id, tf in self.indexer.get_docs_for_term(term).items():
-                doc_length = self.indexer.document_lengths[doc_id]
-                avg_doc_length = self.indexer.avg_doc_length
-                
-                # BM25 formula
-                numerator = tf * (k1 + 1)
-                denominator = tf + k1 * (1 - b + b * doc_length / avg_doc_length)
-                scores[doc_id] += idf * (numerator / denominator)
-        
-        # Sort by decreasing score and return top_k
-        sorted_scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-        return sorted_scores[:top_k]
+            # BM25 contribution of this term to each document containing it
+            term_scores = self._cached_term_data(term_cache, ('bm25', term, k1, b), self._bm25_term_scores, term, k1, b)
+            for doc_id, term_score in term_scores.items():
+                scores[doc_id] += term_score
+            if trace is not None:
+                trace.postings += len(term_scores)
+        if trace is not None:
+            trace.mark('postings')
+        
+        # Select the top_k by decreasing score
+        results = select_top_k(scores, top_k)
+        if trace is not None:
+            trace.mark('sort')
+            trace.finish()
+        return results
+    
+    def _bm25_term_scores(self, term, k1, b):
+        """
+        Compute the BM25 contribution of one term to every document containing it.
+        
+        Returns:
+            dict: Dictionary mapping doc_id to the term's BM25 score
+        """
+        # Calculate IDF component of BM25
+        n = self.indexer.doc_count
+        df = self.indexer.get_doc_count_for_term(term)
+        idf = math.log((n - df + 0.5) / (df + 0.5) + 1.0)
+        
+        term_scores = {}
+        avg_doc_length = self.indexer.avg_doc_length
+        for doc_id, tf in self.indexer.get_docs_for_term(term).items():
+            doc_length = self.indexer.document_lengths[doc_id]
+            
+            # BM25 formula
+            numerator = tf * (k1 + 1)
+            denominator = tf + k1 * (1 - b + b * doc_length / avg_doc_length)
+            term_scores[doc_id] = idf * (numerator / denominator)
+        return term_scores
     
-    def search_lm_dirichlet(self, query, top_k=100, mu=2000):
+    def search_bm25_wand(self, query, top_k=100, k1=1.2, b=0.75):
+        """
+        Search using BM25 with WAND dynamic pruning.
+        
+        Postings are walked in doc_id order, and a document is only scored
+        when the upper bounds of the terms it may contain could lift it into
+        the current top_k. Returns exactly the same results as search_bm25.
+        Upper bounds are precomputed by the indexer for one (k1, b) pair;
+        other parameters fall back to exhaustive scoring.
+        
+        Args:
+            query (str): The search query
+            top_k (int): Number of top results to return
+            k1 (float): Term frequency saturation parameter
+            b (float): Document length normalization parameter
+            
+        Returns:
+            tuple: (results, skipped) where results is a list of (doc_id, score)
+                tuples sorted by decreasing score and skipped is the number
+                of postings that were never scored
+        """
+        if (k1, b) != self.indexer.bm25_bound_params:
+            return self.search_bm25(query, top_k=top_k, k1=k1, b=b), 0
+        
+        trace = self._trace('bm25_wand')
+        
+        # Preprocess the query
+        query_terms = self.preprocessor.preprocess(query)
+        if trace is not None:
+            trace.mark('preprocess')
+        
+        # IDF component of BM25 for each query term in the index
+        n = self.indexer.doc_count
+        avg_doc_length = self.indexer.avg_doc_length
+        postings = {}
+        idfs = {}
+        for term in query_terms:
+            if term in self.indexer.inverted_index and term not in postings:
+                postings[term] = self.indexer.get_docs_for_term(term)
+                df = self.indexer.get_doc_count_for_term(term)
+                idfs[term] = math.log((n - df + 0.5) / (df + 0.5) + 1.0)
+        
+        def score_document(doc_id, term_freqs):
+            # Same arithmetic, in the same order, as search_bm25
+            doc_length = self.indexer.document_lengths[doc_id]
+            score = 0.0
+            for term in query_terms:
+                if term in term_freqs:
+                    tf = term_freqs[term]
+                    numerator = tf * (k1 + 1)
+                    denominator = tf + k1 * (1 - b + b * doc_length / avg_doc_length)
+                    score += idfs[term] * (numerator / denominator)
+            return score
+        
+        # One cursor per term: [term, sorted doc_ids, term freqs, position,
+        # upper bound]. A term repeated in the query contributes once per
+        # occurrence.
+        term_counts = Counter(term for term in query_terms if term in postings)
+        cursors = [
+            [term, doc_freq_dict.doc_ids, doc_freq_dict.values(), 0,
+             self.indexer.bm25_upper_bounds[term] * term_counts[term]]
+            for term, doc_freq_dict in postings.items()
+        ]
+        total_postings = sum(len(cursor[1]) for cursor in cursors)
+        scored_postings = 0
+        
+        # Min-heap of (score, -doc_id): the root is the current k-th result
+        heap = []
+        while top_k > 0:
+            cursors = [cursor for cursor in cursors if cursor[3] < len(cursor[1])]
+            if not cursors:
+                break
+            cursors.sort(key=lambda cursor: cursor[1][cursor[3]])
+            threshold = heap[0][0] if len(heap) >= top_k else float('-inf')
+            
+            # Pivot: first cursor at which the summed upper bounds could beat
+            # the threshold (with a little slack for floating-point rounding)
+            upper_bound = 0.0
+            pivot = None
+            for i, cursor in enumerate(cursors):
+                upper_bound += cursor[4]
+                if upper_bound * (1 + 1e-9) > threshold:
+                    pivot = i
+                    break
+            if pivot is None:
+                break
+            pivot_doc = cursors[pivot][1][cursors[pivot][3]]
+            
+            if cursors[0][1][cursors[0][3]] == pivot_doc:
+                # Every term up to the pivot is on this document: score it
+                term_freqs = {}
+                for cursor in cursors:
+                    if cursor[1][cursor[3]] != pivot_doc:
+                        break
+                    term_freqs[cursor[0]] = cursor[2][cursor[3]]
+                    cursor[3] += 1
+                    scored_postings += 1
+                score = score_document(pivot_doc, term_freqs)
+                if len(heap) < top_k:
+                    heapq.heappush(heap, (score, -pivot_doc))
+                elif score > heap[0][0]:
+                    heapq.heapreplace(heap, (score, -pivot_doc))
+            else:
+                # No document before the pivot can make the top_k: skip ahead
+                for cursor in cursors[:pivot]:
+                    cursor[3] = bisect_left(cursor[1], pivot_doc, cursor[3])
+        
+        if trace is not None:
+            trace.postings += scored_postings
+            trace.mark('postings')
+        
+        results = sorted(((-neg_doc_id, score) for score, neg_doc_id in heap), key=lambda x: (-x[1], x[0]))
+        if trace is not None:
+            trace.mark('sort')
+            trace.finish()
+        return results, total_postings - scored_postings
+    
+    def search_lm_dirichlet(self, query, top_k=100, mu=2000, term_cache=None):
         """
         Search using Language Model with Dirichlet smoothing.
         
@@ -113,35 +316,41 @@ class SearchEngine:
             query (str): The search query
             top_k (int): Number of top results to return
             mu (float): Dirichlet smoothing parameter
+            term_cache (dict): Per-term data shared by the queries of a batch
             
         Returns:
             list: List of (doc_id, score) tuples sorted by decreasing score
         """
+        trace = self._trace('lm_dirichlet')
+        
         # Preprocess the query
         query_terms = self.preprocessor.preprocess(query)
+        if trace is not None:
+            trace.mark('preprocess')
         
-        # Compute collection statistics for smoothing
-        total_terms = sum(self.indexer.document_lengths.values())
+        if not self.indexer.total_terms:
+            # Empty collection: nothing to score, but still record the search
+            if trace is not None:
+                trace.finish()
+            return []
+        
+        # Collection statistics are precomputed by the indexer
+        total_terms = self.indexer.total_terms
         
         # For each term, compute collection probability
         collection_prob = {}
         for term in set(query_terms):
-            if term in self.indexer.inverted_index:
-                # Count total occurrences of term in collection
-                term_count = sum(self.indexer.inverted_index[term].values())
+            term_count = self.indexer.get_collection_frequency(term)
+            if term_count:
                 collection_prob[term] = term_count / total_terms
             else:
                 collection_prob[term] = 1 / total_terms  # Smoothing for unseen terms
         
-        # Calculate scores using Language Model with Dirichlet smoothing
-        scores = {}
-        
-        for doc_id, doc_length in self.indexer.document_lengths.items():
+        def score_document(doc_id, doc_length, postings):
             score = 0.0
-            
             for term in query_terms:
                 # Term frequency in document
-                tf = self.indexer.get_term_frequency(term, doc_id)
+                tf = postings[term].get(doc_id, 0) if term in postings else 0
                 
                 # Calculate p(term|document) with Dirichlet smoothing
                 p_term_given_doc = (tf + mu * collection_prob.get(term, 0)) / (doc_length + mu)
@@ -152,9 +361,117 @@ class SearchEngine:
                     score += math.log(p_term_given_doc)
                 else:
                     score -= 100  # Penalize heavily for missing terms
+            return score
+        
+        # Only documents in the postings of a query term get a correction on
+        # top of the "all terms missing" baseline, so score those directly
+        postings = {}
+        for term in set(query_terms):
+            if term in self.indexer.inverted_index:
+                # Expanded to a dict for constant-time term frequency lookups
+                postings[term] = self._cached_term_data(term_cache, ('tf', term), self._term_frequency_dict, term)
+                if trace is not None:
+                    trace.postings += len(postings[term])
+        if trace is not None:
+            trace.mark('postings')
+        
+        scores = {}
+        for doc_freq_dict in postings.values():
+            for doc_id in doc_freq_dict:
+                if doc_id not in scores:
+                    doc_length = self.indexer.document_lengths[doc_id]
+                    scores[doc_id] = score_document(doc_id, doc_length, postings)
+        
+        # Every other document scores the baseline, which depends only on its
+        # length and decreases as the length grows, so the best of them are the
+        # shortest ones. Take at most top_k of them, computing each baseline once.
+        # (Without smoothing or query terms the baseline is the same for all.)
+        if query_terms and mu > 0:
+            unmatched_order = self.indexer.docs_by_length
+        else:
+            unmatched_order = self._unmatched_doc_ids(scores, top_k)
+        baselines = {}
+        candidates = 0
+        for doc_id in unmatched_order:
+            if candidates >= top_k:
+                break
+            if doc_id in scores:
+                continue
+            doc_length = self.indexer.document_lengths[doc_id]
+            if doc_length not in baselines:
+                baselines[doc_length] = score_document(doc_id, doc_length, {})
+            scores[doc_id] = baselines[doc_length]
+            candidates += 1
+        if trace is not None:
+            trace.mark('scoring')
+        
+        # Select the top_k by decreasing score (ties in document order)
+        results = select_top_k(scores, top_k)
+        if trace is not None:
+            trace.mark('sort')
+            trace.finish()
+        return results
+    
+    def _unmatched_doc_ids(self, scores, count):
+        """
+        The count smallest doc_ids that have no score, in ascending order.
+        
+        A finalized index keeps its documents sorted by doc_id; after live
+        updates they are a dict in insertion order and have to be selected.
+        
+        Args:
+            scores (dict): doc_id -> score of the documents to skip
+            count (int): Number of doc_ids to return
+            
+        Returns:
+            list: The doc_ids
+        """
+        if count <= 0:
+            return []
+        unmatched = (doc_id for doc_id in self.indexer.document_lengths if doc_id not in scores)
+        if isinstance(self.indexer.document_lengths, dict):
+            return heapq.nsmallest(count, unmatched)
+        return list(islice(unmatched, count))
+    
+    def _term_frequency_dict(self, term):
+        return dict(self.indexer.get_docs_for_term(term).items())
+    
+    @staticmethod
+    def _cached_term_data(term_cache, key, compute, *args):
+        # Per-term data is computed once per batch when a term_cache is given
+        if term_cache is None:
+            return compute(*args)
+        if key not in term_cache:
+            term_cache[key] = compute(*args)
+        return term_cache[key]
+    
+    def search_batch(self, requests):
+        """
+        Run several searches together. Per-term work (BM25 contributions,
+        VSM weights, term frequency lookups) is done once per batch and
+        shared by every query containing the term.
+        
+        Args:
+            requests (list): List of (query, model, top_k) tuples, where model
+                is 'vsm', 'bm25' or 'lm_dirichlet'
             
-            scores[doc_id] = score
+        Returns:
+            list: One list of (doc_id, score) tuples per request, in order
+            
+        Raises:
+            ValueError: If a request names an unknown model
+        """
+        methods = {
+            'vsm': self.search_vsm,
+            'bm25': self.search_bm25,
+            'lm_dirichlet': self.search_lm_dirichlet,
+        }
+        for _, model, _ in requests:
+            if model not in methods:
+                raise ValueError(f"Unknown model '{model}'")
         
-        # Sort by decreasing score and return top_k
-        sorted_scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-        return sorted_scores[:top_k] 
\ No newline at end of file
+        term_cache = {}
+        return [
+            methods[model](query, top_k=top_k, term_cache=term_cache)
+            for query, model, top_k in requests
+        ]
@@ -0,0 +1,439 @@
+# segmented_index.py
+#
+# LSM-style index: documents are buffered in a small in-memory indexer and
+# flushed as immutable segments (finalized Indexers). Readers search a
+# snapshot, an Indexer-compatible view over the current segments carrying
+# global statistics (document count, average length, document and
+# collection frequencies, VSM IDFs and norms), so SearchEngine scores
+# exactly as on a single index. Every change to the segment list publishes
+# a new snapshot with one reference assignment; readers keep using the
+# snapshot they started with. Publishing does not walk the collection: the
+# global statistics are combined from the segments' own when first needed.
+# A background thread merges small segments.
+
+import heapq
+import json
+import math
+import os
+import threading
+from collections.abc import Mapping
+
+from indexer import Indexer
+from mmap_index import load_mmap_index, save_mmap_index
+from postings import SegmentedPostings
+from search import SearchEngine
+
+MANIFEST_FILE = 'segments.json'
+MERGE_RETRY_SECONDS = 5 # Wait after a failed background merge before trying again
+
+
+class _TermStatistics(Mapping):
+    """
+    term -> a global per-term statistic, combined from the segments on first
+    use and remembered for the life of the snapshot.
+    """
+
+    def __init__(self, postings, compute):
+        """
+        Args:
+            postings (SegmentedPostings): The snapshot's postings (its vocabulary)
+            compute: Function of a term returning the statistic
+        """
+        self.postings = postings
+        self.compute = compute
+        self._values = {}
+
+    def __getitem__(self, term):
+        value = self._values.get(term)
+        if value is None:
+            if term not in self.postings:
+                raise KeyError(term)
+            value = self._values[term] = self.compute(term)
+        return value
+
+    def __contains__(self, term):
+        return term in self._values or term in self.postings
+
+    def __iter__(self):
+        return iter(self.postings)
+
+    def __len__(self):
+        return len(self.postings)
+
+
+class _DocumentNorms(Mapping):
+    """
+    doc_id -> VSM norm with the snapshot's global IDFs. The IDFs change with
+    every new segment, so norms are computed a whole segment at a time, the
+    first time a document of that segment needs one.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self._norms = {}
+        self._done = set() # ids of the segments whose norms are in _norms
+        self._lock = threading.Lock()
+
+    def __getitem__(self, doc_id):
+        norm = self._norms.get(doc_id)
+        if norm is not None:
+            return norm
+        for segment in self.snapshot.segments:
+            if doc_id in segment.document_lengths:
+                with self._lock:
+                    if id(segment) not in self._done:
+                        self._norms.update(self.snapshot.compute_segment_norms(segment))
+                        self._done.add(id(segment))
+                return self._norms[doc_id]
+        raise KeyError(doc_id)
+
+    def __iter__(self):
+        return iter(self.snapshot.document_lengths)
+
+    def __len__(self):
+        return len(self.snapshot.document_lengths)
+
+
+class _MergedLengthOrder:
+    """
+    doc_ids of all segments ordered by (length, doc_id), merged from the
+    segments' own orderings as it is iterated, so a search that stops after
+    a few documents only pays for those.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __iter__(self):
+        lengths = self.snapshot.document_lengths
+        return heapq.merge(*(segment.docs_by_length for segment in self.snapshot.segments),
+                           key=lambda doc_id: (lengths[doc_id], doc_id))
+
+    def __len__(self):
+        return self.snapshot.doc_count
+
+
+class SegmentSnapshot(Indexer):
+    """
+    Read-only Indexer over a fixed list of segments. Publishing one is cheap:
+    the document lengths are passed in (kept up to date by SegmentedIndex as
+    segments come and go), totals are summed over the segments, and the
+    per-term statistics and VSM norms are combined from the segments only
+    when a search first needs them.
+    """
+
+    def __init__(self, preprocessor, segments, document_lengths=None):
+        """
+        Args:
+            preprocessor: The preprocessor used for the segments
+            segments (list): The finalized segment indexers, in segment order
+            document_lengths (dict): doc_id -> length of every document of the
+                segments, in segment order (None: collected from the segments).
+                Must not be changed afterwards.
+        """
+        super().__init__(preprocessor, precompute_vsm_weights=False)
+        self.segments = list(segments)
+        self.inverted_index = SegmentedPostings(segment.inverted_index for segment in self.segments)
+        if document_lengths is None:
+            document_lengths = {}
+            for segment in self.segments:
+                document_lengths.update(segment.document_lengths.items())
+        self.document_lengths = document_lengths
+        self.doc_count = len(document_lengths)
+        self.total_terms = sum(segment.total_terms for segment in self.segments)
+        self.document_frequencies = _TermStatistics(self.inverted_index, self._document_frequency)
+        self.collection_frequencies = _TermStatistics(self.inverted_index, self._collection_frequency)
+        self.vsm_idfs = _TermStatistics(
+            self.inverted_index, lambda term: math.log(self.doc_count / self.document_frequencies[term]))
+        self.document_norms = _DocumentNorms(self)
+        # Each segment's documents are already ordered by (length, doc_id)
+        self.docs_by_length = _MergedLengthOrder(self)
+        if self.doc_count:
+            self.avg_doc_length = self.total_terms / self.doc_count
+        # Segment upper bounds do not hold for global statistics, so WAND
+        # falls back to exhaustive scoring (bm25_bound_params stays None)
+
+    def _document_frequency(self, term):
+        return sum(len(segment.inverted_index[term]) for segment in self.segments if term in segment.inverted_index)
+
+    def _collection_frequency(self, term):
+        return sum(segment.get_collection_frequency(term) for segment in self.segments)
+
+    def compute_segment_norms(self, segment):
+        """
+        VSM norms of one segment's documents with the global IDFs (same
+        weighting as build_document_vectors).
+
+        Returns:
+            dict: doc_id -> norm
+        """
+        squared_norms = dict.fromkeys(segment.document_lengths, 0.0)
+        for term, postings in segment.inverted_index.items():
+            weights = self._vsm_weights(postings.values(), self.vsm_idfs[term])
+            for doc_id, weight in zip(postings.doc_ids, weights):
+                squared_norms[doc_id] += weight**2
+        return {doc_id: math.sqrt(sq) for doc_id, sq in squared_norms.items()}
+
+    def get_doc_count_for_term(self, term):
+        return self.document_frequencies.get(term, 0)
+
+    def add_document(self, doc_id, text):
+        raise TypeError("A segment snapshot is read-only; add documents to the SegmentedIndex")
+
+    def delete_document(self, doc_id):
+        raise TypeError("A segment snapshot is read-only")
+
+
+class SegmentedIndex:
+    def __init__(self, preprocessor, segment_size=1000, merge_factor=8):
+        """
+        Initialize an empty segmented index.
+
+        Args:
+            preprocessor: The preprocessor object to use for text preprocessing
+            segment_size (int): Buffered documents that trigger a flush
+            merge_factor (int): Number of adjacent segments merged together
+                once there are at least that many
+        """
+        self.preprocessor = preprocessor
+        self.segment_size = segment_size
+        self.merge_factor = merge_factor
+        self.segments = ()          # (name, finalized Indexer) pairs, in segment order
+        self.snapshot = SegmentSnapshot(preprocessor, [])
+        self._buffer = self._new_buffer()
+        self._next_segment = 0
+        self._lock = threading.Lock()             # Guards the buffer and the segment list
+        self._merge_wanted = threading.Condition()
+        self._merge_thread = None
+        self._closing = False
+
+    def _new_buffer(self):
+        return Indexer(self.preprocessor, precompute_vsm_weights=False)
+
+    def _new_segment_name(self):
+        # Caller holds the lock
+        name = f"segment_{self._next_segment:06d}"
+        self._next_segment += 1
+        return name
+
+    def _publish(self, segments, document_lengths=None):
+        # Caller holds the lock. Readers switch to the new snapshot with a
+        # single reference assignment and never see a partial segment list.
+        # document_lengths is a new dict (snapshots never share a changing one).
+        self.segments = tuple(segments)
+        self.snapshot = SegmentSnapshot(self.preprocessor, [indexer for _, indexer in self.segments],
+                                        document_lengths)
+
+    def add_document(self, doc_id, text):
+        """
+        Buffer a document. It becomes searchable at the next flush, which
+        happens automatically every segment_size documents.
+
+        Args:
+            doc_id (int): The document ID
+            text: The document text
+
+        Raises:
+            ValueError: If the document is already in the index
+        """
+        with self._lock:
+            if doc_id in self.snapshot.document_lengths or doc_id in self._buffer.document_lengths:
+                raise ValueError(f"Document {doc_id} is already indexed")
+            self._buffer.add_document(doc_id, text)
+            full = self._buffer.doc_count >= self.segment_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Turn the buffered documents into a new immutable segment and publish
+        a snapshot including it.
+
+        Returns:
+            str: Name of the new segment, or None if nothing was buffered
+        """
+        with self._lock:
+            if self._buffer.doc_count == 0:
+                return None
+            buffer, self._buffer = self._buffer, self._new_buffer()
+            buffer.finalize_index()
+            name = self._new_segment_name()
+            document_lengths = self.snapshot.document_lengths.copy()
+            document_lengths.update(buffer.document_lengths.items())
+            self._publish(self.segments + ((name, buffer),), document_lengths)
+        self._request_merge()
+        return name
+
+    def search_engine(self):
+        """
+        Get a SearchEngine over the current snapshot. Keep it for the
+        duration of a request so the request sees one consistent index.
+        """
+        return SearchEngine(self.snapshot, self.preprocessor)
+
+    def drop_segments(self, names):
+        """
+        Remove segments (and their documents) from the index in one step.
+
+        Args:
+            names (list): Names of the segments to drop
+        """
+        names = set(names)
+        with self._lock:
+            document_lengths = self.snapshot.document_lengths.copy()
+            for name, indexer in self.segments:
+                if name in names:
+                    for doc_id in indexer.document_lengths:
+                        del document_lengths[doc_id]
+            self._publish([(name, indexer) for name, indexer in self.segments if name not in names],
+                          document_lengths)
+
+    def _pick_merge(self):
+        # The merge_factor adjacent segments with the fewest documents in total
+        segments = self.segments
+        if self.merge_factor < 2 or len(segments) < self.merge_factor:
+            return None
+        sizes = [indexer.doc_count for _, indexer in segments]
+        start = min(range(len(segments) - self.merge_factor + 1),
+                    key=lambda i: sum(sizes[i:i + self.merge_factor]))
+        return segments[start:start + self.merge_factor]
+
+    @staticmethod
+    def merge_indexers(preprocessor, indexers):
+        """
+        Merge segments into one finalized segment, reusing their postings
+        (documents are not preprocessed again).
+
+        Args:
+            preprocessor: The preprocessor used for the segments
+            indexers (list): The segment indexers, in segment order
+
+        Returns:
+            Indexer: The merged segment
+        """
+        merged = Indexer(preprocessor, precompute_vsm_weights=False)
+        for indexer in indexers:
+            merged.merge_partial_index(indexer.inverted_index.to_dict(), dict(indexer.document_lengths.items()))
+        merged.finalize_index()
+        return merged
+
+    def merge_once(self):
+        """
+        Merge the smallest run of merge_factor adjacent segments, if there
+        are enough segments. Readers are not blocked: the merged segment is
+        built from the current snapshot and swapped in afterwards.
+
+        Returns:
+            bool: True if segments were merged
+        """
+        with self._lock:
+            run = self._pick_merge()
+        if run is None:
+            return False
+        merged = self.merge_indexers(self.preprocessor, [indexer for _, indexer in run])
+        with self._lock:
+            names = [name for name, _ in self.segments]
+            run_names = [name for name, _ in run]
+            if run_names[0] not in names:
+                return False  # Dropped while merging
+            start = names.index(run_names[0])
+            if names[start:start + len(run)] != run_names:
+                return False
+            segments = list(self.segments)
+            segments[start:start + len(run)] = [(self._new_segment_name(), merged)]
+            # Same documents, in the same order: the lengths carry over
+            self._publish(segments, self.snapshot.document_lengths)
+        return True
+
+    def start_background_merge(self):
+        """Start a daemon thread that merges segments after each flush."""
+        if self._merge_thread is not None:
+            return
+        self._closing = False
+        self._merge_thread = threading.Thread(target=self._merge_loop, name='segment-merger', daemon=True)
+        self._merge_thread.start()
+
+    def _request_merge(self):
+        with self._merge_wanted:
+            self._merge_wanted.notify()
+
+    def _merge_loop(self):
+        while True:
+            with self._merge_wanted:
+                while not self._closing and self._pick_merge() is None:
+                    self._merge_wanted.wait()
+                if self._closing:
+                    return
+            try:
+                self.merge_once()
+            except Exception as e:
+                # Keep merging later; the segments are unchanged by a failed merge
+                print(f"Error merging index segments (retrying in {MERGE_RETRY_SECONDS}s): {e!r}")
+                with self._merge_wanted:
+                    if not self._closing:
+                        self._merge_wanted.wait(MERGE_RETRY_SECONDS)
+
+    def close(self):
+        """Flush buffered documents and stop the background merge thread."""
+        self.flush()
+        if self._merge_thread is not None:
+            with self._merge_wanted:
+                self._closing = True
+                self._merge_wanted.notify()
+            self._merge_thread.join()
+            self._merge_thread = None
+
+    def save(self, directory):
+        """
+        Write every segment not yet on disk as a binary index file, then
+        atomically replace the manifest listing the live segments, then
+        delete the files of segments that were merged or dropped.
+
+        Args:
+            directory (str): Directory holding the segment files and manifest
+        """
+        self.flush()
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            segments, next_segment = self.segments, self._next_segment
+        for name, indexer in segments:
+            segment_file = os.path.join(directory, name + '.bin')
+            if not os.path.exists(segment_file):
+                save_mmap_index(indexer, segment_file)
+        manifest = {
+            'segments': [name for name, _ in segments],
+            'next_segment': next_segment,
+        }
+        manifest_file = os.path.join(directory, MANIFEST_FILE)
+        with open(manifest_file + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(manifest_file + '.tmp', manifest_file)
+        live_files = {name + '.bin' for name in manifest['segments']}
+        for filename in os.listdir(directory):
+            if filename.startswith('segment_') and filename.endswith('.bin') and filename not in live_files:
+                os.remove(os.path.join(directory, filename))
+
+    @classmethod
+    def load(cls, directory, preprocessor, **kwargs):
+        """
+        Open a segmented index saved with save(). Segment files are memory-mapped.
+
+        Args:
+            directory (str): Directory holding the segment files and manifest
+            preprocessor: The preprocessor to use for queries and new documents
+            **kwargs: Passed to the SegmentedIndex constructor
+
+        Returns:
+            SegmentedIndex: The loaded index
+        """
+        with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        index = cls(preprocessor, **kwargs)
+        segments = [
+            (name, load_mmap_index(os.path.join(directory, name + '.bin'), preprocessor))
+            for name in manifest['segments']
+        ]
+        with index._lock:
+            index._next_segment = manifest['next_segment']
+            index._publish(segments)
+        return index
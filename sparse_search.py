@@ -0,0 +1,171 @@
+# sparse_search.py
+#
+# Vectorized alternative to SearchEngine for offline evaluation and bulk
+# re-ranking. The collection is held as sparse doc-term weight matrices
+# (BM25 and TF-IDF), and a whole batch of queries is scored with a single
+# sparse matrix product. Requires numpy and scipy, which the web app does
+# not need, so the import is optional.
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = None
+    sparse = None
+
+
+class SparseSearchEngine:
+    def __init__(self, indexer, preprocessor, k1=1.2, b=0.75):
+        """
+        Build the weight matrices from a finalized indexer.
+
+        Args:
+            indexer: The finalized indexer (doc_ids must be integers)
+            preprocessor: The preprocessor for query processing
+            k1 (float): BM25 term frequency saturation parameter
+            b (float): BM25 document length normalization parameter
+
+        Raises:
+            ImportError: If numpy or scipy is not installed
+        """
+        if sparse is None:
+            raise ImportError("SparseSearchEngine requires numpy and scipy (pip install numpy scipy)")
+        self.indexer = indexer
+        self.preprocessor = preprocessor
+        self.k1 = k1
+        self.b = b
+
+        indexer.compact()
+        indexer.compact_postings()
+        store = indexer.inverted_index
+
+        # Rows are documents in doc_id order, columns are terms in lexicon order
+        self.doc_ids = np.array(sorted(indexer.document_lengths), dtype=np.int64)
+        self.term_columns = {term: column for column, term in enumerate(store)}
+        num_docs, num_terms = len(self.doc_ids), len(self.term_columns)
+
+        postings_doc_ids = np.frombuffer(store.doc_id_array, dtype=np.intc).astype(np.int64)
+        tfs = np.frombuffer(store.value_array, dtype=np.intc).astype(np.float64)
+        indptr = np.frombuffer(store.offsets, dtype=np.int64)
+        rows = np.searchsorted(self.doc_ids, postings_doc_ids)
+        columns = np.repeat(np.arange(num_terms), np.diff(indptr))
+
+        doc_lengths = np.array([indexer.document_lengths[doc_id] for doc_id in self.doc_ids.tolist()],
+                               dtype=np.float64)
+        self.doc_norms = np.array([indexer.document_norms.get(doc_id, 0.0) for doc_id in self.doc_ids.tolist()],
+                                  dtype=np.float64)
+        df = np.diff(indptr).astype(np.float64)
+        n = indexer.doc_count
+
+        # BM25: idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avgdl))
+        self.bm25_idfs = np.log((n - df + 0.5) / (df + 0.5) + 1.0)
+        length_norm = k1 * (1 - b + b * doc_lengths[rows] / indexer.avg_doc_length)
+        bm25_weights = self.bm25_idfs[columns] * (tfs * (k1 + 1) / (tfs + length_norm))
+        self.bm25_matrix = sparse.csr_matrix((bm25_weights, (rows, columns)), shape=(num_docs, num_terms))
+
+        # TF-IDF: (1 + log tf) * log(N / df), as in Indexer.build_document_vectors
+        self.vsm_idfs = np.log(n / df) if num_terms else np.zeros(0)
+        tfidf_weights = (1 + np.log(tfs)) * self.vsm_idfs[columns]
+        self.tfidf_matrix = sparse.csr_matrix((tfidf_weights, (rows, columns)), shape=(num_docs, num_terms))
+
+    def _query_term_counts(self, queries):
+        """Sparse (queries x terms) matrix of query term counts."""
+        rows, columns = [], []
+        for row, query in enumerate(queries):
+            for term in self.preprocessor.preprocess(query):
+                column = self.term_columns.get(term)
+                if column is not None:
+                    rows.append(row)
+                    columns.append(column)
+        counts = sparse.csr_matrix((np.ones(len(rows)), (rows, columns)),
+                                   shape=(len(queries), len(self.term_columns)))
+        counts.sum_duplicates()
+        return counts
+
+    def score_bm25(self, queries):
+        """
+        Score every document for a batch of queries with BM25. A term repeated
+        in a query counts once per occurrence, as in SearchEngine.search_bm25.
+
+        Args:
+            queries (list): The query strings
+
+        Returns:
+            scipy.sparse.csr_matrix: (queries x documents) scores; columns follow self.doc_ids
+        """
+        return (self._query_term_counts(queries) @ self.bm25_matrix.T).tocsr()
+
+    def score_vsm(self, queries):
+        """
+        Score every document for a batch of queries with TF-IDF cosine similarity.
+
+        Args:
+            queries (list): The query strings
+
+        Returns:
+            scipy.sparse.csr_matrix: (queries x documents) scores; columns follow self.doc_ids
+        """
+        query_weights = self._query_term_counts(queries)
+        query_weights.data = (1 + np.log(query_weights.data)) * self.vsm_idfs[query_weights.indices]
+        query_norms = np.sqrt(np.asarray(query_weights.multiply(query_weights).sum(axis=1)).ravel())
+
+        scores = (query_weights @ self.tfidf_matrix.T).tocsr()
+        # Divide each entry by its query norm and document norm
+        query_rows = np.repeat(np.arange(scores.shape[0]), np.diff(scores.indptr))
+        denominators = query_norms[query_rows] * self.doc_norms[scores.indices]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores.data = np.where(denominators > 0, scores.data / denominators, 0.0)
+        scores.eliminate_zeros()
+        return scores
+
+    def _top_k_rows(self, scores, top_k, pad_with_zeros=False):
+        """Top-k (doc_id, score) lists per row, ties broken by ascending doc_id."""
+        all_results = []
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            row_scores = scores.data[start:end]
+            row_doc_ids = self.doc_ids[scores.indices[start:end]]
+            if top_k < len(row_scores):
+                # Keep everything tied with the k-th score so ties resolve by doc_id
+                threshold = np.partition(row_scores, len(row_scores) - top_k)[len(row_scores) - top_k]
+                keep = row_scores >= threshold
+                row_scores, row_doc_ids = row_scores[keep], row_doc_ids[keep]
+            order = np.lexsort((row_doc_ids, -row_scores))[:top_k]
+            results = list(zip(row_doc_ids[order].tolist(), row_scores[order].tolist()))
+
+            if pad_with_zeros and len(results) < top_k:
+                # Documents sharing no term with the query score zero (as in search_vsm)
+                matched = set(row_doc_ids.tolist())
+                for doc_id in self.doc_ids.tolist():
+                    if len(results) >= top_k:
+                        break
+                    if doc_id not in matched:
+                        results.append((doc_id, 0.0))
+            all_results.append(results)
+        return all_results
+
+    def search_bm25_batch(self, queries, top_k=100):
+        """
+        Search a batch of queries with BM25.
+
+        Args:
+            queries (list): The query strings
+            top_k (int): Number of top results to return per query
+
+        Returns:
+            list: One list of (doc_id, score) tuples per query, sorted by decreasing score
+        """
+        return self._top_k_rows(self.score_bm25(queries), top_k)
+
+    def search_vsm_batch(self, queries, top_k=100):
+        """
+        Search a batch of queries with the Vector Space Model (TF-IDF).
+
+        Args:
+            queries (list): The query strings
+            top_k (int): Number of top results to return per query
+
+        Returns:
+            list: One list of (doc_id, score) tuples per query, sorted by decreasing score
+        """
+        return self._top_k_rows(self.score_vsm(queries), top_k, pad_with_zeros=True)
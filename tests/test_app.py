@@ -0,0 +1,277 @@
+# tests/test_app.py
+#
+# The JSON API of app.py (parameter validation, paging) and the hot reload
+# of a rebuilt index, served from small synthetic indexes through the Flask
+# test client.
+#
+# Usage:
+#   python -m pytest -q tests
+
+import contextlib
+import io
+import os
+import time
+import sys
+
+import pytest
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+from indexer import Indexer
+from mmap_index import MAGIC
+from preprocessor import Preprocessor
+from query_cache import QueryResultCache
+from synthetic_corpus import generate_items, generate_queries
+
+NUM_DOCS = 1500 # More matches than API_MAX_RESULTS for common terms
+VOCABULARY = 50
+
+
+@pytest.fixture(scope='module')
+def app_module():
+    # app.py loads the index in image_index_data (relative to the working
+    # directory) when it is imported
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(REPO_DIR)
+        with contextlib.redirect_stdout(io.StringIO()):
+            import app
+    return app
+
+
+def save_index(index_dir, seed):
+    """Build and save a synthetic index; returns (index file, ID map file)."""
+    import image_search_app
+    index_file = str(index_dir / 'index.bin')
+    map_file = str(index_dir / 'doc_id_map.json')
+    indexer = Indexer(Preprocessor())
+    doc_id_map = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for doc_id, item in enumerate(generate_items(NUM_DOCS, VOCABULARY, seed=seed)):
+            image_search_app.index_metadata_item(indexer, doc_id_map, doc_id, item)
+        indexer.finalize_index()
+        assert image_search_app.save_index_data(indexer, doc_id_map, index_file, map_file)
+    return index_file, map_file
+
+
+@pytest.fixture(scope='module')
+def index_files(tmp_path_factory):
+    return save_index(tmp_path_factory.mktemp('index'), seed=13)
+
+
+def serve_index(app_module, monkeypatch, index_file, map_file):
+    """Serve the given index files, with an empty query cache and no reload thread."""
+    monkeypatch.setattr(app_module, 'INDEX_FILE', index_file)
+    monkeypatch.setattr(app_module, 'INDEX_COMPONENTS_FILE', index_file + '.pkl')
+    monkeypatch.setattr(app_module, 'DOC_ID_MAP_FILE', map_file)
+    monkeypatch.setattr(app_module, 'INDEX_RELOAD_INTERVAL_SECONDS', 0)
+    monkeypatch.setattr(app_module, 'query_cache', QueryResultCache(max_entries=100, ttl_seconds=300))
+    with contextlib.redirect_stdout(io.StringIO()):
+        monkeypatch.setattr(app_module, 'current_index', app_module.load_current_index())
+    assert app_module.current_index is not None
+    return app_module
+
+
+@pytest.fixture
+def app_module_serving(app_module, index_files, monkeypatch):
+    return serve_index(app_module, monkeypatch, *index_files)
+
+
+@pytest.fixture
+def client(app_module_serving):
+    return app_module_serving.app.test_client()
+
+
+@pytest.fixture(scope='module')
+def query():
+    return generate_queries(1, VOCABULARY, seed=13)[0]
+
+
+def api_search(client, **params):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return client.get('/api/search', query_string=params)
+
+
+def api_search_batch(client, body):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return client.post('/api/search/batch', json=body)
+
+
+def test_search_defaults(client, app_module_serving, query):
+    response = api_search(client, query=query)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['model'], body['page'], body['per_page']) == ('bm25', 1, app_module_serving.API_DEFAULT_PER_PAGE)
+    expected = app_module_serving.current_index.search_engine.search_bm25(query, top_k=body['per_page'])
+    assert [[result['doc_id'], result['score']] for result in body['results']] == [list(pair) for pair in expected]
+    assert [result['rank'] for result in body['results']] == list(range(1, body['per_page'] + 1))
+    assert body['has_more']
+
+
+@pytest.mark.parametrize('model', ['vsm', 'bm25', 'lm_dirichlet'])
+def test_pages_follow_on(client, app_module_serving, query, model):
+    first = api_search(client, query=query, model=model, per_page=10).get_json()
+    second = api_search(client, query=query, model=model, page=2, per_page=5).get_json()
+    assert second['results'] == first['results'][5:]
+    assert [result['rank'] for result in second['results']] == list(range(6, 11))
+
+
+def test_last_page(client, app_module_serving):
+    # A query matching fewer documents than the page size
+    search_engine = app_module_serving.current_index.search_engine
+    rare = next(term for term, postings in search_engine.indexer.inverted_index.items()
+                if 1 <= len(postings) < 5 and search_engine.preprocessor.preprocess(term) == [term])
+    body = api_search(client, query=rare, per_page=5).get_json()
+    assert 1 <= len(body['results']) < 5 and not body['has_more']
+    assert api_search(client, query=rare, page=2, per_page=5).get_json()['results'] == []
+
+
+def test_deepest_page(client, app_module_serving, query):
+    max_results, max_per_page = app_module_serving.API_MAX_RESULTS, app_module_serving.API_MAX_PER_PAGE
+    response = api_search(client, query=query, page=max_results // max_per_page, per_page=max_per_page)
+    assert response.status_code == 200
+    assert response.get_json()['results'][-1]['rank'] == max_results
+    response = api_search(client, query=query, page=max_results // max_per_page + 1, per_page=max_per_page)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('value', ['', '   ', None])
+def test_invalid_query(client, value):
+    response = api_search(client, **({} if value is None else {'query': value}))
+    assert response.status_code == 400
+    assert response.get_json()['error'] == "'query' must be a non-empty string"
+
+
+@pytest.mark.parametrize('params', [
+    {'model': 'pagerank'},
+    {'page': '0'},
+    {'page': '-1'},
+    {'page': '1.9'},
+    {'page': 'true'},
+    {'page': ''},
+    {'per_page': '0'},
+    {'per_page': '101'},
+    {'per_page': 'ten'},
+])
+def test_invalid_query_string(client, query, params):
+    response = api_search(client, query=query, **params)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_query_string_integers(client, query):
+    body = api_search(client, query=query, page='3', per_page='7').get_json()
+    assert (body['page'], body['per_page']) == (3, 7)
+
+
+def test_batch(client, app_module_serving, query):
+    queries = generate_queries(3, VOCABULARY, seed=14)
+    response = api_search_batch(client, {'model': 'vsm', 'queries': [
+        {'query': queries[0]},
+        {'query': queries[1], 'model': 'lm_dirichlet', 'page': 2, 'per_page': 3},
+        {'query': queries[2], 'per_page': 1},
+    ]})
+    assert response.status_code == 200
+    responses = response.get_json()['responses']
+    assert [(body['model'], body['page'], body['per_page']) for body in responses] == \
+        [('vsm', 1, app_module_serving.API_DEFAULT_PER_PAGE), ('lm_dirichlet', 2, 3), ('vsm', 1, 1)]
+    # Same pages as the single-query endpoint
+    single = api_search(client, query=queries[1], model='lm_dirichlet', page=2, per_page=3).get_json()
+    assert responses[1] == single
+
+
+@pytest.mark.parametrize('value', [1.9, 2.0, True, False, '3', None, [1], {'page': 1}])
+@pytest.mark.parametrize('name', ['page', 'per_page'])
+def test_batch_rejects_non_integer_json(client, query, name, value):
+    response = api_search_batch(client, {'queries': [{'query': query, name: value}]})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == "'page' and 'per_page' must be integers"
+
+
+@pytest.mark.parametrize('body', [
+    None,
+    [],
+    {'queries': 'cat'},
+    {'queries': ['cat']},
+    {'queries': [{'query': 3}]},
+    {'queries': [{'query': 'cat', 'model': ['bm25']}]},
+    {'queries': [{'query': 'cat', 'page': 0}]},
+    {'queries': [{'query': 'cat', 'page': 11, 'per_page': 100}]},
+])
+def test_invalid_batch(client, body):
+    response = api_search_batch(client, body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_batch_size_limit(client, app_module_serving, query):
+    limit = app_module_serving.API_MAX_BATCH_QUERIES
+    assert api_search_batch(client, {'queries': [{'query': query}] * limit}).status_code == 200
+    assert api_search_batch(client, {'queries': [{'query': query}] * (limit + 1)}).status_code == 400
+
+
+def replace_index(index_file, map_file, new_dir, seed):
+    """Rebuild the index elsewhere and move it over the served files, as a rebuild would."""
+    new_dir.mkdir()
+    new_index_file, new_map_file = save_index(new_dir, seed)
+    time.sleep(0.01) # A distinct modification time even on coarse clocks
+    os.replace(new_index_file, index_file)
+    os.replace(new_map_file, map_file)
+
+
+def test_hot_reload_switches_index_and_cache(app_module, tmp_path, monkeypatch, query):
+    index_file, map_file = save_index(tmp_path, seed=13)
+    app_module = serve_index(app_module, monkeypatch, index_file, map_file)
+    client = app_module.app.test_client()
+    old = app_module.current_index
+    old_results = old.search_engine.search_bm25(query, top_k=5)
+
+    first = api_search(client, query=query, per_page=5).get_json()
+    assert [[result['doc_id'], result['score']] for result in first['results']] == [list(pair) for pair in old_results]
+    assert api_search(client, query=query, per_page=5).get_json() == first
+    assert app_module.query_cache.stats()['hits'] == 1
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert not app_module.reload_index_if_changed() # Nothing changed on disk
+    assert app_module.current_index is old
+
+    replace_index(index_file, map_file, tmp_path / 'rebuilt', seed=21)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert app_module.reload_index_if_changed()
+    new = app_module.current_index
+    assert new.generation > old.generation and new.version != old.version
+    new_results = new.search_engine.search_bm25(query, top_k=5)
+    assert new_results != old_results
+
+    stats = app_module.query_cache.stats()
+    second = api_search(client, query=query, per_page=5).get_json()
+    assert [[result['doc_id'], result['score']] for result in second['results']] == [list(pair) for pair in new_results]
+    after = app_module.query_cache.stats()
+    assert (after['hits'], after['misses'], after['invalidations']) == \
+        (stats['hits'], stats['misses'] + 1, stats['invalidations'] + 1)
+    assert api_search(client, query=query, per_page=5).get_json() == second
+    assert app_module.query_cache.stats()['hits'] == after['hits'] + 1
+
+    # A request still running on the old index gets its own results, without
+    # reading or replacing the new index's cache entries
+    with contextlib.redirect_stdout(io.StringIO()):
+        in_flight = app_module.run_api_queries([(query, 'bm25', 1, 5)], old)[0]
+    assert in_flight[:5] == old_results
+    assert app_module.query_cache.stats()['stale'] > 0
+    hits = app_module.query_cache.stats()['hits']
+    assert api_search(client, query=query, per_page=5).get_json() == second
+    assert app_module.query_cache.stats()['hits'] == hits + 1
+
+
+def test_failed_reload_keeps_serving_the_current_index(app_module, tmp_path, monkeypatch, query):
+    index_file, map_file = save_index(tmp_path, seed=13)
+    app_module = serve_index(app_module, monkeypatch, index_file, map_file)
+    current = app_module.current_index
+    with open(index_file, 'r+b') as f:
+        f.seek(len(MAGIC)) # Format version
+        f.write((0).to_bytes(4, 'little'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert not app_module.reload_index_if_changed()
+    assert app_module.current_index is current
+    response = api_search(app_module.app.test_client(), query=query)
+    assert response.status_code == 200 and response.get_json()['results']
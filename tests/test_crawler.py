@@ -0,0 +1,219 @@
+# tests/test_crawler.py
+#
+# crawler.py against benchmarks/fake_wiki.py served on an ephemeral port:
+# concurrent crawls, robots.txt, per-host rate limits, checkpoints and
+# --resume, and the output bookkeeping of --recrawl. Crawls run crawler.py in a subprocess (its crawl
+# state is module-global), with a fixed hash seed so the crawl order is
+# reproducible.
+#
+# Usage:
+#   python -m pytest -q tests
+
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import crawler
+from fake_wiki import FakeWiki, start_server
+
+CRAWLER = os.path.join(REPO_DIR, 'crawler.py')
+CRAWL_TIMEOUT_SECONDS = 120
+
+PAGE = 'http://127.0.0.1/wiki/'
+IMAGE = 'https://static.wikia.nocookie.net/rickandmorty/images/'
+
+
+def image_record(page, image):
+    return {'image_url': IMAGE + image, 'source_page': PAGE + page, 'alt_text': '', 'context': page}
+
+
+def read_records(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def serve(num_articles=400, **kwargs):
+    """
+    Start a fake wiki that records the time and path of every request.
+
+    Returns:
+        tuple: (server, base URL, list of (time.monotonic(), path))
+    """
+    server = start_server(FakeWiki(num_articles), **kwargs)
+    requests_seen = []
+    lock = threading.Lock()
+    handler = server.RequestHandlerClass
+    do_get = handler.do_GET
+
+    def recording_do_get(self):
+        with lock:
+            requests_seen.append((time.monotonic(), self.path))
+        do_get(self)
+
+    handler.do_GET = recording_do_get
+    host, port = server.server_address
+    return server, f"http://{host}:{port}", requests_seen
+
+
+def crawl_command(base_url, save_dir, *args):
+    # No politeness delays unless the test asks for them (later options win)
+    return [sys.executable, CRAWLER, '--base-url', base_url, '--save-dir', str(save_dir),
+            '--rate', '1000', '--burst', '100', *args]
+
+
+def run_crawler(base_url, save_dir, *args):
+    env = dict(os.environ, PYTHONHASHSEED='0')
+    result = subprocess.run(crawl_command(base_url, save_dir, *args), capture_output=True, text=True,
+                            env=env, timeout=CRAWL_TIMEOUT_SECONDS)
+    assert result.returncode == 0, result.stdout[-2000:] + result.stderr[-2000:]
+    return result.stdout
+
+
+def test_concurrent_crawl_writes_unique_images_and_obeys_robots_txt(tmp_path):
+    disallow = ('/wiki/Special:', '/wiki/Category:Locations', '/wiki/B')
+    server, base_url, requests_seen = serve(disallow=disallow)
+    try:
+        run_crawler(base_url, tmp_path, '--workers', '8', '--target', '60')
+    finally:
+        server.shutdown()
+
+    records = read_records(tmp_path / crawler.METADATA_FILE_NAME)
+    image_urls = [record['image_url'] for record in records]
+    assert len(image_urls) == 60
+    assert len(set(image_urls)) == len(image_urls)
+    paths = [path for _, path in requests_seen]
+    assert paths.count('/robots.txt') == 1
+    assert len(set(paths)) == len(paths) # No page is fetched twice
+    assert not [path for path in paths if path.startswith(disallow)]
+    assert not [record for record in records if record['source_page'].startswith(tuple(base_url + path for path in disallow))]
+
+
+def test_concurrent_crawl_keeps_to_the_host_rate(tmp_path):
+    rate, burst = 25, 2
+    server, base_url, requests_seen = serve()
+    try:
+        run_crawler(base_url, tmp_path, '--workers', '8', '--rate', str(rate), '--burst', str(burst), '--target', '30')
+    finally:
+        server.shutdown()
+
+    times = sorted(t for t, _ in requests_seen)
+    assert len(times) > 30
+    # A token bucket lets at most burst + rate * T requests start in any T seconds
+    # (with some slack for when the server sees them)
+    for i in range(len(times)):
+        for j in range(i + burst, len(times), 5):
+            assert j - i + 1 <= burst + rate * (times[j] - times[i]) + 1, (i, j, times[j] - times[i])
+
+
+def interrupt_after_checkpoint(base_url, save_dir, min_images, *args):
+    """Run crawler.py until its checkpoint has min_images images, then kill it (no chance to clean up)."""
+    env = dict(os.environ, PYTHONHASHSEED='0')
+    process = subprocess.Popen(crawl_command(base_url, save_dir, '--checkpoint-interval', '0.1', *args),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+    checkpoint_path = os.path.join(save_dir, crawler.CHECKPOINT_FILE_NAME)
+    deadline = time.monotonic() + CRAWL_TIMEOUT_SECONDS
+    try:
+        while time.monotonic() < deadline and process.poll() is None:
+            try:
+                with open(checkpoint_path, 'r', encoding='utf-8') as f:
+                    checkpoint = json.load(f)
+            except (OSError, ValueError):
+                checkpoint = None
+            if checkpoint and checkpoint['images_collected'] >= min_images:
+                break
+            time.sleep(0.02)
+        assert process.poll() is None, "The crawl finished before it could be interrupted"
+    finally:
+        process.kill()
+        process.wait()
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_resumed_sequential_crawl_matches_an_uninterrupted_one(tmp_path):
+    server, base_url, _ = serve()
+    try:
+        run_crawler(base_url, tmp_path / 'full', '--target', '50')
+        interrupt_after_checkpoint(base_url, tmp_path / 'resumed', 15, '--target', '50')
+        run_crawler(base_url, tmp_path / 'resumed', '--target', '50', '--resume')
+    finally:
+        server.shutdown()
+
+    full = read_records(tmp_path / 'full' / crawler.METADATA_FILE_NAME)
+    resumed = read_records(tmp_path / 'resumed' / crawler.METADATA_FILE_NAME)
+    assert len(full) == 50
+    assert resumed == full # Same images, in the same order: nothing repeated or skipped
+
+
+def test_resumed_concurrent_crawl_loses_no_queued_page(tmp_path):
+    server, base_url, requests_seen = serve(latency_seconds=0.01)
+    try:
+        checkpoint = interrupt_after_checkpoint(base_url, tmp_path, 20, '--workers', '4', '--target', '80')
+        fetched_before = {base_url + path for _, path in requests_seen if path != '/robots.txt'}
+        del requests_seen[:]
+        run_crawler(base_url, tmp_path, '--workers', '4', '--target', '80', '--resume')
+    finally:
+        server.shutdown()
+
+    image_urls = [record['image_url'] for record in read_records(tmp_path / crawler.METADATA_FILE_NAME)]
+    assert len(image_urls) == 80
+    assert len(set(image_urls)) == len(image_urls)
+    # Every page queued at the checkpoint, or fetched (in flight) before the crawl
+    # was killed, was done before the checkpoint, fetched after resuming, or is still queued
+    with open(tmp_path / crawler.CHECKPOINT_FILE_NAME, 'r', encoding='utf-8') as f:
+        final = json.load(f)
+    fetched = {base_url + path for _, path in requests_seen}
+    accounted_for = set(checkpoint['visited_urls']) | fetched | set(final['urls_to_crawl'])
+    assert [url for url in checkpoint['urls_to_crawl'] if url not in accounted_for] == []
+    assert [url for url in fetched_before if url not in accounted_for] == []
+    assert not set(checkpoint['visited_urls']) & fetched # Pages done before the checkpoint are not fetched again
+
+
+def test_host_rate_limiter_throttles_hosts_independently():
+    limiter = crawler.HostRateLimiter(rate=5, burst=1)
+    assert limiter.wait('http://a.example/wiki/A') == 0
+    assert limiter.wait('http://b.example/wiki/B') == 0 # Another host: its own bucket
+    start = time.monotonic()
+    limiter.wait('http://a.example/wiki/C')
+    assert time.monotonic() - start >= 0.15
+
+
+def test_recrawl_skips_images_already_in_the_output(tmp_path, monkeypatch):
+    # A's image is in the output; B, C and D are new pages, B with A's image and C and D with the same new one
+    results = {
+        PAGE + 'A': ('unchanged', []),
+        PAGE + 'B': ('new', [image_record('B', 'a.png')]),
+        PAGE + 'C': ('new', [image_record('C', 'c.png')]),
+        PAGE + 'D': ('new', [image_record('D', 'c.png')]),
+    }
+    monkeypatch.setattr(crawler, 'SAVE_DIR', str(tmp_path))
+    monkeypatch.setattr(crawler, 'TARGET_IMAGE_COUNT', 100)
+    monkeypatch.setattr(crawler, 'page_validators', {PAGE + 'A': ['"a"', None, 'hash', IMAGE + 'a.png']})
+    monkeypatch.setattr(crawler, 'urls_to_crawl', deque([PAGE + 'B', PAGE + 'C', PAGE + 'D']))
+
+    def refetch_and_parse(url):
+        status, images = results[url]
+        if status == 'new':
+            crawler.page_validators[url] = [None, None, 'hash', None]
+        return url, status, images, []
+
+    monkeypatch.setattr(crawler, 'refetch_and_parse', refetch_and_parse)
+    with contextlib.redirect_stdout(io.StringIO()):
+        counts = crawler.recrawl(max_workers=2)
+
+    assert counts['new'] == 3 and counts['unchanged'] == 1
+    updates = read_records(tmp_path / crawler.UPDATES_FILE_NAME)
+    assert [record['image_url'] for record in updates] == [IMAGE + 'c.png']
+    assert updates[0]['source_page'] in (PAGE + 'C', PAGE + 'D')
+    assert crawler.page_validators[PAGE + 'B'][3] is None
+    assert crawler.page_validators[updates[0]['source_page']][3] == IMAGE + 'c.png'
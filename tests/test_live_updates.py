@@ -0,0 +1,88 @@
+# tests/test_live_updates.py
+#
+# Adding, deleting and updating documents in a finalized index (in memory
+# and memory-mapped) must give the BM25 and language model results of an
+# index rebuilt from the final documents.
+#
+# Usage:
+#   python -m pytest -q tests
+
+import os
+import sys
+from collections import Counter
+
+import pytest
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+from indexer import Indexer
+from mmap_index import load_mmap_index, save_mmap_index
+from preprocessor import Preprocessor
+from search import SearchEngine
+from synthetic_corpus import generate_items, generate_queries
+
+NUM_DOCS = 300
+VOCABULARY = 400
+
+
+def build_index(preprocessor, texts):
+    indexer = Indexer(preprocessor)
+    for doc_id, text in texts.items():
+        indexer.add_document(doc_id, text)
+    indexer.finalize_index()
+    return indexer
+
+
+@pytest.fixture(scope='module')
+def preprocessor():
+    return Preprocessor()
+
+
+@pytest.fixture(scope='module')
+def texts():
+    return {doc_id: item['context'] for doc_id, item in enumerate(generate_items(NUM_DOCS, VOCABULARY, seed=3))}
+
+
+@pytest.fixture(params=['memory', 'mmap'])
+def finalized(request, preprocessor, texts, tmp_path):
+    indexer = build_index(preprocessor, texts)
+    if request.param == 'mmap':
+        index_file = str(tmp_path / 'index.bin')
+        save_mmap_index(indexer, index_file)
+        indexer = load_mmap_index(index_file, preprocessor)
+    indexer.compaction_threshold = float('inf') # Keep the updates live
+    return indexer
+
+
+def test_document_terms_of_base_documents(finalized, preprocessor, texts):
+    finalized.delete_document(NUM_DOCS - 1) # Wraps the postings for live updates
+    for doc_id in (0, 1, 150, NUM_DOCS - 2):
+        assert finalized.inverted_index.document_terms(doc_id) == Counter(preprocessor.preprocess(texts[doc_id]))
+    assert finalized.inverted_index.document_terms(NUM_DOCS - 1) == {}
+    assert finalized.inverted_index.document_terms(NUM_DOCS + 5) == {}
+
+
+def test_updates_match_a_rebuilt_index(finalized, preprocessor, texts):
+    new_texts = dict(texts)
+    extra = [item['context'] for item in generate_items(20, VOCABULARY, seed=4)]
+    for doc_id in (0, 7, 42, 199):
+        assert finalized.delete_document(doc_id)
+        del new_texts[doc_id]
+    for i, doc_id in enumerate((3, 100, 250)):
+        finalized.update_document(doc_id, extra[i])
+        new_texts[doc_id] = extra[i]
+    for i, doc_id in enumerate(range(NUM_DOCS, NUM_DOCS + 5)):
+        finalized.add_live_document(doc_id, preprocessor.preprocess(extra[10 + i]))
+        new_texts[doc_id] = extra[10 + i]
+    assert finalized.pending_updates() > 0
+
+    live = SearchEngine(finalized, preprocessor)
+    rebuilt = SearchEngine(build_index(preprocessor, new_texts), preprocessor)
+    for query in generate_queries(40, VOCABULARY, seed=3):
+        for search in ('search_bm25', 'search_lm_dirichlet'):
+            got = getattr(live, search)(query, top_k=10)
+            expected = getattr(rebuilt, search)(query, top_k=10)
+            assert [doc_id for doc_id, _ in got] == [doc_id for doc_id, _ in expected], (search, query)
+            assert [score for _, score in got] == pytest.approx([score for _, score in expected])
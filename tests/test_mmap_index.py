@@ -0,0 +1,105 @@
+# tests/test_mmap_index.py
+#
+# An index saved with save_mmap_index and opened with load_mmap_index must
+# hold the same statistics and give the same search results as the index it
+# was saved from, and files of another format version must be refused.
+#
+# Usage:
+#   python -m pytest -q tests
+
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+from indexer import Indexer
+from mmap_index import FORMAT_VERSION, HEADER, MAGIC, is_mmap_index_file, load_mmap_index, save_mmap_index
+from preprocessor import Preprocessor
+from search import SearchEngine
+from synthetic_corpus import generate_items, generate_queries
+
+NUM_DOCS = 200
+VOCABULARY = 300
+VERSION_OFFSET = len(MAGIC) # The version follows the magic in the header
+
+
+@pytest.fixture(scope='module')
+def preprocessor():
+    return Preprocessor()
+
+
+def build_index(preprocessor, precompute_vsm_weights):
+    indexer = Indexer(preprocessor, precompute_vsm_weights=precompute_vsm_weights)
+    for doc_id, item in enumerate(generate_items(NUM_DOCS, VOCABULARY, seed=7)):
+        indexer.add_document(doc_id, item['context'])
+    indexer.finalize_index()
+    return indexer
+
+
+@pytest.fixture
+def index_file(preprocessor, tmp_path):
+    path = str(tmp_path / 'index.bin')
+    save_mmap_index(build_index(preprocessor, True), path)
+    return path
+
+
+@pytest.mark.parametrize('precompute_vsm_weights', [True, False])
+def test_round_trip(preprocessor, tmp_path, precompute_vsm_weights):
+    original = build_index(preprocessor, precompute_vsm_weights)
+    path = str(tmp_path / 'index.bin')
+    save_mmap_index(original, path)
+    assert is_mmap_index_file(path)
+    loaded = load_mmap_index(path, preprocessor)
+
+    assert loaded.precompute_vsm_weights == precompute_vsm_weights
+    assert (loaded.doc_count, loaded.total_terms, loaded.avg_doc_length) == \
+        (original.doc_count, original.total_terms, original.avg_doc_length)
+    assert loaded.bm25_bound_params == original.bm25_bound_params
+    assert list(loaded.inverted_index) == sorted(original.inverted_index) # Stored sorted
+    assert loaded.inverted_index.to_dict() == original.inverted_index.to_dict()
+    assert dict(loaded.document_lengths.items()) == dict(original.document_lengths.items())
+    assert dict(loaded.document_norms.items()) == dict(original.document_norms.items())
+    assert list(loaded.docs_by_length) == list(original.docs_by_length)
+    for term in original.inverted_index:
+        assert loaded.vsm_idfs[term] == original.vsm_idfs[term]
+        assert loaded.collection_frequencies[term] == original.collection_frequencies[term]
+        assert loaded.bm25_upper_bounds[term] == original.bm25_upper_bounds[term]
+        assert dict(loaded.get_weights_for_term(term).items()) == dict(original.get_weights_for_term(term).items())
+
+    expected, got = SearchEngine(original, preprocessor), SearchEngine(loaded, preprocessor)
+    for query in generate_queries(20, VOCABULARY, seed=7):
+        assert got.search_vsm(query, top_k=10) == expected.search_vsm(query, top_k=10)
+        assert got.search_bm25(query, top_k=10, pruning=True) == expected.search_bm25(query, top_k=10, pruning=True)
+        assert got.search_lm_dirichlet(query, top_k=10) == expected.search_lm_dirichlet(query, top_k=10)
+
+
+def test_empty_index_round_trip(preprocessor, tmp_path):
+    path = str(tmp_path / 'index.bin')
+    indexer = Indexer(preprocessor)
+    indexer.finalize_index()
+    save_mmap_index(indexer, path)
+    loaded = load_mmap_index(path, preprocessor)
+    assert loaded.doc_count == 0
+    assert SearchEngine(loaded, preprocessor).search_bm25('anything') == []
+
+
+@pytest.mark.parametrize('version', [FORMAT_VERSION - 1, FORMAT_VERSION + 1])
+def test_other_format_version_is_refused(preprocessor, index_file, version):
+    with open(index_file, 'r+b') as f:
+        f.seek(VERSION_OFFSET)
+        f.write(version.to_bytes(4, 'little'))
+    with pytest.raises(ValueError, match='format version'):
+        load_mmap_index(index_file, preprocessor)
+
+
+def test_other_file_is_refused(preprocessor, tmp_path):
+    path = str(tmp_path / 'index_components.pkl')
+    with open(path, 'wb') as f:
+        f.write(b'\x80\x04' + b'\x00' * HEADER.size)
+    assert not is_mmap_index_file(path)
+    with pytest.raises(ValueError, match='not a binary index'):
+        load_mmap_index(path, preprocessor)
@@ -0,0 +1,80 @@
+# tests/test_parallel_build.py
+#
+# image_search_app.build_index_from_json with worker processes must build
+# exactly the index and doc_id mapping of a single-process build, from both
+# metadata file formats.
+#
+# Usage:
+#   python -m pytest -q tests
+
+import contextlib
+import io
+import json
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+import image_search_app
+from search import SearchEngine
+from synthetic_corpus import generate_items, generate_queries
+
+NUM_DOCS = 500
+VOCABULARY = 400
+SHARD_SIZE = 37 # Several shards per worker, the last one partial
+
+
+def metadata_items():
+    items = list(generate_items(NUM_DOCS, VOCABULARY, seed=9))
+    # Skipped items keep their doc_id slot in both builds
+    items[5]['context'] = ''
+    items[SHARD_SIZE]['image_url'] = None
+    return items
+
+
+@pytest.fixture(params=['json', 'jsonl'])
+def metadata_file(request, tmp_path):
+    path = str(tmp_path / f'metadata.{request.param}')
+    with open(path, 'w', encoding='utf-8') as f:
+        if request.param == 'json':
+            json.dump(metadata_items(), f)
+        else:
+            for item in metadata_items():
+                f.write(json.dumps(item) + '\n')
+    return path
+
+
+def build(metadata_file, workers):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return image_search_app.build_index_from_json(metadata_file, workers=workers)
+
+
+def test_parallel_build_matches_serial_build(metadata_file, monkeypatch):
+    monkeypatch.setattr(image_search_app, 'INDEX_SHARD_SIZE', SHARD_SIZE)
+    serial, serial_map = build(metadata_file, 1)
+    parallel, parallel_map = build(metadata_file, 3)
+
+    assert parallel_map == serial_map
+    assert len(serial_map) == NUM_DOCS - 2 and 5 not in serial_map and SHARD_SIZE not in serial_map
+    assert (parallel.doc_count, parallel.total_terms, parallel.avg_doc_length) == \
+        (serial.doc_count, serial.total_terms, serial.avg_doc_length)
+    assert list(parallel.inverted_index) == list(serial.inverted_index)
+    assert parallel.inverted_index.to_dict() == serial.inverted_index.to_dict()
+    assert dict(parallel.document_lengths.items()) == dict(serial.document_lengths.items())
+    assert dict(parallel.document_norms.items()) == dict(serial.document_norms.items())
+    assert list(parallel.docs_by_length) == list(serial.docs_by_length)
+
+    expected = SearchEngine(serial, serial.preprocessor)
+    got = SearchEngine(parallel, parallel.preprocessor)
+    for query in generate_queries(20, VOCABULARY, seed=9):
+        assert got.search_vsm(query, top_k=10) == expected.search_vsm(query, top_k=10)
+        assert got.search_bm25(query, top_k=10) == expected.search_bm25(query, top_k=10)
+        assert got.search_lm_dirichlet(query, top_k=10) == expected.search_lm_dirichlet(query, top_k=10)
+
+
+def test_missing_metadata_file(tmp_path):
+    assert build(str(tmp_path / 'missing.jsonl'), 2) == (None, None)
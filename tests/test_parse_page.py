@@ -0,0 +1,87 @@
+# tests/test_parse_page.py
+#
+# The two backends of crawler.parse_page ('fast': page_extractor, 'soup': a
+# full BeautifulSoup tree) must give identical results, and both must match
+# the golden file recorded from the soup backend for the saved pages in
+# benchmarks/pages (see benchmarks/bench_parse.py --write-golden).
+#
+# Usage:
+#   python -m pytest -q tests
+
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_DIR)
+
+import crawler
+
+PAGES_DIR = os.path.join(REPO_DIR, 'benchmarks', 'pages')
+GOLDEN_FILE_NAME = 'golden.json'
+SAVED_PAGES = sorted(os.path.basename(path) for path in glob.glob(os.path.join(PAGES_DIR, '*.html')))
+
+
+@pytest.fixture(scope='module')
+def golden():
+    with open(os.path.join(PAGES_DIR, GOLDEN_FILE_NAME), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture(autouse=True)
+def restore_backend():
+    backend = crawler.PARSER_BACKEND
+    yield
+    crawler.PARSER_BACKEND = backend
+
+
+def parse_saved_page(name, backend):
+    """parse_page on a saved page with the given backend, without its progress output."""
+    with open(os.path.join(PAGES_DIR, name), 'r', encoding='utf-8') as f:
+        html_content = f.read()
+    crawler.PARSER_BACKEND = backend
+    with contextlib.redirect_stdout(io.StringIO()):
+        return crawler.parse_page(html_content, f"{crawler.BASE_URL}/wiki/{name[:-len('.html')]}")
+
+
+def test_saved_pages_exist():
+    assert {'episode_no_infobox.html', 'character_gallery.html', 'location_nested_tables.html'} <= set(SAVED_PAGES)
+
+
+@pytest.mark.parametrize('name', SAVED_PAGES)
+def test_backends_agree(name):
+    assert parse_saved_page(name, 'fast') == parse_saved_page(name, 'soup')
+
+
+@pytest.mark.parametrize('backend', ['fast', 'soup'])
+@pytest.mark.parametrize('name', SAVED_PAGES)
+def test_matches_golden(golden, name, backend):
+    images, links = parse_saved_page(name, backend)
+    # Links are stored sorted: parse_page returns them from a set
+    assert {'images_found': images, 'links_to_follow': sorted(links)} == golden[name]
+
+
+def test_page_without_infobox_has_no_image():
+    images, links = parse_saved_page('episode_no_infobox.html', 'fast')
+    assert images == []
+    assert f"{crawler.BASE_URL}/wiki/Ball_Fondlers" in links
+
+
+def test_gallery_page_uses_first_infobox_figure():
+    images, _ = parse_saved_page('character_gallery.html', 'fast')
+    assert [image['image_url'] for image in images] == [
+        'https://static.wikia.nocookie.net/rickandmorty/images/3/37/Mr._Poopybutthole.png']
+    assert images[0]['context'].startswith('Mr. Poopybutthole Ooo-wee! Season 2 ')
+
+
+def test_paragraphs_inside_nested_tables_are_skipped():
+    images, _ = parse_saved_page('location_nested_tables.html', 'fast')
+    context = images[0]['context']
+    assert 'What is my purpose' not in context
+    assert 'Stray table' not in context
+    assert 'sixth paragraph' not in context
@@ -0,0 +1,174 @@
+# tests/test_search.py
+#
+# The ranking shortcuts of SearchEngine (postings-only scoring, bounded top-k
+# selection) must return exactly what scoring every document and sorting
+# them all would, on a small synthetic corpus.
+#
+# Usage:
+#   python -m pytest -q tests
+
+import math
+import os
+import random
+import sys
+from collections import defaultdict
+
+import pytest
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+from indexer import Indexer
+from preprocessor import Preprocessor
+from search import SearchEngine, select_top_k
+from synthetic_corpus import generate_items, generate_queries
+
+NUM_DOCS = 200
+VOCABULARY = 300
+# Small, mid-sized and larger than the whole collection (zero-score padding)
+TOP_KS = [1, 10, NUM_DOCS + 20]
+
+
+def build_index(preprocessor, texts):
+    indexer = Indexer(preprocessor)
+    for doc_id, text in texts.items():
+        indexer.add_document(doc_id, text)
+    indexer.finalize_index()
+    return indexer
+
+
+def full_ranking(scores, doc_ids, top_k):
+    """Every document ranked by decreasing score then doc_id (missing scores are zero)."""
+    return sorted(((doc_id, scores.get(doc_id, 0.0)) for doc_id in doc_ids), key=lambda x: (-x[1], x[0]))[:top_k]
+
+
+def full_scan_vsm(indexer, preprocessor, query, top_k):
+    """Cosine similarity of the query with every document in the index."""
+    query_terms = preprocessor.preprocess(query)
+    query_vector = {}
+    for term in query_terms:
+        if term in indexer.inverted_index:
+            idf = math.log(indexer.doc_count / indexer.get_doc_count_for_term(term))
+            query_vector[term] = (1 + math.log(query_terms.count(term))) * idf
+    query_norm = math.sqrt(sum(w**2 for w in query_vector.values()))
+    dot_products = defaultdict(float)
+    for term, weight in query_vector.items():
+        for doc_id, doc_weight in indexer.get_weights_for_term(term).items():
+            dot_products[doc_id] += weight * doc_weight
+    scores = {}
+    for doc_id in indexer.document_lengths:
+        doc_norm = indexer.document_norms[doc_id]
+        if query_norm > 0 and doc_norm > 0 and dot_products[doc_id] > 0:
+            scores[doc_id] = dot_products[doc_id] / (query_norm * doc_norm)
+    return full_ranking(scores, list(indexer.document_lengths), top_k)
+
+
+def full_scan_lm_dirichlet(indexer, preprocessor, query, top_k, mu):
+    """Dirichlet-smoothed query likelihood of every document in the index."""
+    query_terms = preprocessor.preprocess(query)
+    if not indexer.total_terms:
+        return []
+    scores = {}
+    for doc_id in indexer.document_lengths:
+        doc_length = indexer.document_lengths[doc_id]
+        score = 0.0
+        for term in query_terms:
+            tf = indexer.get_docs_for_term(term).get(doc_id, 0)
+            collection_prob = (indexer.get_collection_frequency(term) or 1) / indexer.total_terms
+            p_term_given_doc = (tf + mu * collection_prob) / (doc_length + mu)
+            score += math.log(p_term_given_doc) if p_term_given_doc > 0 else -100
+        scores[doc_id] = score
+    return full_ranking(scores, list(indexer.document_lengths), top_k)
+
+
+@pytest.fixture(scope='module')
+def preprocessor():
+    return Preprocessor()
+
+
+@pytest.fixture(scope='module')
+def texts():
+    return {doc_id: item['context'] for doc_id, item in enumerate(generate_items(NUM_DOCS, VOCABULARY, seed=5))}
+
+
+@pytest.fixture(scope='module')
+def queries():
+    # Synthetic queries plus ones matching no document or only a few
+    return generate_queries(30, VOCABULARY, seed=5) + ['zzzunknownterm', '']
+
+
+@pytest.fixture
+def finalized(preprocessor, texts):
+    return build_index(preprocessor, texts)
+
+
+@pytest.fixture
+def live_updated(finalized, preprocessor):
+    """A finalized index whose documents are no longer in doc_id order."""
+    finalized.compaction_threshold = float('inf') # Keep the updates live
+    extra = [item['context'] for item in generate_items(10, VOCABULARY, seed=6)]
+    for doc_id in (0, 1, 2, 50):
+        finalized.delete_document(doc_id)
+    finalized.add_live_document(1, preprocessor.preprocess(extra[0])) # Back, at the end of the dict
+    finalized.add_live_document(NUM_DOCS + 3, preprocessor.preprocess(extra[1]))
+    finalized.add_live_document(NUM_DOCS + 1, preprocessor.preprocess(extra[2]))
+    finalized.update_document(7, extra[3])
+    return finalized
+
+
+@pytest.mark.parametrize('top_k', TOP_KS)
+@pytest.mark.parametrize('index', ['finalized', 'live_updated'])
+def test_vsm_matches_full_scan(request, index, top_k, preprocessor, queries):
+    indexer = request.getfixturevalue(index)
+    engine = SearchEngine(indexer, preprocessor)
+    for query in queries:
+        assert engine.search_vsm(query, top_k=top_k) == full_scan_vsm(indexer, preprocessor, query, top_k), query
+
+
+@pytest.mark.parametrize('mu', [2000, 50, 0])
+@pytest.mark.parametrize('top_k', TOP_KS)
+@pytest.mark.parametrize('index', ['finalized', 'live_updated'])
+def test_lm_dirichlet_matches_full_scan(request, index, top_k, mu, preprocessor, queries):
+    indexer = request.getfixturevalue(index)
+    engine = SearchEngine(indexer, preprocessor)
+    for query in queries:
+        expected = full_scan_lm_dirichlet(indexer, preprocessor, query, top_k, mu)
+        assert engine.search_lm_dirichlet(query, top_k=top_k, mu=mu) == expected, query
+
+
+@pytest.mark.parametrize('top_k', [0, 1, 5, 99, 100, 101, 500])
+@pytest.mark.parametrize('distinct_scores', [3, 20, 1000])
+def test_select_top_k_matches_full_sort(top_k, distinct_scores):
+    rng = random.Random(top_k * 1000 + distinct_scores)
+    # Few distinct values: many ties at the k-th score, broken by doc_id
+    doc_ids = rng.sample(range(10_000), 100)
+    scores = {doc_id: rng.randrange(distinct_scores) / 7 for doc_id in doc_ids}
+    assert select_top_k(scores, top_k) == sorted(scores.items(), key=lambda x: (-x[1], x[0]))[:top_k]
+
+
+def test_select_top_k_of_no_scores():
+    assert select_top_k({}, 10) == []
+    assert select_top_k({3: 1.0}, -1) == []
+
+
+@pytest.mark.parametrize('top_k', TOP_KS)
+@pytest.mark.parametrize('index', ['finalized', 'live_updated'])
+def test_bm25_wand_matches_exhaustive_bm25(request, index, top_k, preprocessor, queries):
+    indexer = request.getfixturevalue(index)
+    engine = SearchEngine(indexer, preprocessor)
+    skipped = 0
+    for query in queries + ['a', 'the the the']:
+        results, query_skipped = engine.search_bm25_wand(query, top_k=top_k)
+        assert results == engine.search_bm25(query, top_k=top_k), query
+        assert engine.search_bm25(query, top_k=top_k, pruning=True) == results
+        skipped += query_skipped
+    if index == 'finalized' and top_k == 1:
+        assert skipped > 0 # Pruning actually happened
+
+
+def test_bm25_wand_with_other_parameters(finalized, preprocessor, queries):
+    # No precomputed upper bounds for these: exhaustive scoring
+    engine = SearchEngine(finalized, preprocessor)
+    for query in queries:
+        assert engine.search_bm25_wand(query, top_k=10, k1=2.0, b=0.5) == (engine.search_bm25(query, top_k=10, k1=2.0, b=0.5), 0)
@@ -0,0 +1,83 @@
+# tests/test_sparse_search.py
+#
+# The batch BM25 and VSM scores of SparseSearchEngine must agree with
+# SearchEngine up to floating point rounding. Skipped without numpy and scipy
+# (optional dependencies).
+#
+# Usage:
+#   python -m pytest -q tests
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+from indexer import Indexer
+from preprocessor import Preprocessor
+from search import SearchEngine
+from sparse_search import SparseSearchEngine
+from synthetic_corpus import generate_items, generate_queries
+
+NUM_DOCS = 200
+VOCABULARY = 300
+TOLERANCE = 1e-9
+
+
+@pytest.fixture(scope='module')
+def preprocessor():
+    return Preprocessor()
+
+
+@pytest.fixture(scope='module')
+def queries():
+    return generate_queries(30, VOCABULARY, seed=11) + ['zzzunknownterm', '']
+
+
+@pytest.fixture(params=['finalized', 'live_updated'])
+def indexer(request, preprocessor):
+    indexer = Indexer(preprocessor)
+    for doc_id, item in enumerate(generate_items(NUM_DOCS, VOCABULARY, seed=11)):
+        indexer.add_document(doc_id, item['context'])
+    indexer.finalize_index()
+    if request.param == 'live_updated':
+        # SparseSearchEngine compacts these into the index first
+        indexer.compaction_threshold = float('inf')
+        extra = [item['context'] for item in generate_items(3, VOCABULARY, seed=12)]
+        indexer.delete_document(0)
+        indexer.update_document(10, extra[0])
+        indexer.add_live_document(NUM_DOCS + 5, preprocessor.preprocess(extra[1]))
+    return indexer
+
+
+def assert_agrees(got, engine_search, query, top_k):
+    """got is a top_k of the query: its scores are those of the full ranking, doc by doc and rank by rank."""
+    full = engine_search(query, top_k=NUM_DOCS + 10)
+    all_scores = dict(full)
+    assert len(got) == min(top_k, len(full)), query
+    assert [score for _, score in got] == pytest.approx([score for _, score in full[:top_k]], abs=TOLERANCE), query
+    # Rank order can only differ between documents whose scores tie up to rounding
+    assert [all_scores[doc_id] for doc_id, _ in got] == pytest.approx([score for _, score in got], abs=TOLERANCE), query
+    assert len(set(doc_id for doc_id, _ in got)) == len(got)
+
+
+@pytest.mark.parametrize('top_k', [1, 10, NUM_DOCS + 10])
+def test_bm25_batch_agrees_with_search_engine(indexer, preprocessor, queries, top_k):
+    sparse_engine = SparseSearchEngine(indexer, preprocessor)
+    engine = SearchEngine(indexer, preprocessor)
+    for query, got in zip(queries, sparse_engine.search_bm25_batch(queries, top_k=top_k)):
+        assert_agrees(got, engine.search_bm25, query, top_k)
+
+
+@pytest.mark.parametrize('top_k', [1, 10, NUM_DOCS + 10])
+def test_vsm_batch_agrees_with_search_engine(indexer, preprocessor, queries, top_k):
+    sparse_engine = SparseSearchEngine(indexer, preprocessor)
+    engine = SearchEngine(indexer, preprocessor)
+    for query, got in zip(queries, sparse_engine.search_vsm_batch(queries, top_k=top_k)):
+        assert_agrees(got, engine.search_vsm, query, top_k)